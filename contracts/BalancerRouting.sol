@@ -0,0 +1,237 @@
+// SPDX-License-Identifier: AGPL-3.0
+
+pragma solidity 0.6.12;
+pragma experimental ABIEncoderV2;
+
+import { SafeMath } from '@openzeppelin/contracts/math/SafeMath.sol';
+import { IERC20 } from '@openzeppelin/contracts/token/ERC20/IERC20.sol';
+
+import { IBalancerVault } from '../interfaces/IBalancerVault.sol';
+import { IBalancerPool } from '../interfaces/IBalancerPool.sol';
+import { IAsset } from '../interfaces/IAsset.sol';
+import { WeightedMath } from './WeightedMath.sol';
+
+/**
+ * @title Balancer swap routes and proportional exits
+ * note Linked library of Strategy, kept out of it to stay under the EIP-170 contract size limit.
+ * 			Its functions run with delegatecall, in the context of the strategy:
+ * 			address(this) is the strategy, which holds the tokens and the vault approvals.
+ */
+library BalancerRouting {
+	using SafeMath for uint256;
+
+	uint256 internal constant basisOne = 10000;
+
+	/**
+	 * Batch swap route, assets[j] to assets[j + 1] through poolIds[j].
+	 */
+	struct SwapSteps {
+		bytes32[] poolIds;
+		IAsset[] assets;
+	}
+
+	/**
+	 * Pool state to route an exit, balances and supply are read again for each tranche.
+	 */
+	struct ExitQuote {
+		IBalancerVault vault;
+		bytes32 poolId;
+		uint256 tokenIndex; // want
+		IAsset[] assets; // pool tokens, in the vault order
+		uint256[] balances;
+		uint256[] weights;
+		uint256 swapFee;
+		uint256 totalSupply;
+		SwapSteps[] routes; // exit swap steps of each pool token, empty to swap back through the pool
+	}
+
+	/**
+	 * Quote a swap along swap steps, from one of its assets to the last one.
+	 * Every hop is priced with the pool's own onSwap, at the current balances.
+	 * Returns 0 if a hop is over the pool's max in ratio, a batchSwap along the steps would fail the same way.
+	 * Reverts with the pool's error if a pool can not quote the hop (e.g. paused), rather than
+	 * 	reading as a worthless route.
+	 * @param _amountIn: amount of _steps.assets[_fromAsset]
+	 * @param _fromAsset: index of the asset in _steps.assets
+	 */
+	function quoteSwapSteps(
+		IBalancerVault _vault,
+		SwapSteps memory _steps,
+		uint256 _amountIn,
+		uint256 _fromAsset
+	) public view returns (uint256 _amount) {
+		_amount = _amountIn;
+		for (uint256 j = _fromAsset; j < _steps.poolIds.length && _amount > 0; j++) {
+			_amount = _quoteSwapStep(_vault, _steps, _amount, j);
+		}
+	}
+
+	/**
+	 * Want out of a proportional exit of _bpts with the other pool tokens swapped to want.
+	 * Tokens with a route are quoted along it, the others are swapped back through the pool
+	 * 	on the balances left by the exit. Returns 0 if a swap is over the pool's max in ratio.
+	 */
+	function proportionalExitOut(uint256 _bpts, ExitQuote memory _quote) public view returns (uint256 _wantOut) {
+		(uint256[] memory wantOuts, bool swappable) = _proportionalWantOuts(_bpts, _quote);
+		if (!swappable) {
+			return 0;
+		}
+		for (uint256 i = 0; i < wantOuts.length; i++) {
+			_wantOut = _wantOut.add(wantOuts[i]);
+		}
+	}
+
+	/**
+	 * Exit _bpts for all the pool tokens, then swap the tokens the exit paid, other than want, to want
+	 * 	along their route or back through the pool.
+	 * Each swap has to pay its proportionalExitOut quote less _maxSlippage.
+	 * @param _maxSlippage: bips
+	 */
+	function exitProportional(
+		uint256 _bpts,
+		ExitQuote memory _quote,
+		uint256 _maxSlippage
+	) public {
+		(uint256[] memory wantOuts, ) = _proportionalWantOuts(_bpts, _quote);
+		uint256[] memory balances = new uint256[](_quote.assets.length);
+		for (uint256 i = 0; i < _quote.assets.length; i++) {
+			if (i != _quote.tokenIndex) {
+				balances[i] = IERC20(address(_quote.assets[i])).balanceOf(address(this));
+			}
+		}
+
+		bytes memory userData = abi.encode(IBalancerVault.ExitKind.EXACT_BPT_IN_FOR_TOKENS_OUT, _bpts);
+		IBalancerVault.ExitPoolRequest memory request =
+			IBalancerVault.ExitPoolRequest(_quote.assets, new uint256[](_quote.assets.length), userData, false);
+		_quote.vault.exitPool(_quote.poolId, address(this), address(this), request);
+
+		for (uint256 i = 0; i < _quote.assets.length; i++) {
+			if (i != _quote.tokenIndex) {
+				uint256 amount = IERC20(address(_quote.assets[i])).balanceOf(address(this)).sub(balances[i]);
+				uint256 minOut = wantOuts[i].mul(basisOne.sub(_maxSlippage)).div(basisOne);
+				_swapForWant(i, amount, minOut, _quote);
+			}
+		}
+	}
+
+	/**
+	 * Want out of each pool token in a proportional exit of _bpts, the exited want itself at tokenIndex.
+	 * @return _swappable: false if a swap back through the pool is over its max in ratio.
+	 */
+	function _proportionalWantOuts(uint256 _bpts, ExitQuote memory _quote)
+		internal
+		view
+		returns (uint256[] memory _wantOuts, bool _swappable)
+	{
+		_wantOuts = new uint256[](_quote.assets.length);
+		uint256 wantBalance = _quote.balances[_quote.tokenIndex];
+		uint256 wantExited = wantBalance.mul(_bpts).div(_quote.totalSupply);
+		_wantOuts[_quote.tokenIndex] = wantExited;
+		for (uint256 i = 0; i < _quote.assets.length; i++) {
+			if (i == _quote.tokenIndex) {
+				continue;
+			}
+			uint256 amount = _quote.balances[i].mul(_bpts).div(_quote.totalSupply);
+			if (_quote.routes[i].poolIds.length > 0) {
+				_wantOuts[i] = quoteSwapSteps(_quote.vault, _quote.routes[i], amount, 0);
+				continue;
+			}
+			uint256 balanceIn = _quote.balances[i].sub(amount);
+			uint256 amountIn = WeightedMath.mulDown(amount, WeightedMath.complement(_quote.swapFee));
+			if (amountIn > WeightedMath.mulDown(balanceIn, WeightedMath.MAX_IN_RATIO)) {
+				return (_wantOuts, false);
+			}
+			_wantOuts[i] = WeightedMath.calcOutGivenIn(
+				balanceIn,
+				_quote.weights[i],
+				wantBalance.sub(wantExited),
+				_quote.weights[_quote.tokenIndex],
+				amountIn
+			);
+		}
+		_swappable = true;
+	}
+
+	/**
+	 * Quote one hop of swap steps, 0 over the max in ratio of weighted pools.
+	 * note The ratio is checked on the amount before the swap fee, a little under the pool's own limit.
+	 * @param _step: index of the pool in _steps.poolIds
+	 */
+	function _quoteSwapStep(
+		IBalancerVault _vault,
+		SwapSteps memory _steps,
+		uint256 _amountIn,
+		uint256 _step
+	) internal view returns (uint256) {
+		IBalancerPool.SwapRequest memory request =
+			IBalancerPool.SwapRequest(
+				IBalancerPool.SwapKind.GIVEN_IN,
+				IERC20(address(_steps.assets[_step])),
+				IERC20(address(_steps.assets[_step + 1])),
+				_amountIn,
+				_steps.poolIds[_step],
+				0,
+				address(this),
+				address(this),
+				abi.encode(0)
+			);
+		(IERC20[] memory tokens, uint256[] memory balances, uint256 lastChangeBlock) =
+			_vault.getPoolTokens(request.poolId);
+		request.lastChangeBlock = lastChangeBlock;
+		uint256 indexIn;
+		uint256 indexOut;
+		for (uint256 i = 0; i < tokens.length; i++) {
+			if (tokens[i] == request.tokenIn) indexIn = i;
+			if (tokens[i] == request.tokenOut) indexOut = i;
+		}
+
+		if (_amountIn > WeightedMath.mulDown(balances[indexIn], WeightedMath.MAX_IN_RATIO)) {
+			return 0;
+		}
+
+		(address pool, IBalancerVault.PoolSpecialization specialization) = _vault.getPool(request.poolId);
+		return
+			specialization == IBalancerVault.PoolSpecialization.GENERAL
+				? IBalancerPool(pool).onSwap(request, balances, indexIn, indexOut)
+				: IBalancerPool(pool).onSwap(request, balances[indexIn], balances[indexOut]);
+	}
+
+	/**
+	 * Swap _amount of pool token _index to want along its route, or back through the pool.
+	 * @param _minOut: least want the swap has to pay
+	 */
+	function _swapForWant(
+		uint256 _index,
+		uint256 _amount,
+		uint256 _minOut,
+		ExitQuote memory _quote
+	) internal {
+		if (_amount == 0) {
+			return;
+		}
+		IAsset token = _quote.assets[_index];
+		SwapSteps memory route = _quote.routes[_index];
+		if (route.poolIds.length == 0) {
+			route = SwapSteps(new bytes32[](1), new IAsset[](2));
+			route.poolIds[0] = _quote.poolId;
+			route.assets[0] = token;
+			route.assets[1] = _quote.assets[_quote.tokenIndex];
+		}
+		IBalancerVault.BatchSwapStep[] memory steps = new IBalancerVault.BatchSwapStep[](route.poolIds.length);
+		for (uint256 j = 0; j < steps.length; j++) {
+			steps[j] = IBalancerVault.BatchSwapStep(route.poolIds[j], j, j + 1, j == 0 ? _amount : 0, abi.encode(0));
+		}
+		// Routes end in want, a negative limit is the least amount received
+		int256[] memory limits = new int256[](route.assets.length);
+		limits[0] = int256(_amount);
+		limits[limits.length - 1] = -int256(_minOut);
+		_quote.vault.batchSwap(
+			IBalancerVault.SwapKind.GIVEN_IN,
+			steps,
+			route.assets,
+			IBalancerVault.FundManagement(address(this), false, address(this), false),
+			limits,
+			now + 10
+		);
+	}
+}
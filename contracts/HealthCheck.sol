@@ -9,17 +9,27 @@ import { StrategyParams, VaultAPI, StrategyAPI } from '@yearnvaults/contracts/Ba
 
 import { ICustomHealthCheck } from '../interfaces/ICustomHealthCheck.sol';
 
+// Ratios are bips under MAX_BPS, packed in one slot
 struct Limits {
-	uint256 profitLimitRatio;
-	uint256 lossLimitRatio;
+	uint16 profitLimitRatio;
+	uint16 lossLimitRatio;
 	bool exists;
 }
 
+// One harvest to pre-check with checkBatch
+struct CheckRequest {
+	address strategy;
+	uint256 profit;
+	uint256 loss;
+	uint256 debtPayment;
+	uint256 debtOutstanding;
+	uint256 totalDebt;
+}
+
 contract CommonHealthCheck {
 	// Default Settings for all strategies
 	uint256 constant MAX_BPS = 10_000;
-	uint256 public profitLimitRatio;
-	uint256 public lossLimitRatio;
+	Limits internal defaultLimits;
 	mapping(address => Limits) public strategiesLimits;
 
 	address public governance;
@@ -46,8 +56,15 @@ contract CommonHealthCheck {
 	constructor() public {
 		governance = msg.sender;
 		management = msg.sender;
-		profitLimitRatio = 100;
-		lossLimitRatio = 55;
+		defaultLimits = Limits(100, 55, true);
+	}
+
+	function profitLimitRatio() external view returns (uint256) {
+		return defaultLimits.profitLimitRatio;
+	}
+
+	function lossLimitRatio() external view returns (uint256) {
+		return defaultLimits.lossLimitRatio;
 	}
 
 	function setGovernance(address _governance) external onlyGovernance {
@@ -62,12 +79,12 @@ contract CommonHealthCheck {
 
 	function setProfitLimitRatio(uint256 _profitLimitRatio) external onlyAuthorized {
 		require(_profitLimitRatio < MAX_BPS);
-		profitLimitRatio = _profitLimitRatio;
+		defaultLimits.profitLimitRatio = uint16(_profitLimitRatio);
 	}
 
 	function setlossLimitRatio(uint256 _lossLimitRatio) external onlyAuthorized {
 		require(_lossLimitRatio < MAX_BPS);
-		lossLimitRatio = _lossLimitRatio;
+		defaultLimits.lossLimitRatio = uint16(_lossLimitRatio);
 	}
 
 	function setStrategyLimits(
@@ -77,7 +94,7 @@ contract CommonHealthCheck {
 	) external onlyAuthorized {
 		require(_lossLimitRatio < MAX_BPS);
 		require(_profitLimitRatio < MAX_BPS);
-		strategiesLimits[_strategy] = Limits(_profitLimitRatio, _lossLimitRatio, true);
+		strategiesLimits[_strategy] = Limits(uint16(_profitLimitRatio), uint16(_lossLimitRatio), true);
 	}
 
 	function setCheck(address _strategy, address _check) external onlyAuthorized {
@@ -121,6 +138,45 @@ contract CommonHealthCheck {
 		return _runChecks(strategy, profit, loss, debtPayment, debtOutstanding, totalDebt);
 	}
 
+	/**
+	 * Pre-check many harvests in one call.
+	 * Bit i of _passed is set when requests[i] would pass the check the vault runs on report:
+	 * a strategy with the check disabled always passes, a custom check decides for its strategy,
+	 * otherwise the strategy or default limits apply.
+	 * _limits[i] holds the limits used for requests[i], zero when they did not apply
+	 * (exists is false when the defaults were used).
+	 */
+	function checkBatch(CheckRequest[] calldata requests)
+		external
+		view
+		returns (uint256[] memory _passed, Limits[] memory _limits)
+	{
+		_passed = new uint256[]((requests.length + 255) / 256);
+		_limits = new Limits[](requests.length);
+		Limits memory defaults = defaultLimits;
+		for (uint256 i = 0; i < requests.length; i++) {
+			CheckRequest calldata request = requests[i];
+			bool passed;
+			if (disabledCheck[request.strategy]) {
+				passed = true;
+			} else if (checks[request.strategy] != address(0)) {
+				passed = ICustomHealthCheck(checks[request.strategy]).check(
+					request.strategy,
+					request.profit,
+					request.loss,
+					request.debtPayment,
+					request.debtOutstanding
+				);
+			} else {
+				_limits[i] = _strategyLimits(request.strategy, defaults);
+				passed = _withinLimits(_limits[i], request.profit, request.loss, request.totalDebt);
+			}
+			if (passed) {
+				_passed[i / 256] |= uint256(1) << (i % 256);
+			}
+		}
+	}
+
 	function _runChecks(
 		address strategy,
 		uint256 profit,
@@ -145,20 +201,33 @@ contract CommonHealthCheck {
 		uint256 _totalDebt
 	) internal view returns (bool) {
 		Limits memory limits = strategiesLimits[strategy];
-		uint256 _profitLimitRatio;
-		uint256 _lossLimitRatio;
-		if (limits.exists) {
-			_profitLimitRatio = limits.profitLimitRatio;
-			_lossLimitRatio = limits.lossLimitRatio;
-		} else {
-			_profitLimitRatio = profitLimitRatio;
-			_lossLimitRatio = lossLimitRatio;
+		if (!limits.exists) {
+			limits = defaultLimits;
+		}
+		return _withinLimits(limits, _profit, _loss, _totalDebt);
+	}
+
+	/**
+	 * Limits of the strategy, the defaults when it has none.
+	 * @param defaults: defaultLimits, read once by the caller.
+	 */
+	function _strategyLimits(address strategy, Limits memory defaults) internal view returns (Limits memory limits) {
+		limits = strategiesLimits[strategy];
+		if (!limits.exists) {
+			limits = Limits(defaults.profitLimitRatio, defaults.lossLimitRatio, false);
 		}
+	}
 
-		if (_profit > ((_totalDebt * _profitLimitRatio) / MAX_BPS)) {
+	function _withinLimits(
+		Limits memory limits,
+		uint256 _profit,
+		uint256 _loss,
+		uint256 _totalDebt
+	) internal pure returns (bool) {
+		if (_profit > ((_totalDebt * limits.profitLimitRatio) / MAX_BPS)) {
 			return false;
 		}
-		if (_loss > ((_totalDebt * _lossLimitRatio) / MAX_BPS)) {
+		if (_loss > ((_totalDebt * limits.lossLimitRatio) / MAX_BPS)) {
 			return false;
 		}
 		return true;
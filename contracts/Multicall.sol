@@ -0,0 +1,66 @@
+// SPDX-License-Identifier: AGPL-3.0
+
+pragma solidity 0.6.12;
+pragma experimental ABIEncoderV2;
+
+/**
+ * @title Multicall
+ * note Aggregates view calls into a single eth_call, same interface as Multicall2.
+ * 			Used by scripts/strategyReader.py, can be deployed on a local network for tests.
+ */
+contract Multicall {
+	struct Call {
+		address target;
+		bytes callData;
+	}
+
+	struct Result {
+		bool success;
+		bytes returnData;
+	}
+
+	function aggregate(Call[] memory _calls) public returns (uint256 _blockNumber, bytes[] memory _returnData) {
+		_blockNumber = block.number;
+		_returnData = new bytes[](_calls.length);
+		for (uint256 i = 0; i < _calls.length; i++) {
+			(bool success, bytes memory ret) = _calls[i].target.call(_calls[i].callData);
+			require(success, 'Multicall aggregate: call failed');
+			_returnData[i] = ret;
+		}
+	}
+
+	/**
+	 * note Failed calls are returned with success false instead of reverting, unless _requireSuccess.
+	 */
+	function tryAggregate(bool _requireSuccess, Call[] memory _calls) public returns (Result[] memory _returnData) {
+		_returnData = new Result[](_calls.length);
+		for (uint256 i = 0; i < _calls.length; i++) {
+			(bool success, bytes memory ret) = _calls[i].target.call(_calls[i].callData);
+			if (_requireSuccess) {
+				require(success, 'Multicall tryAggregate: call failed');
+			}
+			_returnData[i] = Result(success, ret);
+		}
+	}
+
+	function tryBlockAndAggregate(bool _requireSuccess, Call[] memory _calls)
+		public
+		returns (
+			uint256 _blockNumber,
+			uint256 _timestamp,
+			Result[] memory _returnData
+		)
+	{
+		_blockNumber = block.number;
+		_timestamp = block.timestamp;
+		_returnData = tryAggregate(_requireSuccess, _calls);
+	}
+
+	function getBlockNumber() external view returns (uint256) {
+		return block.number;
+	}
+
+	function getCurrentBlockTimestamp() external view returns (uint256) {
+		return block.timestamp;
+	}
+}
@@ -0,0 +1,58 @@
+// SPDX-License-Identifier: AGPL-3.0
+
+pragma solidity 0.6.12;
+pragma experimental ABIEncoderV2;
+
+import { Strategy } from './strategy.sol';
+
+/**
+ * @title Strategy clone factory
+ * note Deploys EIP-1167 minimal proxies of a deployed Strategy and initializes them with their whole
+ * 			config in the same transaction, so a clone is never left uninitialized.
+ * 			Every clone delegates to the implementation code, immutables of the implementation would be shared.
+ */
+contract StrategyFactory {
+	address public immutable implementation;
+
+	event Cloned(address indexed strategy, address indexed vault);
+
+	/**
+	 * @param _implementation: a Strategy, initialized by its constructor
+	 */
+	constructor(address _implementation) public {
+		implementation = _implementation;
+	}
+
+	/**
+	 * Clone the implementation for a vault and apply its config.
+	 * @param _params: deploy arguments, as the Strategy constructor takes them
+	 * @param _setup: stake params, reward swap steps, stake info, wNative and a (shared) health check
+	 */
+	function clone(
+		address _vault,
+		address _strategist,
+		address _rewards,
+		address _keeper,
+		Strategy.InitParams memory _params,
+		Strategy.Setup memory _setup
+	) external returns (address _strategy) {
+		_strategy = _clone(implementation);
+		Strategy(_strategy).initialize(_vault, _strategist, _rewards, _keeper, _params, _setup);
+		emit Cloned(_strategy, _vault);
+	}
+
+	/**
+	 * EIP-1167 minimal proxy of _target.
+	 */
+	function _clone(address _target) internal returns (address _instance) {
+		bytes20 targetBytes = bytes20(_target);
+		assembly {
+			let code := mload(0x40)
+			mstore(code, 0x3d602d80600a3d3981f3363d3d373d3d3d363d73000000000000000000000000)
+			mstore(add(code, 0x14), targetBytes)
+			mstore(add(code, 0x28), 0x5af43d82803e903d91602b57fd5bf30000000000000000000000000000000000)
+			_instance := create(0, code, 0x37)
+		}
+		require(_instance != address(0), 'clone failed');
+	}
+}
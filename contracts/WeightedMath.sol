@@ -0,0 +1,181 @@
+// SPDX-License-Identifier: AGPL-3.0
+
+pragma solidity 0.6.12;
+
+import { SafeMath } from '@openzeppelin/contracts/math/SafeMath.sol';
+
+/**
+ * @title Balancer weighted pool math
+ * note Follows balancer-v2 WeightedMath with 18 decimals fixed point numbers.
+ * 			Powers are approximated with a binomial series, which converges fast for the
+ * 			balance ratios allowed by the 30% swap limits of Balancer weighted pools.
+ * 			Results are estimations and are not rounded in the pool's favour.
+ */
+library WeightedMath {
+	using SafeMath for uint256;
+
+	uint256 internal constant ONE = 1e18;
+	uint256 internal constant MAX_IN_RATIO = 0.3e18;
+	uint256 internal constant MAX_POW_TERMS = 64;
+
+	function mulDown(uint256 _a, uint256 _b) internal pure returns (uint256) {
+		return _a.mul(_b) / ONE;
+	}
+
+	function mulUp(uint256 _a, uint256 _b) internal pure returns (uint256) {
+		uint256 product = _a.mul(_b);
+		return product == 0 ? 0 : (product - 1) / ONE + 1;
+	}
+
+	function divDown(uint256 _a, uint256 _b) internal pure returns (uint256) {
+		return _a.mul(ONE).div(_b);
+	}
+
+	function divUp(uint256 _a, uint256 _b) internal pure returns (uint256) {
+		require(_b > 0, 'div zero');
+		return _a == 0 ? 0 : (_a.mul(ONE) - 1) / _b + 1;
+	}
+
+	function complement(uint256 _x) internal pure returns (uint256) {
+		return _x < ONE ? ONE - _x : 0;
+	}
+
+	/**
+	 * _base ^ _exp for _base in (0, 2).
+	 * The integer part of the exponent is done by repeated multiplication,
+	 * the fractional part with the binomial series of (1 + x) ^ f.
+	 */
+	function pow(uint256 _base, uint256 _exp) internal pure returns (uint256 _result) {
+		require(_base > 0 && _base < 2 * ONE, 'pow base');
+		_result = ONE;
+		for (uint256 i = _exp / ONE; i > 0; i--) {
+			_result = mulDown(_result, _base);
+		}
+		uint256 frac = _exp % ONE;
+		if (frac == 0) {
+			return _result;
+		}
+
+		int256 one = int256(ONE);
+		int256 x = int256(_base) - one;
+		int256 f = int256(frac);
+		int256 term = one;
+		int256 sum = one;
+		for (uint256 k = 1; k <= MAX_POW_TERMS && term != 0; k++) {
+			// term_k = term_k-1 * (f - (k - 1)) * x / k
+			term = (((term * (f - int256(k - 1) * one)) / one) * x) / one / int256(k);
+			sum += term;
+		}
+		_result = mulDown(_result, uint256(sum));
+	}
+
+	/**
+	 * Tokens out for an exact amount in, _amountIn must already have the swap fee deducted.
+	 */
+	function calcOutGivenIn(
+		uint256 _balanceIn,
+		uint256 _weightIn,
+		uint256 _balanceOut,
+		uint256 _weightOut,
+		uint256 _amountIn
+	) internal pure returns (uint256) {
+		require(_amountIn <= mulDown(_balanceIn, MAX_IN_RATIO), 'MAX_IN_RATIO');
+		uint256 base = divUp(_balanceIn, _balanceIn.add(_amountIn));
+		uint256 power = pow(base, divDown(_weightIn, _weightOut));
+		return mulDown(_balanceOut, complement(power));
+	}
+
+	function calcBptOutGivenExactTokensIn(
+		uint256[] memory _balances,
+		uint256[] memory _weights,
+		uint256[] memory _amountsIn,
+		uint256 _totalSupply,
+		uint256 _swapFee
+	) internal pure returns (uint256) {
+		uint256[] memory balanceRatiosWithFee = new uint256[](_amountsIn.length);
+		uint256 invariantRatioWithFees = 0;
+		for (uint256 i = 0; i < _balances.length; i++) {
+			balanceRatiosWithFee[i] = divDown(_balances[i].add(_amountsIn[i]), _balances[i]);
+			invariantRatioWithFees = invariantRatioWithFees.add(mulDown(balanceRatiosWithFee[i], _weights[i]));
+		}
+
+		uint256 invariantRatio = ONE;
+		for (uint256 i = 0; i < _balances.length; i++) {
+			if (_amountsIn[i] == 0) {
+				continue;
+			}
+			uint256 amountInWithoutFee = _amountsIn[i];
+			if (balanceRatiosWithFee[i] > invariantRatioWithFees) {
+				// Only the non proportional part of the join is charged the swap fee
+				uint256 nonTaxableAmount = mulDown(_balances[i], invariantRatioWithFees.sub(ONE));
+				uint256 taxableAmount = _amountsIn[i].sub(nonTaxableAmount);
+				amountInWithoutFee = nonTaxableAmount.add(mulDown(taxableAmount, complement(_swapFee)));
+			}
+			uint256 balanceRatio = divDown(_balances[i].add(amountInWithoutFee), _balances[i]);
+			invariantRatio = mulDown(invariantRatio, pow(balanceRatio, _weights[i]));
+		}
+
+		return invariantRatio > ONE ? mulDown(_totalSupply, invariantRatio - ONE) : 0;
+	}
+
+	function calcBptInGivenExactTokensOut(
+		uint256[] memory _balances,
+		uint256[] memory _weights,
+		uint256[] memory _amountsOut,
+		uint256 _totalSupply,
+		uint256 _swapFee
+	) internal pure returns (uint256) {
+		uint256[] memory balanceRatiosWithoutFee = new uint256[](_amountsOut.length);
+		uint256 invariantRatioWithoutFees = 0;
+		for (uint256 i = 0; i < _balances.length; i++) {
+			balanceRatiosWithoutFee[i] = divUp(_balances[i].sub(_amountsOut[i]), _balances[i]);
+			invariantRatioWithoutFees = invariantRatioWithoutFees.add(mulUp(balanceRatiosWithoutFee[i], _weights[i]));
+		}
+
+		uint256 invariantRatio = ONE;
+		for (uint256 i = 0; i < _balances.length; i++) {
+			if (_amountsOut[i] == 0) {
+				continue;
+			}
+			uint256 amountOutWithFee = _amountsOut[i];
+			if (invariantRatioWithoutFees > balanceRatiosWithoutFee[i]) {
+				// Only the non proportional part of the exit is charged the swap fee
+				uint256 nonTaxableAmount = mulDown(_balances[i], complement(invariantRatioWithoutFees));
+				uint256 taxableAmount = _amountsOut[i].sub(nonTaxableAmount);
+				amountOutWithFee = nonTaxableAmount.add(divUp(taxableAmount, complement(_swapFee)));
+			}
+			uint256 balanceRatio = divDown(_balances[i].sub(amountOutWithFee), _balances[i]);
+			invariantRatio = mulDown(invariantRatio, pow(balanceRatio, _weights[i]));
+		}
+
+		return mulUp(_totalSupply, complement(invariantRatio));
+	}
+
+	function calcTokenOutGivenExactBptIn(
+		uint256 _balance,
+		uint256 _weight,
+		uint256 _bptAmountIn,
+		uint256 _totalSupply,
+		uint256 _swapFee
+	) internal pure returns (uint256) {
+		uint256 invariantRatio = divUp(_totalSupply.sub(_bptAmountIn), _totalSupply);
+		uint256 balanceRatio = pow(invariantRatio, divDown(ONE, _weight));
+		uint256 amountOutWithoutFee = mulDown(_balance, complement(balanceRatio));
+
+		// Only the part of the exit that is not proportional to the weight is charged the swap fee
+		uint256 taxableAmount = mulUp(amountOutWithoutFee, complement(_weight));
+		uint256 nonTaxableAmount = amountOutWithoutFee.sub(taxableAmount);
+		return nonTaxableAmount.add(mulDown(taxableAmount, complement(_swapFee)));
+	}
+
+	function calcTokensOutGivenExactBptIn(
+		uint256[] memory _balances,
+		uint256 _bptAmountIn,
+		uint256 _totalSupply
+	) internal pure returns (uint256[] memory _amountsOut) {
+		_amountsOut = new uint256[](_balances.length);
+		for (uint256 i = 0; i < _balances.length; i++) {
+			_amountsOut[i] = _balances[i].mul(_bptAmountIn).div(_totalSupply);
+		}
+	}
+}
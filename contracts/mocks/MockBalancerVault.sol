@@ -0,0 +1,386 @@
+// SPDX-License-Identifier: AGPL-3.0
+
+pragma solidity 0.6.12;
+pragma experimental ABIEncoderV2;
+
+import { SafeERC20, IERC20 } from '@openzeppelin/contracts/token/ERC20/SafeERC20.sol';
+import { SafeMath } from '@openzeppelin/contracts/math/SafeMath.sol';
+import { ERC20 } from '@openzeppelin/contracts/token/ERC20/ERC20.sol';
+
+import { IBalancerVault } from '../../interfaces/IBalancerVault.sol';
+import { IBalancerPool } from '../../interfaces/IBalancerPool.sol';
+import { IAsset } from '../../interfaces/IAsset.sol';
+import { WeightedMath } from '../WeightedMath.sol';
+
+/**
+ * @title Local stand-in for a Beethoven weighted pool
+ * note The pool token (bpt) is minted and burned by the vault on joins and exits.
+ * 			Registers as TWO_TOKEN with two tokens, MINIMAL_SWAP_INFO otherwise, and like the
+ * 			Balancer weighted pools only has the onSwap of those specializations.
+ * 			Only GIVEN_IN swaps are supported.
+ */
+contract MockWeightedPool is ERC20 {
+	using SafeMath for uint256;
+
+	address internal vault;
+	bytes32 internal poolId;
+	IERC20[] internal tokens;
+	uint256[] internal weights;
+	uint256[] internal scalingFactors;
+	uint256 internal swapFeePercentage;
+
+	modifier onlyVault() {
+		require(msg.sender == vault, '!vault');
+		_;
+	}
+
+	/**
+	 * @param _weights: normalized weights, 18 decimals, must add up to 1e18.
+	 * @param _swapFeePercentage: 18 decimals, 1e15 = 0.1%
+	 */
+	constructor(
+		string memory _name,
+		string memory _symbol,
+		address _vault,
+		IERC20[] memory _tokens,
+		uint256[] memory _weights,
+		uint256 _swapFeePercentage
+	) public ERC20(_name, _symbol) {
+		require(_tokens.length == _weights.length, 'length mismatch');
+		vault = _vault;
+		tokens = _tokens;
+		weights = _weights;
+		swapFeePercentage = _swapFeePercentage;
+		for (uint256 i = 0; i < _tokens.length; i++) {
+			scalingFactors.push(10**(18 - uint256(ERC20(address(_tokens[i])).decimals())));
+		}
+		poolId = MockBalancerVault(_vault).registerPool(
+			_tokens,
+			_tokens.length == 2
+				? IBalancerVault.PoolSpecialization.TWO_TOKEN
+				: IBalancerVault.PoolSpecialization.MINIMAL_SWAP_INFO
+		);
+	}
+
+	function getPoolId() external view returns (bytes32) {
+		return poolId;
+	}
+
+	function getVault() external view returns (address) {
+		return vault;
+	}
+
+	function getNormalizedWeights() external view returns (uint256[] memory) {
+		return weights;
+	}
+
+	function getSwapFeePercentage() external view returns (uint256) {
+		return swapFeePercentage;
+	}
+
+	function getRate() external pure returns (uint256) {
+		return 1e18;
+	}
+
+	function onSwap(
+		IBalancerPool.SwapRequest memory _request,
+		uint256 _balanceIn,
+		uint256 _balanceOut
+	) external view returns (uint256) {
+		require(_request.kind == IBalancerPool.SwapKind.GIVEN_IN, 'GIVEN_IN only');
+		uint256 amountIn = _request.amount.sub(WeightedMath.mulUp(_request.amount, swapFeePercentage));
+		return
+			WeightedMath.calcOutGivenIn(
+				_balanceIn,
+				weights[_tokenIndex(_request.tokenIn)],
+				_balanceOut,
+				weights[_tokenIndex(_request.tokenOut)],
+				amountIn
+			);
+	}
+
+	function _tokenIndex(IERC20 _token) internal view returns (uint256) {
+		for (uint256 i = 0; i < tokens.length; i++) {
+			if (tokens[i] == _token) {
+				return i;
+			}
+		}
+		revert('BAL#521');
+	}
+
+	/**
+	 * Mints the bpt for a join and returns the amounts the vault has to pull.
+	 * Supports INIT and EXACT_TOKENS_IN_FOR_BPT_OUT.
+	 */
+	function onJoinPool(
+		address _recipient,
+		uint256[] memory _balances,
+		bytes memory _userData
+	) external onlyVault returns (uint256[] memory _amountsIn) {
+		IBalancerVault.JoinKind kind = abi.decode(_userData, (IBalancerVault.JoinKind));
+		uint256 bptOut;
+		if (kind == IBalancerVault.JoinKind.INIT) {
+			require(totalSupply() == 0, 'initialized');
+			(, _amountsIn) = abi.decode(_userData, (IBalancerVault.JoinKind, uint256[]));
+			for (uint256 i = 0; i < _amountsIn.length; i++) {
+				bptOut = bptOut.add(_amountsIn[i].mul(scalingFactors[i]));
+			}
+		} else if (kind == IBalancerVault.JoinKind.EXACT_TOKENS_IN_FOR_BPT_OUT) {
+			uint256 minBptOut;
+			(, _amountsIn, minBptOut) = abi.decode(_userData, (IBalancerVault.JoinKind, uint256[], uint256));
+			bptOut = WeightedMath.calcBptOutGivenExactTokensIn(
+				_balances,
+				weights,
+				_amountsIn,
+				totalSupply(),
+				swapFeePercentage
+			);
+			require(bptOut >= minBptOut, 'BPT_OUT_MIN_AMOUNT');
+		} else {
+			revert('unsupported join');
+		}
+		_mint(_recipient, bptOut);
+	}
+
+	/**
+	 * Burns the bpt for an exit and returns the amounts the vault has to send.
+	 */
+	function onExitPool(
+		address _sender,
+		uint256[] memory _balances,
+		bytes memory _userData
+	) external onlyVault returns (uint256[] memory _amountsOut) {
+		IBalancerVault.ExitKind kind = abi.decode(_userData, (IBalancerVault.ExitKind));
+		uint256 bptIn;
+		if (kind == IBalancerVault.ExitKind.EXACT_BPT_IN_FOR_ONE_TOKEN_OUT) {
+			uint256 tokenIndex;
+			(, bptIn, tokenIndex) = abi.decode(_userData, (IBalancerVault.ExitKind, uint256, uint256));
+			_amountsOut = new uint256[](_balances.length);
+			_amountsOut[tokenIndex] = WeightedMath.calcTokenOutGivenExactBptIn(
+				_balances[tokenIndex],
+				weights[tokenIndex],
+				bptIn,
+				totalSupply(),
+				swapFeePercentage
+			);
+		} else if (kind == IBalancerVault.ExitKind.EXACT_BPT_IN_FOR_TOKENS_OUT) {
+			(, bptIn) = abi.decode(_userData, (IBalancerVault.ExitKind, uint256));
+			_amountsOut = WeightedMath.calcTokensOutGivenExactBptIn(_balances, bptIn, totalSupply());
+		} else {
+			uint256 maxBptIn;
+			(, _amountsOut, maxBptIn) = abi.decode(_userData, (IBalancerVault.ExitKind, uint256[], uint256));
+			bptIn = WeightedMath.calcBptInGivenExactTokensOut(
+				_balances,
+				weights,
+				_amountsOut,
+				totalSupply(),
+				swapFeePercentage
+			);
+			require(bptIn <= maxBptIn, 'BPT_IN_MAX_AMOUNT');
+		}
+		_burn(_sender, bptIn);
+	}
+}
+
+/**
+ * @title Local stand-in for the Beethoven (Balancer v2) vault
+ * note Keeps the pool balances and moves the tokens, pool math lives in MockWeightedPool.
+ * 			Error strings follow the Balancer BAL#xxx codes where there is one.
+ */
+contract MockBalancerVault {
+	using SafeERC20 for IERC20;
+	using SafeMath for uint256;
+
+	struct PoolData {
+		address pool;
+		IBalancerVault.PoolSpecialization specialization;
+		IERC20[] tokens;
+		uint256[] balances;
+		uint256 lastChangeBlock;
+	}
+
+	mapping(bytes32 => PoolData) internal pools;
+	uint256 internal nextPoolNonce;
+
+	/**
+	 * Called by the pool on construction.
+	 * The pool id packs the pool address, the specialization and a nonce like the Balancer vault does.
+	 */
+	function registerPool(IERC20[] memory _tokens, IBalancerVault.PoolSpecialization _specialization)
+		external
+		returns (bytes32 _poolId)
+	{
+		_poolId = bytes32((uint256(uint160(msg.sender)) << 96) | (uint256(_specialization) << 80) | nextPoolNonce);
+		nextPoolNonce++;
+		PoolData storage data = pools[_poolId];
+		data.pool = msg.sender;
+		data.specialization = _specialization;
+		data.tokens = _tokens;
+		data.balances = new uint256[](_tokens.length);
+	}
+
+	function getPool(bytes32 _poolId) external view returns (address, IBalancerVault.PoolSpecialization) {
+		return (pools[_poolId].pool, pools[_poolId].specialization);
+	}
+
+	function getPoolTokens(bytes32 _poolId)
+		external
+		view
+		returns (
+			IERC20[] memory tokens,
+			uint256[] memory balances,
+			uint256 lastChangeBlock
+		)
+	{
+		PoolData storage data = pools[_poolId];
+		return (data.tokens, data.balances, data.lastChangeBlock);
+	}
+
+	function joinPool(
+		bytes32 _poolId,
+		address _sender,
+		address _recipient,
+		IBalancerVault.JoinPoolRequest memory _request
+	) external payable {
+		require(_sender == msg.sender, 'BAL#401');
+		PoolData storage data = _getPool(_poolId);
+		uint256[] memory amountsIn = MockWeightedPool(data.pool).onJoinPool(_recipient, data.balances, _request.userData);
+		for (uint256 i = 0; i < amountsIn.length; i++) {
+			require(address(_request.assets[i]) == address(data.tokens[i]), 'BAL#520');
+			require(amountsIn[i] <= _request.maxAmountsIn[i], 'BAL#506');
+			if (amountsIn[i] > 0) {
+				data.tokens[i].safeTransferFrom(_sender, address(this), amountsIn[i]);
+				data.balances[i] = data.balances[i].add(amountsIn[i]);
+			}
+		}
+		data.lastChangeBlock = block.number;
+	}
+
+	function exitPool(
+		bytes32 _poolId,
+		address _sender,
+		address payable _recipient,
+		IBalancerVault.ExitPoolRequest memory _request
+	) external {
+		require(_sender == msg.sender, 'BAL#401');
+		PoolData storage data = _getPool(_poolId);
+		uint256[] memory amountsOut = MockWeightedPool(data.pool).onExitPool(_sender, data.balances, _request.userData);
+		for (uint256 i = 0; i < amountsOut.length; i++) {
+			require(address(_request.assets[i]) == address(data.tokens[i]), 'BAL#520');
+			require(amountsOut[i] >= _request.minAmountsOut[i], 'BAL#505');
+			if (amountsOut[i] > 0) {
+				data.balances[i] = data.balances[i].sub(amountsOut[i]);
+				data.tokens[i].safeTransfer(_recipient, amountsOut[i]);
+			}
+		}
+		data.lastChangeBlock = block.number;
+	}
+
+	function swap(
+		IBalancerVault.SingleSwap memory _singleSwap,
+		IBalancerVault.FundManagement memory _funds,
+		uint256 _limit,
+		uint256 _deadline
+	) external payable returns (uint256 _amountOut) {
+		require(_singleSwap.kind == IBalancerVault.SwapKind.GIVEN_IN, 'GIVEN_IN only');
+		require(block.timestamp <= _deadline, 'BAL#508');
+		require(_funds.sender == msg.sender, 'BAL#401');
+		IERC20 tokenIn = IERC20(_singleSwap.assetIn);
+		IERC20 tokenOut = IERC20(_singleSwap.assetOut);
+		_amountOut = _swap(_singleSwap.poolId, tokenIn, tokenOut, _singleSwap.amount);
+		require(_amountOut >= _limit, 'BAL#507');
+		tokenIn.safeTransferFrom(_funds.sender, address(this), _singleSwap.amount);
+		tokenOut.safeTransfer(_funds.recipient, _amountOut);
+	}
+
+	/**
+	 * GIVEN_IN batch swap. A step with amount 0 uses the output of the previous step.
+	 * Net deltas are settled once at the end, checked against the limits.
+	 */
+	function batchSwap(
+		IBalancerVault.SwapKind _kind,
+		IBalancerVault.BatchSwapStep[] memory _swaps,
+		IAsset[] memory _assets,
+		IBalancerVault.FundManagement memory _funds,
+		int256[] memory _limits,
+		uint256 _deadline
+	) external payable returns (int256[] memory _deltas) {
+		require(_kind == IBalancerVault.SwapKind.GIVEN_IN, 'GIVEN_IN only');
+		require(block.timestamp <= _deadline, 'BAL#508');
+		require(_funds.sender == msg.sender, 'BAL#401');
+
+		_deltas = new int256[](_assets.length);
+		uint256 previousAmountOut;
+		uint256 previousAssetOut;
+		for (uint256 i = 0; i < _swaps.length; i++) {
+			IBalancerVault.BatchSwapStep memory step = _swaps[i];
+			uint256 amountIn = step.amount;
+			if (amountIn == 0) {
+				require(i > 0 && step.assetInIndex == previousAssetOut, 'BAL#510');
+				amountIn = previousAmountOut;
+			}
+			previousAmountOut = _swap(
+				step.poolId,
+				IERC20(address(_assets[step.assetInIndex])),
+				IERC20(address(_assets[step.assetOutIndex])),
+				amountIn
+			);
+			previousAssetOut = step.assetOutIndex;
+			_deltas[step.assetInIndex] += int256(amountIn);
+			_deltas[step.assetOutIndex] -= int256(previousAmountOut);
+		}
+
+		for (uint256 i = 0; i < _assets.length; i++) {
+			require(_deltas[i] <= _limits[i], 'BAL#507');
+			IERC20 token = IERC20(address(_assets[i]));
+			if (_deltas[i] > 0) {
+				token.safeTransferFrom(_funds.sender, address(this), uint256(_deltas[i]));
+			} else if (_deltas[i] < 0) {
+				token.safeTransfer(_funds.recipient, uint256(-_deltas[i]));
+			}
+		}
+	}
+
+	function _swap(
+		bytes32 _poolId,
+		IERC20 _tokenIn,
+		IERC20 _tokenOut,
+		uint256 _amountIn
+	) internal returns (uint256 _amountOut) {
+		PoolData storage data = _getPool(_poolId);
+		uint256 indexIn = _tokenIndex(data, _tokenIn);
+		uint256 indexOut = _tokenIndex(data, _tokenOut);
+		IBalancerPool.SwapRequest memory request =
+			IBalancerPool.SwapRequest(
+				IBalancerPool.SwapKind.GIVEN_IN,
+				_tokenIn,
+				_tokenOut,
+				_amountIn,
+				_poolId,
+				data.lastChangeBlock,
+				msg.sender,
+				msg.sender,
+				''
+			);
+		_amountOut = data.specialization == IBalancerVault.PoolSpecialization.GENERAL
+			? IBalancerPool(data.pool).onSwap(request, data.balances, indexIn, indexOut)
+			: IBalancerPool(data.pool).onSwap(request, data.balances[indexIn], data.balances[indexOut]);
+		data.balances[indexIn] = data.balances[indexIn].add(_amountIn);
+		data.balances[indexOut] = data.balances[indexOut].sub(_amountOut);
+		data.lastChangeBlock = block.number;
+	}
+
+	function _getPool(bytes32 _poolId) internal view returns (PoolData storage data) {
+		data = pools[_poolId];
+		require(data.pool != address(0), 'BAL#500');
+	}
+
+	function _tokenIndex(PoolData storage _data, IERC20 _token) internal view returns (uint256) {
+		for (uint256 i = 0; i < _data.tokens.length; i++) {
+			if (_data.tokens[i] == _token) {
+				return i;
+			}
+		}
+		revert('BAL#521');
+	}
+}
@@ -0,0 +1,58 @@
+// SPDX-License-Identifier: AGPL-3.0
+
+pragma solidity 0.6.12;
+
+import { ERC20 } from '@openzeppelin/contracts/token/ERC20/ERC20.sol';
+
+/**
+ * @title Local stand-in for the Fantom ERC20 tokens (USDC, MAI, QI)
+ * note Test only, anyone can mint.
+ */
+contract MockERC20 is ERC20 {
+	constructor(
+		string memory _name,
+		string memory _symbol,
+		uint8 _decimals
+	) public ERC20(_name, _symbol) {
+		_setupDecimals(_decimals);
+	}
+
+	function mint(address _to, uint256 _amount) external {
+		_mint(_to, _amount);
+	}
+
+	/**
+	 * Fantom USDC burns transfers to the zero address instead of reverting.
+	 */
+	function _transfer(
+		address _sender,
+		address _recipient,
+		uint256 _amount
+	) internal override {
+		if (_recipient == address(0)) {
+			_burn(_sender, _amount);
+		} else {
+			super._transfer(_sender, _recipient, _amount);
+		}
+	}
+}
+
+/**
+ * @title Local stand-in for wFTM
+ */
+contract MockWrappedNative is MockERC20 {
+	constructor(string memory _name, string memory _symbol) public MockERC20(_name, _symbol, 18) {}
+
+	receive() external payable {
+		deposit();
+	}
+
+	function deposit() public payable {
+		_mint(msg.sender, msg.value);
+	}
+
+	function withdraw(uint256 _amount) external {
+		_burn(msg.sender, _amount);
+		msg.sender.transfer(_amount);
+	}
+}
@@ -0,0 +1,151 @@
+// SPDX-License-Identifier: AGPL-3.0
+
+pragma solidity 0.6.12;
+pragma experimental ABIEncoderV2;
+
+import { SafeERC20, IERC20 } from '@openzeppelin/contracts/token/ERC20/SafeERC20.sol';
+import { SafeMath } from '@openzeppelin/contracts/math/SafeMath.sol';
+import { Math } from '@openzeppelin/contracts/math/Math.sol';
+
+import { IQiMasterChef } from '../../interfaces/IQiMasterChef.sol';
+
+/**
+ * @title Local stand-in for the Qi DAO masterChef (ERC20 farm)
+ * note Rewards accrue per block and are split between pools by allocPoint.
+ * 			Deposits pay depositFeeBP to the fee address.
+ * 			The farm pays rewards out of its own balance, fund it before use.
+ */
+contract MockQiMasterChef {
+	using SafeERC20 for IERC20;
+	using SafeMath for uint256;
+
+	struct UserInfo {
+		uint256 amount;
+		uint256 rewardDebt;
+	}
+
+	IERC20 public erc20;
+	uint256 public rewardPerBlock;
+	uint256 public totalAllocPoint;
+	uint256 public startBlock;
+	uint256 public endBlock;
+	address public feeAddress;
+
+	IQiMasterChef.PoolInfo[] public poolInfo;
+	mapping(uint256 => mapping(address => UserInfo)) public userInfo;
+
+	event Deposit(address indexed user, uint256 indexed pid, uint256 amount);
+	event Withdraw(address indexed user, uint256 indexed pid, uint256 amount);
+	event EmergencyWithdraw(address indexed user, uint256 indexed pid, uint256 amount);
+
+	constructor(
+		IERC20 _erc20,
+		uint256 _rewardPerBlock,
+		uint256 _startBlock,
+		uint256 _endBlock,
+		address _feeAddress
+	) public {
+		erc20 = _erc20;
+		rewardPerBlock = _rewardPerBlock;
+		startBlock = _startBlock;
+		endBlock = _endBlock;
+		feeAddress = _feeAddress;
+	}
+
+	function poolLength() external view returns (uint256) {
+		return poolInfo.length;
+	}
+
+	function add(
+		uint256 _allocPoint,
+		IERC20 _lpToken,
+		uint16 _depositFeeBP
+	) external {
+		require(_depositFeeBP <= 10000, 'add: invalid deposit fee basis points');
+		uint256 lastRewardBlock = Math.max(block.number, startBlock);
+		totalAllocPoint = totalAllocPoint.add(_allocPoint);
+		poolInfo.push(IQiMasterChef.PoolInfo(_lpToken, _allocPoint, lastRewardBlock, 0, _depositFeeBP));
+	}
+
+	/**
+	 * Reward tokens accrued by a pool between two blocks, capped at endBlock.
+	 */
+	function _poolReward(IQiMasterChef.PoolInfo memory _pool, uint256 _toBlock) internal view returns (uint256) {
+		uint256 lastBlock = Math.min(_toBlock, endBlock);
+		if (lastBlock <= _pool.lastRewardBlock || totalAllocPoint == 0) {
+			return 0;
+		}
+		return lastBlock.sub(_pool.lastRewardBlock).mul(rewardPerBlock).mul(_pool.allocPoint).div(totalAllocPoint);
+	}
+
+	function pending(uint256 _pid, address _user) external view returns (uint256) {
+		IQiMasterChef.PoolInfo memory pool = poolInfo[_pid];
+		UserInfo memory user = userInfo[_pid][_user];
+		uint256 accERC20PerShare = pool.accERC20PerShare;
+		uint256 lpSupply = pool.lpToken.balanceOf(address(this));
+		if (lpSupply != 0) {
+			accERC20PerShare = accERC20PerShare.add(_poolReward(pool, block.number).mul(1e12).div(lpSupply));
+		}
+		return user.amount.mul(accERC20PerShare).div(1e12).sub(user.rewardDebt);
+	}
+
+	function updatePool(uint256 _pid) public {
+		IQiMasterChef.PoolInfo storage pool = poolInfo[_pid];
+		if (block.number <= pool.lastRewardBlock) {
+			return;
+		}
+		uint256 lpSupply = pool.lpToken.balanceOf(address(this));
+		if (lpSupply != 0) {
+			pool.accERC20PerShare = pool.accERC20PerShare.add(_poolReward(pool, block.number).mul(1e12).div(lpSupply));
+		}
+		pool.lastRewardBlock = block.number;
+	}
+
+	function deposit(uint256 _pid, uint256 _amount) external {
+		IQiMasterChef.PoolInfo storage pool = poolInfo[_pid];
+		UserInfo storage user = userInfo[_pid][msg.sender];
+		updatePool(_pid);
+		if (user.amount > 0) {
+			_payReward(msg.sender, user.amount.mul(pool.accERC20PerShare).div(1e12).sub(user.rewardDebt));
+		}
+		if (_amount > 0) {
+			pool.lpToken.safeTransferFrom(msg.sender, address(this), _amount);
+			uint256 depositFee = _amount.mul(pool.depositFeeBP).div(10000);
+			if (depositFee > 0) {
+				pool.lpToken.safeTransfer(feeAddress, depositFee);
+			}
+			user.amount = user.amount.add(_amount).sub(depositFee);
+		}
+		user.rewardDebt = user.amount.mul(pool.accERC20PerShare).div(1e12);
+		emit Deposit(msg.sender, _pid, _amount);
+	}
+
+	function withdraw(uint256 _pid, uint256 _amount) external {
+		IQiMasterChef.PoolInfo storage pool = poolInfo[_pid];
+		UserInfo storage user = userInfo[_pid][msg.sender];
+		require(user.amount >= _amount, "withdraw: can't withdraw more than deposit");
+		updatePool(_pid);
+		_payReward(msg.sender, user.amount.mul(pool.accERC20PerShare).div(1e12).sub(user.rewardDebt));
+		user.amount = user.amount.sub(_amount);
+		user.rewardDebt = user.amount.mul(pool.accERC20PerShare).div(1e12);
+		pool.lpToken.safeTransfer(msg.sender, _amount);
+		emit Withdraw(msg.sender, _pid, _amount);
+	}
+
+	function emergencyWithdraw(uint256 _pid) external {
+		IQiMasterChef.PoolInfo storage pool = poolInfo[_pid];
+		UserInfo storage user = userInfo[_pid][msg.sender];
+		uint256 amount = user.amount;
+		user.amount = 0;
+		user.rewardDebt = 0;
+		pool.lpToken.safeTransfer(msg.sender, amount);
+		emit EmergencyWithdraw(msg.sender, _pid, amount);
+	}
+
+	function _payReward(address _to, uint256 _amount) internal {
+		_amount = Math.min(_amount, erc20.balanceOf(address(this)));
+		if (_amount > 0) {
+			erc20.safeTransfer(_to, _amount);
+		}
+	}
+}
@@ -3,16 +3,19 @@
 pragma solidity 0.6.12;
 pragma experimental ABIEncoderV2;
 
-import { BaseStrategy } from '@yearnvaults/contracts/BaseStrategy.sol';
+import { BaseStrategy, StrategyParams } from '@yearnvaults/contracts/BaseStrategy.sol';
 import { SafeERC20, IERC20, Address } from '@openzeppelin/contracts/token/ERC20/SafeERC20.sol';
 import { SafeMath } from '@openzeppelin/contracts/math/SafeMath.sol';
 import { ERC20 } from '@openzeppelin/contracts/token/ERC20/ERC20.sol';
 import { Math } from '@openzeppelin/contracts/math/Math.sol';
+import { SafeCast } from '@openzeppelin/contracts/utils/SafeCast.sol';
 
 import { IBalancerVault } from '../interfaces/IBalancerVault.sol';
 import { IBalancerPool } from '../interfaces/IBalancerPool.sol';
 import { IAsset } from '../interfaces/IAsset.sol';
 import { IQiMasterChef } from '../interfaces/IQiMasterChef.sol';
+import { WeightedMath } from './WeightedMath.sol';
+import { BalancerRouting } from './BalancerRouting.sol';
 
 /**
  * @title Yearn Beethoven_Mai USDC strategy
@@ -32,51 +35,143 @@ contract Strategy is BaseStrategy {
 	using SafeERC20 for IERC20;
 	using Address for address;
 	using SafeMath for uint256;
+	using SafeCast for uint256;
 
+	// Set once by the constructor or initialize, packed since clones can not have their own immutables
 	IBalancerVault public balancerVault;
-	IBalancerPool public bpt;
-	IERC20 public rewardToken;
-	IAsset[] internal assets;
-	SwapSteps internal swapSteps;
-	uint256[] internal minAmountsOut;
-	bytes32 internal balancerPoolId;
 	uint8 internal numTokens;
 	uint8 internal tokenIndex;
-	uint256 internal wantDecimals;
-	bool internal abandonRewards;
+	IBalancerPool public bpt;
+	uint32 internal masterChefPoolId;
+	bytes32 internal balancerPoolId;
 
+	// One slot, read by every masterChef, join and exit call
 	IQiMasterChef internal masterChef;
+	//	   1	0.01%
+	//	   5	0.05%
+	//    10	0.1%
+	//    50	0.5%
+	//   100	1%
+	//  1000	10%
+	// 10000	100%
+	uint16 public maxSlippageIn; // bips
+	uint16 public maxSlippageOut; // bips
+	uint16 internal stakePercentage; // bips
+	uint16 internal unstakePercentage; // bips
+	uint16 public maxRewardImpact; // bips of price impact a reward sale may take, 0 for no cap
+	bool internal abandonRewards;
 
-	IAsset[] internal stakeAssets;
+	// One slot, read by adjustPosition and tendTrigger
+	uint128 public maxSingleDeposit; // cap of a single join, below it joins are sized to maxSlippageIn
+	uint32 public minDepositPeriod; // seconds
+	uint32 public lastDepositTime;
+
+	// One slot, read by every stake call
 	IBalancerPool public stakeBpt;
-	uint256 internal stakeTokenIndex;
-	uint256 internal stakeWantIndex;
-	uint256 internal stakePercentage;
-	uint256 internal unstakePercentage;
+	uint8 internal stakeTokenIndex;
+	uint8 internal stakeWantIndex;
+	uint32 internal masterChefStakePoolId;
+	bytes32 internal stakePoolId;
+	IAsset[] internal stakeAssets;
+
+	IERC20 public rewardToken; // masterChef reward, the first whitelisted reward
+	IERC20 public wNative; // wrapped gas token, priced along the swap steps for ethToWant
+	IERC20[] internal rewardTokens;
+	mapping(address => SwapSteps) internal rewardSwapSteps;
+	mapping(address => uint256) public minRewardSale; // sellRewards skips smaller amounts of the token
+	mapping(address => SwapSteps) internal exitSwapSteps; // pool token to want after a proportional exit
 
 	struct SwapSteps {
 		bytes32[] poolIds;
 		IAsset[] assets;
 	}
 
+	/**
+	 * In-memory snapshot of the strategy position.
+	 * Built once per entry point and only refreshed after state-changing calls.
+	 */
+	struct Position {
+		uint256 want; // loose want
+		uint256 bpt; // bpt in the strategy
+		uint256 bptInMasterChef;
+		uint256 stakeBptInMasterChef;
+		uint256 rewards; // loose reward tokens
+		uint256 pooled; // bpt + bptInMasterChef denominated in want
+		bool claimed; // main pool rewards already paid out by a masterChef deposit or withdraw
+	}
+
+	/**
+	 * Pool state to size a single sided join, read once per adjustPosition.
+	 */
+	struct JoinQuote {
+		IAsset[] assets; // pool tokens, in the vault order
+		uint256[] balances;
+		uint256[] weights;
+		uint256 swapFee;
+		uint256 totalSupply;
+		uint256 bpts; // bpt + bptInMasterChef
+		uint256 pooled; // bpts denominated in want, with the same math as the join
+	}
+
 	// uint256 internal constant max = type(uint256).max;
 
-	//	   1	0.01%
-	//	   5	0.05%
-	//    10	0.1%
-	//    50	0.5%
-	//   100	1%
-	//  1000	10%
-	// 10000	100%
-	uint256 public maxSlippageIn; // bips
-	uint256 public maxSlippageOut; // bips
-	uint256 public maxSingleDeposit;
-	uint256 public minDepositPeriod; // seconds
-	uint256 public lastDepositTime;
-	bytes32 internal stakePoolId;
-	uint256 internal masterChefPoolId;
-	uint256 internal masterChefStakePoolId;
+	// Harvest telemetry, enough to attribute each harvest from the logs alone.
+	// Amounts are in want unless stated, slipped is the want lost against the value of the bpt.
+	event Joined(uint256 wantIn, uint256 bptOut, uint256 slipped);
+	event Exited(uint256 wantOut, uint256 bptIn, uint256 slipped);
+	event TradingFeesCollected(uint256 wantOut);
+	event RewardsClaimed(uint256 rewards); // rewardToken paid by masterChef
+	event Consolidated(uint256 staked, uint256 unstaked); // rewardToken in and out of the stake pool
+	event RewardsSold(address indexed token, uint256 rewards, uint256 wantOut); // want out split by the quotes
+
 	uint256 internal constant basisOne = 10000;
+	uint256 internal constant defaultMinRewardSale = 10**12;
+	uint256 internal constant accPrecision = 1e12; // masterChef accERC20PerShare precision
+	uint256 internal constant joinSizeMargin = 9500; // bips of the fitted join size, room for the pool's rounding
+	uint256 internal constant joinSizeChecks = 3; // halvings of the fitted join size before giving up
+	uint256 internal constant maxInRatio = 0.3e18; // weighted pools MAX_IN_RATIO
+	uint256 internal constant exitBptTolerance = 1; // bips over the quoted bpt, room for the pool's rounding
+	uint256 internal constant masterChefDepositGas = 100000;
+	uint256 internal constant maxRedepositCost = 100; // bips of the leftover bpt value paid as deposit gas
+	uint256 internal constant defaultMaxRewardImpact = 100; // bips
+	uint256 internal constant swapStepGas = 70000; // gas a reward route adds to the batchSwap per swap step
+	uint256 internal constant impactProbe = 1000; // spot price of a reward sale quoted at 1/impactProbe of its size
+	uint256 internal constant impactChecks = 3; // rescalings of a reward sale over maxRewardImpact
+	uint256 internal constant exitTranche = 1000; // bips of the pool want balance, or bpt supply, exited at once
+	uint256 internal constant maxExitTranches = 8;
+
+	/**
+	 * Deploy arguments of a strategy, the constructor takes them unpacked.
+	 * @param maxSingleDeposit: without the want decimals
+	 */
+	struct InitParams {
+		address balancerVault;
+		address balancerPool;
+		address masterChef;
+		uint256 maxSlippageIn;
+		uint256 maxSlippageOut;
+		uint256 maxSingleDeposit;
+		uint256 minDepositPeriod;
+		uint256 masterChefPoolId;
+	}
+
+	/**
+	 * What deployStrategy used to send in separate transactions after the deploy.
+	 * An empty stakeAssets leaves the stake info unset, a zero healthCheck leaves it to setHealthCheck.
+	 */
+	struct Setup {
+		uint256 stakePercentage;
+		uint256 unstakePercentage;
+		address rewardToken;
+		SwapSteps rewardSteps;
+		IAsset[] stakeAssets;
+		address stakePool;
+		uint256 stakeTokenIndex;
+		uint256 stakeWantIndex;
+		uint256 masterChefStakePoolId;
+		address wNative;
+		address healthCheck;
+	}
 
 	constructor(
 		address _vault,
@@ -89,34 +184,89 @@ contract Strategy is BaseStrategy {
 		uint256 _minDepositPeriod,
 		uint256 _masterChefPoolId
 	) public BaseStrategy(_vault) {
-		bpt = IBalancerPool(_balancerPool);
-		balancerPoolId = bpt.getPoolId();
-		balancerVault = IBalancerVault(_balancerVault);
-		(IERC20[] memory tokens, , ) = balancerVault.getPoolTokens(balancerPoolId);
-		numTokens = uint8(tokens.length);
-		assets = new IAsset[](numTokens);
-		tokenIndex = type(uint8).max;
-		for (uint8 i = 0; i < numTokens; i++) {
+		_initializeStrategy(
+			InitParams(
+				_balancerVault,
+				_balancerPool,
+				_masterChef,
+				_maxSlippageIn,
+				_maxSlippageOut,
+				_maxSingleDeposit,
+				_minDepositPeriod,
+				_masterChefPoolId
+			)
+		);
+	}
+
+	/**
+	 * Initializes a clone of this strategy and applies its whole config.
+	 * note Can only be called once, BaseStrategy._initialize reverts when want is already set.
+	 * 			Clones should be created and initialized in the same transaction, see StrategyFactory.
+	 */
+	function initialize(
+		address _vault,
+		address _strategist,
+		address _rewards,
+		address _keeper,
+		InitParams memory _params,
+		Setup memory _setup
+	) external {
+		_initialize(_vault, _strategist, _rewards, _keeper);
+		_initializeStrategy(_params);
+
+		_setStakeParams(_setup.stakePercentage, _setup.unstakePercentage);
+		_whitelistReward(_setup.rewardToken, _setup.rewardSteps);
+		if (_setup.stakeAssets.length > 0) {
+			_setStakeInfo(
+				_setup.stakeAssets,
+				_setup.stakePool,
+				_setup.stakeTokenIndex,
+				_setup.stakeWantIndex,
+				_setup.masterChefStakePoolId
+			);
+		}
+		wNative = IERC20(_setup.wNative);
+		healthCheck = _setup.healthCheck;
+	}
+
+	function _initializeStrategy(InitParams memory _params) internal {
+		bytes32 poolId = IBalancerPool(_params.balancerPool).getPoolId();
+		(IERC20[] memory tokens, , ) = IBalancerVault(_params.balancerVault).getPoolTokens(poolId);
+		uint8 wantIndex = type(uint8).max;
+		for (uint8 i = 0; i < tokens.length; i++) {
 			if (tokens[i] == want) {
-				tokenIndex = i;
+				wantIndex = i;
 			}
-			assets[i] = IAsset(address(tokens[i]));
 		}
-		require(tokenIndex != type(uint8).max, 'token not in pool!');
-		wantDecimals = ERC20(address(want)).decimals();
-		maxSlippageIn = _maxSlippageIn;
-		maxSlippageOut = _maxSlippageOut;
-		maxSingleDeposit = _maxSingleDeposit.mul(10**uint256(wantDecimals));
-		minAmountsOut = new uint256[](numTokens);
-		minDepositPeriod = _minDepositPeriod;
-		masterChefPoolId = _masterChefPoolId;
+		require(wantIndex != type(uint8).max, 'token not in pool!');
+		bpt = IBalancerPool(_params.balancerPool);
+		balancerPoolId = poolId;
+		balancerVault = IBalancerVault(_params.balancerVault);
+		numTokens = uint8(tokens.length);
+		tokenIndex = wantIndex;
+		masterChefPoolId = _params.masterChefPoolId.toUint32();
+		maxRewardImpact = uint16(defaultMaxRewardImpact);
+
+		uint256 wantDecimals = ERC20(address(want)).decimals();
+		_setParams(
+			_params.maxSlippageIn,
+			_params.maxSlippageOut,
+			_params.maxSingleDeposit.mul(10**wantDecimals),
+			_params.minDepositPeriod
+		);
 
-		masterChef = IQiMasterChef(_masterChef);
-		IQiMasterChef.PoolInfo memory poolInfo = masterChef.poolInfo(masterChefPoolId);
-		require(address(poolInfo.lpToken) == address(bpt));
+		masterChef = IQiMasterChef(_params.masterChef);
+		IQiMasterChef.PoolInfo memory poolInfo = masterChef.poolInfo(_params.masterChefPoolId);
+		require(address(poolInfo.lpToken) == _params.balancerPool);
 
-		want.safeApprove(address(balancerVault), type(uint256).max);
-		bpt.approve(address(masterChef), type(uint256).max);
+		want.safeApprove(_params.balancerVault, type(uint256).max);
+		// The other pool tokens are swapped to want after proportional exits
+		for (uint8 i = 0; i < tokens.length; i++) {
+			if (i != wantIndex) {
+				tokens[i].approve(_params.balancerVault, type(uint256).max);
+			}
+		}
+		IERC20(_params.balancerPool).approve(_params.masterChef, type(uint256).max);
 	}
 
 	//--------------------------//
@@ -135,7 +285,46 @@ contract Strategy is BaseStrategy {
 		return balanceOfWant().add(balanceOfPooled());
 	}
 
-	function ethToWant(uint256 _amtInWei) public view override returns (uint256) {}
+	/**
+	 * Value an amount of the gas token in `want`, along the first reward swap steps that go through wNative.
+	 * Returns 0 when wNative is not set or not one of the swap step assets.
+	 */
+	function ethToWant(uint256 _amtInWei) public view override returns (uint256) {
+		for (uint256 r = 0; r < rewardTokens.length; r++) {
+			SwapSteps storage steps = rewardSwapSteps[address(rewardTokens[r])];
+			for (uint256 i = 0; i < steps.assets.length; i++) {
+				if (address(steps.assets[i]) == address(wNative)) {
+					return _quoteSwapSteps(steps, _amtInWei, i);
+				}
+			}
+		}
+		return 0;
+	}
+
+	/**
+	 * Same checks as BaseStrategy.harvestTrigger, with the rewards counted as profit.
+	 * note Rewards are not part of estimatedTotalAssets, so the base trigger would only weigh
+	 * 			the call cost against trading fees and credit.
+	 * note A shortfall within maxSlippageIn is the cost of joining the pool, not a loss
+	 * 			a harvest can realize, so it does not trigger one.
+	 */
+	function harvestTrigger(uint256 callCostInWei) public view override returns (bool) {
+		StrategyParams memory params = vault.strategies(address(this));
+		if (params.activation == 0) return false;
+		if (block.timestamp.sub(params.lastReport) < minReportDelay) return false;
+		if (block.timestamp.sub(params.lastReport) >= maxReportDelay) return true;
+		if (vault.debtOutstanding() > debtThreshold) return true;
+
+		uint256 total = estimatedTotalAssets();
+		uint256 joinSlippage = params.totalDebt.mul(maxSlippageIn).div(basisOne);
+		if (total.add(debtThreshold).add(joinSlippage) < params.totalDebt) return true;
+
+		uint256 profit = estimatedRewardsInWant();
+		if (total > params.totalDebt) {
+			profit = profit.add(total.sub(params.totalDebt));
+		}
+		return profitFactor.mul(ethToWant(callCostInWei)) < vault.creditAvailable().add(profit);
+	}
 
 	function tendTrigger(uint256 callCostInWei) public view override returns (bool) {
 		return now.sub(lastDepositTime) > minDepositPeriod && balanceOfWant() > 0;
@@ -165,17 +354,102 @@ contract Strategy is BaseStrategy {
 		return rewardToken.balanceOf(address(this));
 	}
 
+	/**
+	 * Reward tokens waiting to be claimed from masterChef, main and stake pool.
+	 */
+	function pendingRewards() public view returns (uint256 _amount) {
+		_amount = _pendingReward(masterChefPoolId);
+		if (address(stakeBpt) != address(0)) {
+			_amount = _amount.add(_pendingReward(masterChefStakePoolId));
+		}
+	}
+
+	/**
+	 * Value in `want` of the loose and pending rewards, as sold by the next harvest.
+	 * note The staked rewards are left out, they are only realized when unstaked.
+	 */
+	function estimatedRewardsInWant() public view returns (uint256 _amount) {
+		for (uint256 r = 0; r < rewardTokens.length; r++) {
+			IERC20 token = rewardTokens[r];
+			uint256 rewards = token.balanceOf(address(this));
+			if (address(token) == address(rewardToken)) {
+				rewards = rewards.add(pendingRewards());
+			}
+			if (rewards > minRewardSale[address(token)]) {
+				_amount = _amount.add(_quoteSwapSteps(rewardSwapSteps[address(token)], rewards, 0));
+			}
+		}
+	}
+
+	/**
+	 * masterChef.pending, from the farm state.
+	 * Reproduces the accERC20PerShare accrual up to the current block, capped at endBlock.
+	 * @param _poolId: masterChef pool id
+	 */
+	function _pendingReward(uint256 _poolId) internal view returns (uint256) {
+		(uint256 amount, uint256 rewardDebt) = masterChef.userInfo(_poolId, address(this));
+		if (amount == 0) {
+			return 0;
+		}
+		IQiMasterChef.PoolInfo memory pool = masterChef.poolInfo(_poolId);
+		uint256 accPerShare = pool.accERC20PerShare;
+		uint256 lastBlock = Math.min(block.number, masterChef.endBlock());
+		uint256 lpSupply = pool.lpToken.balanceOf(address(masterChef));
+		if (lastBlock > pool.lastRewardBlock && lpSupply > 0) {
+			uint256 reward =
+				lastBlock.sub(pool.lastRewardBlock).mul(masterChef.rewardPerBlock()).mul(pool.allocPoint).div(
+					masterChef.totalAllocPoint()
+				);
+			accPerShare = accPerShare.add(reward.mul(accPrecision).div(lpSupply));
+		}
+		return amount.mul(accPerShare).div(accPrecision).sub(rewardDebt);
+	}
+
+	/**
+	 * Quote a swap along the reward swap steps, from one of its assets to `want`.
+	 * Returns 0 if a hop is over its pool's max in ratio, the batchSwap of sellRewards would fail the same way.
+	 * Reverts if a pool of the route can not be quoted, a sale is never silently skipped.
+	 * @param _steps: swap steps of a reward token
+	 * @param _amountIn: amount of _steps.assets[_fromAsset]
+	 * @param _fromAsset: index of the asset in _steps.assets
+	 */
+	function _quoteSwapSteps(
+		SwapSteps storage _steps,
+		uint256 _amountIn,
+		uint256 _fromAsset
+	) internal view returns (uint256) {
+		return
+			BalancerRouting.quoteSwapSteps(
+				balancerVault,
+				BalancerRouting.SwapSteps(_steps.poolIds, _steps.assets),
+				_amountIn,
+				_fromAsset
+			);
+	}
+
 	/**
 	 * Provide an accurate estimate for the total amount of assets
 	 * on Beethoven pools and QI masterChef,
 	 * denominated in terms of `want` tokens.
 	 */
 	function balanceOfPooled() public view returns (uint256 _amount) {
-		uint256 totalWantPooled;
+		return _balanceOfPooled(totalBalanceOfBpt());
+	}
+
+	/**
+	 * Value an amount of bpt in terms of `want` tokens.
+	 * Pool tokens, pool balances and bpt supply are read once for the whole valuation.
+	 * @param _bpts: Amount of bpt to value.
+	 */
+	function _balanceOfPooled(uint256 _bpts) internal view returns (uint256 _amount) {
+		if (_bpts == 0) {
+			return 0;
+		}
 		(IERC20[] memory tokens, uint256[] memory totalBalances, uint256 lastChangeBlock) =
 			balancerVault.getPoolTokens(balancerPoolId);
+		uint256 totalSupply = bpt.totalSupply();
 		for (uint8 i = 0; i < numTokens; i++) {
-			uint256 tokenPooled = totalBalances[i].mul(totalBalanceOfBpt()).div(bpt.totalSupply());
+			uint256 tokenPooled = totalBalances[i].mul(_bpts).div(totalSupply);
 			if (tokenPooled > 0) {
 				IERC20 token = tokens[i];
 				if (token != want) {
@@ -194,10 +468,25 @@ contract Strategy is BaseStrategy {
 					// now denominated in want
 					tokenPooled = bpt.onSwap(request, totalBalances, i, tokenIndex);
 				}
-				totalWantPooled += tokenPooled;
+				_amount = _amount.add(tokenPooled);
 			}
 		}
-		return totalWantPooled;
+	}
+
+	/**
+	 * Snapshot of the strategy position.
+	 * note The stake pool is only read once it has been set up,
+	 * 			otherwise masterChefStakePoolId defaults to the main pool id.
+	 */
+	function _position() internal view returns (Position memory _pos) {
+		_pos.want = balanceOfWant();
+		_pos.bpt = balanceOfBpt();
+		_pos.bptInMasterChef = balanceOfBptInMasterChef();
+		if (address(stakeBpt) != address(0)) {
+			_pos.stakeBptInMasterChef = balanceOfStakeBptInMasterChef();
+		}
+		_pos.rewards = balanceOfReward();
+		_pos.pooled = _balanceOfPooled(_pos.bpt.add(_pos.bptInMasterChef));
 	}
 
 	/**
@@ -205,7 +494,25 @@ contract Strategy is BaseStrategy {
 	 * to convert rewards into want token
 	 */
 	function getSwapSteps() public view returns (SwapSteps memory) {
-		return swapSteps;
+		return rewardSwapSteps[address(rewardToken)];
+	}
+
+	/**
+	 * Swap steps of any whitelisted reward token.
+	 */
+	function getRewardSwapSteps(address _rewardToken) public view returns (SwapSteps memory) {
+		return rewardSwapSteps[_rewardToken];
+	}
+
+	/**
+	 * Swap steps of a pool token after a proportional exit, empty when it swaps back through the pool.
+	 */
+	function getExitSwapSteps(address _token) public view returns (SwapSteps memory) {
+		return exitSwapSteps[_token];
+	}
+
+	function getRewardTokens() public view returns (IERC20[] memory) {
+		return rewardTokens;
 	}
 
 	//--------------------------//
@@ -236,19 +543,26 @@ contract Strategy is BaseStrategy {
 			uint256 _debtPayment
 		)
 	{
+		Position memory position = _position();
 		if (_debtOutstanding > 0) {
-			(_debtPayment, _loss) = liquidatePosition(_debtOutstanding);
+			(_debtPayment, _loss) = _liquidatePosition(_debtOutstanding, position);
+			bool claimed = position.claimed;
+			position = _position();
+			position.claimed = claimed;
 		}
 
-		uint256 beforeWant = balanceOfWant();
+		uint256 beforeWant = position.want;
+		uint256 beforeRewards = position.rewards;
 
-		collectTradingFees();
+		collectTradingFees(position);
 		// Claim QI
-		claimAllRewards();
+		claimAllRewards(position);
+		position.rewards = balanceOfReward();
+		emit RewardsClaimed(position.rewards.sub(beforeRewards));
 		// Consolidate % to stake and unStake
-		consolidate();
+		consolidate(position);
 		// Sell the % not staked
-		sellRewards();
+		sellRewards(position);
 
 		_profit = balanceOfWant().sub(beforeWant);
 		if (_profit > _loss) {
@@ -270,25 +584,153 @@ contract Strategy is BaseStrategy {
 		}
 
 		// Put want into lp then put want-lp into masterChef
-		uint256 pooledBefore = balanceOfPooled();
-		uint256 amountIn = Math.min(maxSingleDeposit, balanceOfWant());
-		if (joinPool(amountIn, assets, numTokens, tokenIndex, balancerPoolId)) {
-			// Put all want-lp into masterChef
-			masterChef.deposit(masterChefPoolId, balanceOfBpt());
-
-			uint256 pooledDelta = balanceOfPooled().sub(pooledBefore);
+		Position memory position = _position();
+		uint256 amountIn = Math.min(maxSingleDeposit, position.want);
+		JoinQuote memory quote;
+		if (amountIn > 0) {
+			quote = _joinQuote(position);
+			amountIn = _maxJoinAmount(amountIn, quote);
+		}
+		uint256 beforeRewards = position.rewards;
+		if (joinPool(amountIn, quote.assets, numTokens, tokenIndex, balancerPoolId)) {
+			// Slippage of the join itself, the masterChef deposit fee is charged on top of maxSlippageIn
+			uint256 bpts = balanceOfBpt();
+			uint256 pooledDelta = _balanceOfPooled(bpts.add(position.bptInMasterChef)).sub(position.pooled);
 			uint256 joinSlipped = amountIn > pooledDelta ? amountIn.sub(pooledDelta) : 0;
-
 			require(joinSlipped <= amountIn.mul(maxSlippageIn).div(basisOne), 'Slipped in!');
-			lastDepositTime = now;
-		} else if (balanceOfBpt() > 0) {
-			masterChef.deposit(masterChefPoolId, balanceOfBpt());
+
+			// Put all want-lp into masterChef
+			masterChef.deposit(masterChefPoolId, bpts);
+			position.claimed = true;
+			lastDepositTime = uint32(now);
+			emit Joined(amountIn, bpts.sub(position.bpt), joinSlipped);
+		} else {
+			_depositLeftoverBpt(position);
+			if (position.want > 0) {
+				// The join was sized to nothing, wait minDepositPeriod before trying again instead
+				// of keeping tendTrigger up
+				lastDepositTime = uint32(now);
+			}
 		}
 
 		// Claim all QI rewards.
-		claimAllRewards();
+		claimAllRewards(position);
+		position.rewards = balanceOfReward();
+		emit RewardsClaimed(position.rewards.sub(beforeRewards));
 		// Consolidate instead of stake all, in case the strategy is setup to not stake.
-		consolidate();
+		consolidate(position);
+	}
+
+	/**
+	 * Largest single sided join, up to _amount, that stays within maxSlippageIn.
+	 * The slippage is measured like adjustPosition does, as the want value of the bpt received
+	 * before the masterChef deposit, from the live pool balances, weights and swap fee.
+	 * note The deposit fee is a fixed share of every deposit, the same at any size,
+	 * 			so it is not part of the maxSlippageIn budget.
+	 * note The slippage of a join grows about linearly with its size, so it is fitted from
+	 * 			_amount and _amount / 2, and the fitted size is checked before it is used.
+	 * @param _amount: want available to join.
+	 * @param _quote: pool state from _joinQuote.
+	 */
+	function _maxJoinAmount(uint256 _amount, JoinQuote memory _quote) internal view returns (uint256) {
+		// WeightedMath.pow takes balance ratios under 2, and is accurate well below that.
+		// Joins over maxInRatio of the pool want balance are too deep to pass maxSlippageIn anyway,
+		// the rest of the want goes in with the next deposits.
+		_amount = Math.min(_amount, WeightedMath.mulDown(_quote.balances[tokenIndex], maxInRatio));
+		if (_amount == 0) {
+			return 0;
+		}
+		uint256 slippage = _joinSlippage(_amount, _quote).mul(basisOne).mul(1e18).div(_amount);
+		uint256 tolerance = uint256(maxSlippageIn).mul(1e18);
+		if (slippage <= tolerance) {
+			return _amount;
+		}
+
+		uint256 half = _amount / 2;
+		uint256 halfSlippage = half > 0 ? _joinSlippage(half, _quote).mul(basisOne).mul(1e18).div(half) : slippage;
+		uint256 amountIn;
+		if (halfSlippage >= slippage) {
+			// No slope to fit (e.g. both over the pool's max in ratio), keep halving
+			amountIn = half / 2;
+		} else if (tolerance >= halfSlippage) {
+			amountIn = half.add(tolerance.sub(halfSlippage).mul(_amount.sub(half)).div(slippage.sub(halfSlippage)));
+			amountIn = amountIn.mul(joinSizeMargin).div(basisOne);
+		} else {
+			uint256 below = halfSlippage.sub(tolerance).mul(_amount.sub(half)).div(slippage.sub(halfSlippage));
+			amountIn = half > below ? half.sub(below).mul(joinSizeMargin).div(basisOne) : 0;
+		}
+
+		for (uint256 i = 0; i < joinSizeChecks && amountIn > 0; i++) {
+			if (_joinSlippage(amountIn, _quote).mul(basisOne) <= amountIn.mul(maxSlippageIn)) {
+				return amountIn;
+			}
+			amountIn = amountIn / 2;
+		}
+		return 0;
+	}
+
+	function _joinQuote(Position memory _position) internal view returns (JoinQuote memory _quote) {
+		(IERC20[] memory tokens, uint256[] memory balances, ) = balancerVault.getPoolTokens(balancerPoolId);
+		_quote.assets = _asAssets(tokens);
+		_quote.balances = balances;
+		_quote.weights = bpt.getNormalizedWeights();
+		_quote.swapFee = bpt.getSwapFeePercentage();
+		_quote.totalSupply = bpt.totalSupply();
+		_quote.bpts = _position.bpt.add(_position.bptInMasterChef);
+		_quote.pooled = _quotePooled(_quote.balances, _quote.bpts, _quote.totalSupply, _quote);
+	}
+
+	/**
+	 * Want lost by joining _amountIn, valued like _balanceOfPooled after the join.
+	 */
+	function _joinSlippage(uint256 _amountIn, JoinQuote memory _quote) internal view returns (uint256) {
+		uint256[] memory amountsIn = new uint256[](numTokens);
+		amountsIn[tokenIndex] = _amountIn;
+		uint256 bptOut =
+			WeightedMath.calcBptOutGivenExactTokensIn(
+				_quote.balances,
+				_quote.weights,
+				amountsIn,
+				_quote.totalSupply,
+				_quote.swapFee
+			);
+
+		uint256[] memory balances = new uint256[](numTokens);
+		for (uint8 i = 0; i < numTokens; i++) {
+			balances[i] = _quote.balances[i].add(amountsIn[i]);
+		}
+		uint256 pooled = _quotePooled(balances, _quote.bpts.add(bptOut), _quote.totalSupply.add(bptOut), _quote);
+		uint256 pooledDelta = pooled > _quote.pooled ? pooled.sub(_quote.pooled) : 0;
+		return _amountIn > pooledDelta ? _amountIn.sub(pooledDelta) : 0;
+	}
+
+	/**
+	 * _balanceOfPooled on given pool balances, with the weighted math instead of the pool's onSwap.
+	 * Returns 0 if a token could not be valued, over the pool's max in ratio _balanceOfPooled would revert.
+	 */
+	function _quotePooled(
+		uint256[] memory _balances,
+		uint256 _bpts,
+		uint256 _totalSupply,
+		JoinQuote memory _quote
+	) internal view returns (uint256 _amount) {
+		for (uint8 i = 0; i < numTokens; i++) {
+			uint256 tokenPooled = _balances[i].mul(_bpts).div(_totalSupply);
+			if (tokenPooled > 0 && i != tokenIndex) {
+				uint256 amountIn = WeightedMath.mulDown(tokenPooled, WeightedMath.complement(_quote.swapFee));
+				if (amountIn > WeightedMath.mulDown(_balances[i], maxInRatio)) {
+					return 0;
+				}
+				tokenPooled = WeightedMath.calcOutGivenIn(
+					_balances[i],
+					_quote.weights[i],
+					_balances[tokenIndex],
+					_quote.weights[tokenIndex],
+					amountIn
+				);
+			}
+			_amount = _amount.add(tokenPooled);
+		}
 	}
 
 	/**
@@ -296,47 +738,231 @@ contract Strategy is BaseStrategy {
 	 * The operation will revert if the slippage is greater than the set values.
 	 * note Deposits on MAI.finance masterChef have a 0.5% fee,
 	 * 			so we should only withdraw from masterChef what is strictly necessary.
-	 * note The wantToLPAmount is not exact so should be used with care and with tolerances.
 	 */
 	function liquidatePosition(uint256 _amountNeeded)
 		internal
 		override
 		returns (uint256 _liquidatedAmount, uint256 _loss)
 	{
-		if (estimatedTotalAssets() < _amountNeeded) {
-			_liquidatedAmount = liquidateAllPositions();
-			return (_liquidatedAmount, _amountNeeded.sub(_liquidatedAmount));
+		if (_amountNeeded <= balanceOfWant()) {
+			return (_amountNeeded, 0);
+		}
+		return _liquidatePosition(_amountNeeded, _position());
+	}
+
+	/**
+	 * Liquidate a position from a snapshot of the strategy position.
+	 * @param _position: snapshot taken since the last state-changing call.
+	 */
+	function _liquidatePosition(uint256 _amountNeeded, Position memory _position)
+		internal
+		returns (uint256 _liquidatedAmount, uint256 _loss)
+	{
+		uint256 looseAmount = _position.want;
+		if (_amountNeeded <= looseAmount) {
+			return (_amountNeeded, 0);
 		}
 
-		uint256 looseAmount = balanceOfWant();
-		if (_amountNeeded > looseAmount) {
-			uint256 toExitAmount = _amountNeeded.sub(looseAmount);
+		if (looseAmount.add(_position.pooled) < _amountNeeded) {
+			_liquidatedAmount = _liquidateAllPositions(_position);
+			return (_liquidatedAmount, _amountNeeded.sub(_liquidatedAmount));
+		}
 
-			// Withdraw ONLY the needed bpt out of masterChef
-			masterChef.withdraw(masterChefPoolId, wantToLPAmount(toExitAmount));
-			// Sell some bpt
-			exitPoolExactToken(toExitAmount);
-			// Put remaining bpt back into masterChef
-			masterChef.deposit(masterChefPoolId, balanceOfBpt());
+		uint256 toExitAmount = _amountNeeded.sub(looseAmount);
+		_exitPoolForWant(toExitAmount, _position);
 
-			_liquidatedAmount = Math.min(balanceOfWant(), _amountNeeded);
-			_loss = _amountNeeded.sub(_liquidatedAmount);
+		_liquidatedAmount = Math.min(balanceOfWant(), _amountNeeded);
+		_loss = _amountNeeded.sub(_liquidatedAmount);
 
-			_enforceSlippageOut(toExitAmount, _liquidatedAmount.sub(looseAmount));
-		} else {
-			_liquidatedAmount = _amountNeeded;
-		}
+		_enforceSlippageOut(toExitAmount, _liquidatedAmount.sub(looseAmount));
 	}
 
 	/**
 	 * Convert want amount to LP amount.
-	 * This operation is not exact so should be used with extra care.
-	 * The return _lpAmount has a value of at least the _wantAmount
+	 * Bpt an exit with BPT_IN_FOR_EXACT_TOKENS_OUT burns for _wantAmount, from the weighted pool math
+	 * with the swap fee on the non proportional part, plus exitBptTolerance for the pool's rounding.
 	 * @param _wantAmount : amount of want to convert to lp
-	 * @return _lpAmount : amount of lp tokens equal to the want amount
+	 * @return _lpAmount : amount of lp tokens to exit for the want amount
 	 */
 	function wantToLPAmount(uint256 _wantAmount) public view returns (uint256 _lpAmount) {
-		_lpAmount = _wantAmount.mul(10**wantDecimals).div(balanceOfPooled()).mul(totalBalanceOfBpt()).div(10**wantDecimals);
+		BalancerRouting.ExitQuote memory quote;
+		_exitQuote(quote);
+		return _wantToLPAmount(_wantAmount, quote);
+	}
+
+	/**
+	 * wantToLPAmount on the pool state of an exit quote.
+	 */
+	function _wantToLPAmount(uint256 _wantAmount, BalancerRouting.ExitQuote memory _quote)
+		internal
+		view
+		returns (uint256 _lpAmount)
+	{
+		if (_wantAmount == 0) {
+			return 0;
+		}
+		uint256[] memory amountsOut = new uint256[](numTokens);
+		amountsOut[tokenIndex] = _wantAmount;
+		_lpAmount = WeightedMath.calcBptInGivenExactTokensOut(
+			_quote.balances,
+			_quote.weights,
+			amountsOut,
+			_quote.totalSupply,
+			_quote.swapFee
+		);
+		_lpAmount = _lpAmount.add(_lpAmount.mul(exitBptTolerance).div(basisOne)).add(1);
+	}
+
+	/**
+	 * Read the pool balances and supply into _quote, and the pool, weights, swap fee and
+	 * 	exitSwapSteps the first time.
+	 */
+	function _exitQuote(BalancerRouting.ExitQuote memory _quote) internal view {
+		(IERC20[] memory tokens, uint256[] memory balances, ) = balancerVault.getPoolTokens(balancerPoolId);
+		_quote.assets = _asAssets(tokens);
+		_quote.balances = balances;
+		_quote.totalSupply = bpt.totalSupply();
+		if (_quote.weights.length == 0) {
+			_quote.vault = balancerVault;
+			_quote.poolId = balancerPoolId;
+			_quote.tokenIndex = tokenIndex;
+			_quote.weights = bpt.getNormalizedWeights();
+			_quote.swapFee = bpt.getSwapFeePercentage();
+			_quote.routes = new BalancerRouting.SwapSteps[](tokens.length);
+			for (uint256 i = 0; i < tokens.length; i++) {
+				SwapSteps storage route = exitSwapSteps[address(tokens[i])];
+				_quote.routes[i] = BalancerRouting.SwapSteps(route.poolIds, route.assets);
+			}
+		}
+	}
+
+	/**
+	 * Number of tranches to exit _amount in, at most exitTranche of _poolAmount each, up to maxExitTranches.
+	 */
+	function _exitTranches(uint256 _amount, uint256 _poolAmount) internal pure returns (uint256) {
+		uint256 tranche = _poolAmount.mul(exitTranche).div(basisOne);
+		if (tranche == 0) {
+			return 1;
+		}
+		return Math.max(1, Math.min(_amount.add(tranche).sub(1).div(tranche), maxExitTranches));
+	}
+
+	/**
+	 * Exit the pool for an exact amount of want.
+	 * Large exits are split in tranches of about exitTranche of the pool want balance. Each tranche
+	 * takes the better of a single sided exit and a proportional exit with the other tokens swapped
+	 * to want, quoted on the pool state the previous tranche left.
+	 * Loose bpt is used first and ONLY the missing bpt is withdrawn from masterChef.
+	 * @param _wantAmount: want to get out of the pool.
+	 * @param _position: snapshot taken since the last state-changing call.
+	 */
+	function _exitPoolForWant(uint256 _wantAmount, Position memory _position) internal {
+		BalancerRouting.ExitQuote memory quote;
+		_exitQuote(quote);
+		uint256 tranches = _exitTranches(_wantAmount, quote.balances[tokenIndex]);
+		uint256 remaining = _wantAmount;
+		uint256 inMasterChef = _position.bptInMasterChef;
+		for (uint256 t = tranches; t > 0; t--) {
+			if (t < tranches) {
+				_exitQuote(quote);
+			}
+			uint256 amount = remaining.add(t - 1).div(t);
+			remaining = remaining.sub(amount);
+			inMasterChef = inMasterChef.sub(_exitTrancheForWant(amount, quote, inMasterChef, _position));
+		}
+
+		uint256 totalBpt = _position.bpt.add(_position.bptInMasterChef);
+		uint256 bptIn = totalBpt.sub(inMasterChef).sub(_depositLeftoverBpt(_position));
+		uint256 value = totalBpt > 0 ? bptIn.mul(_position.pooled).div(totalBpt) : 0;
+		uint256 wantOut = balanceOfWant().sub(_position.want);
+		emit Exited(wantOut, bptIn, value > wantOut ? value.sub(wantOut) : 0);
+	}
+
+	/**
+	 * One tranche of _exitPoolForWant.
+	 * A proportional exit that pays more want than the single sided one for the same bpt
+	 * 	burns that bpt scaled down to _wantAmount, it pays more want per bpt the smaller it is.
+	 * @param _inMasterChef: bpt of the main pool left in masterChef
+	 * @return _withdrawn: bpt withdrawn from masterChef for the tranche
+	 */
+	function _exitTrancheForWant(
+		uint256 _wantAmount,
+		BalancerRouting.ExitQuote memory _quote,
+		uint256 _inMasterChef,
+		Position memory _position
+	) internal returns (uint256 _withdrawn) {
+		uint256 bptNeeded = _wantToLPAmount(_wantAmount, _quote);
+		uint256 proportionalOut = BalancerRouting.proportionalExitOut(bptNeeded, _quote);
+		if (proportionalOut > _wantAmount) {
+			bptNeeded = bptNeeded.mul(_wantAmount).div(proportionalOut).add(1);
+		}
+		uint256 loose = balanceOfBpt();
+		if (bptNeeded > loose) {
+			_withdrawn = Math.min(bptNeeded.sub(loose), _inMasterChef);
+			masterChef.withdraw(masterChefPoolId, _withdrawn);
+			_position.claimed = true;
+		}
+		if (proportionalOut > _wantAmount) {
+			BalancerRouting.exitProportional(Math.min(bptNeeded, loose.add(_withdrawn)), _quote, maxSlippageOut);
+		} else {
+			exitPoolExactToken(_wantAmount, _quote.assets);
+		}
+	}
+
+	/**
+	 * Exit an exact amount of bpt for want, in tranches of about exitTranche of the bpt supply.
+	 * Each tranche takes the better of a single sided exit and a proportional exit with the other
+	 * tokens swapped to want.
+	 */
+	function _exitPoolExactBptForWant(uint256 _bpts) internal {
+		if (_bpts == 0) {
+			return;
+		}
+		BalancerRouting.ExitQuote memory quote;
+		_exitQuote(quote);
+		uint256 tranches = _exitTranches(_bpts, quote.totalSupply);
+		for (uint256 t = tranches; t > 0; t--) {
+			if (t < tranches) {
+				_exitQuote(quote);
+			}
+			uint256 bpts = _bpts.add(t - 1).div(t);
+			_bpts = _bpts.sub(bpts);
+			uint256 singleOut =
+				WeightedMath.calcTokenOutGivenExactBptIn(
+					quote.balances[tokenIndex],
+					quote.weights[tokenIndex],
+					bpts,
+					quote.totalSupply,
+					quote.swapFee
+				);
+			if (BalancerRouting.proportionalExitOut(bpts, quote) > singleOut) {
+				BalancerRouting.exitProportional(bpts, quote, maxSlippageOut);
+			} else {
+				exitPoolExactBpt(bpts, quote.assets, tokenIndex, balancerPoolId, new uint256[](numTokens));
+			}
+		}
+	}
+
+	/**
+	 * Put the loose bpt back into masterChef, unless it is too small to pay for the gas of the deposit.
+	 * Skipped bpt is still valued by balanceOfPooled and goes in with the next deposit.
+	 * note The masterChef deposit fee is left out: it is a share of the bpt, charged the same
+	 * 			whether the leftover goes in now or with the next deposit. Skipping only saves gas.
+	 * @param _position: snapshot used to value the bpt.
+	 * @return _leftover: loose bpt found, deposited or not.
+	 */
+	function _depositLeftoverBpt(Position memory _position) internal returns (uint256 _leftover) {
+		_leftover = balanceOfBpt();
+		if (_leftover == 0) {
+			return 0;
+		}
+		uint256 totalBpt = _position.bpt.add(_position.bptInMasterChef);
+		uint256 value = totalBpt > 0 ? _leftover.mul(_position.pooled).div(totalBpt) : 0;
+		uint256 depositGasCost = ethToWant(masterChefDepositGas.mul(tx.gasprice));
+		if (depositGasCost.mul(basisOne) <= value.mul(maxRedepositCost)) {
+			masterChef.deposit(masterChefPoolId, _leftover);
+			_position.claimed = true;
+		}
 	}
 
 	/**
@@ -344,25 +970,39 @@ contract Strategy is BaseStrategy {
 	 * The operation will revert if the slippage is greater than the set values.
 	 */
 	function liquidateAllPositions() internal override returns (uint256 liquidated) {
-		uint256 eta = estimatedTotalAssets();
+		return _liquidateAllPositions(_position());
+	}
+
+	/**
+	 * Liquidate all position from a snapshot of the strategy position.
+	 * @param _position: snapshot taken since the last state-changing call.
+	 */
+	function _liquidateAllPositions(Position memory _position) internal returns (uint256 liquidated) {
+		uint256 eta = _position.want.add(_position.pooled);
 		// Withdraw all bpt out of masterChef
 		// Withdraw main bpt pool
-		withdrawAndHarvest(masterChefPoolId, balanceOfBptInMasterChef());
+		withdrawAndHarvest(masterChefPoolId, _position.bptInMasterChef);
 		// Withdraw staked bpt pool
-		withdrawAndHarvest(masterChefStakePoolId, balanceOfStakeBptInMasterChef());
+		withdrawAndHarvest(masterChefStakePoolId, _position.stakeBptInMasterChef);
 
 		// Sell all bpt for want
-		exitPoolExactBpt(balanceOfBpt(), assets, tokenIndex, balancerPoolId, minAmountsOut);
+		uint256 bpts = _position.bpt.add(_position.bptInMasterChef);
+		_exitPoolExactBptForWant(bpts);
 		// Exit all staked bpt and get want token
-		exitPoolExactBpt(
-			stakeBpt.balanceOf(address(this)),
-			stakeAssets,
-			stakeWantIndex,
-			stakePoolId,
-			new uint256[](stakeAssets.length)
-		);
+		if (address(stakeBpt) != address(0)) {
+			exitPoolExactBpt(
+				stakeBpt.balanceOf(address(this)),
+				stakeAssets,
+				stakeWantIndex,
+				stakePoolId,
+				new uint256[](stakeAssets.length)
+			);
+		}
+		uint256 exited = balanceOfWant().sub(_position.want);
+		emit Exited(exited, bpts, _position.pooled > exited ? _position.pooled.sub(exited) : 0);
 		// Sell all the claimed and unStaked rewards for want
-		sellRewards();
+		_position.rewards = balanceOfReward();
+		sellRewards(_position);
 
 		liquidated = balanceOfWant();
 		_enforceSlippageOut(eta, liquidated);
@@ -375,8 +1015,11 @@ contract Strategy is BaseStrategy {
 	 */
 	function prepareMigration(address _newStrategy) internal override {
 		_withdrawFromMasterChef(_newStrategy);
-		if (balanceOfReward() > 0) {
-			rewardToken.transfer(_newStrategy, balanceOfReward());
+		for (uint256 r = 0; r < rewardTokens.length; r++) {
+			uint256 balance = rewardTokens[r].balanceOf(address(this));
+			if (balance > 0) {
+				rewardTokens[r].safeTransfer(_newStrategy, balance);
+			}
 		}
 	}
 
@@ -409,67 +1052,222 @@ contract Strategy is BaseStrategy {
 	/**
 	 * Harvest all rewards from masterChef.
 	 * Withdraw a specific amount of LP from masterChef
-	 * note: To harvest all the rewards we need to do a deposit with no amount of LP.
-	 *			 https://docs.mai.finance/functions/smart-contract-functions#staking-rewards
+	 * note: masterChef.withdraw pays out the pending rewards of the pool too,
+	 *			 so no deposit of 0 is needed before it. Nothing is called for 0 LP.
 	 */
 	function withdrawAndHarvest(uint256 _poolId, uint256 _balanceToWithdraw) internal {
-		masterChef.deposit(_poolId, 0);
-		masterChef.withdraw(_poolId, _balanceToWithdraw);
+		if (_balanceToWithdraw > 0) {
+			masterChef.withdraw(_poolId, _balanceToWithdraw);
+		}
 	}
 
 	/**
 	 * Claim all QI rewards from masterChef and stake masterChef
 	 * note: To harvest all the rewards we need to do a deposit with no amount of LP.
 	 *			 https://docs.mai.finance/functions/smart-contract-functions#staking-rewards
+	 * note: Pools without LP are skipped, as are the main pool if a deposit or withdraw already paid
+	 *			 its rewards in this call and the stake pool if unstake is going to withdraw from it.
+	 * @param _position: snapshot taken since the last state-changing call.
 	 */
-	function claimAllRewards() internal {
-		masterChef.deposit(masterChefPoolId, 0);
-		masterChef.deposit(masterChefStakePoolId, 0);
+	function claimAllRewards(Position memory _position) internal {
+		if (!_position.claimed && _position.bptInMasterChef > 0) {
+			masterChef.deposit(masterChefPoolId, 0);
+			_position.claimed = true;
+		}
+		uint256 toUnstake = _position.stakeBptInMasterChef.mul(unstakePercentage).div(basisOne);
+		if (_position.stakeBptInMasterChef > 0 && toUnstake == 0) {
+			masterChef.deposit(masterChefStakePoolId, 0);
+		}
 	}
 
 	/**
-	 * Sell all the Rewards for want token.
-	 * note: The Rewards will only be sold if it economical sense to do so.
+	 * Sell the Rewards for want token.
+	 * All the reward tokens go through a single batchSwap, routes that go through the same
+	 * intermediate asset (e.g. wFTM) share its entry in the assets and are netted by the vault.
+	 * note: The Rewards will only be sold if it economical sense to do so, over minRewardSale of each token
+	 * 			and for more want than the gas of their swap steps. Sales are sized by _rewardSale,
+	 * 			the batchSwap has to pay at least the quoted want within maxSlippageOut.
+	 * @param _position: rewards holds the balance of rewardToken left to sell.
 	 */
-	function sellRewards() internal {
-		uint256 amount = balanceOfReward();
+	function sellRewards(Position memory _position) internal {
+		uint256[] memory amounts = new uint256[](rewardTokens.length);
+		uint256[] memory quoted = new uint256[](rewardTokens.length);
+		uint256 numSteps;
+		uint256 maxAssets;
+		uint256 minOut;
+		{
+			uint256 stepCost = ethToWant(swapStepGas.mul(tx.gasprice));
+			for (uint256 r = 0; r < rewardTokens.length; r++) {
+				IERC20 token = rewardTokens[r];
+				uint256 amount = address(token) == address(rewardToken) ? _position.rewards : token.balanceOf(address(this));
+				if (amount > minRewardSale[address(token)]) {
+					SwapSteps storage route = rewardSwapSteps[address(token)];
+					(uint256 sale, uint256 amountOut) = _rewardSale(route, amount, stepCost);
+					if (sale > 0) {
+						amounts[r] = sale;
+						quoted[r] = amountOut;
+						minOut = minOut.add(amountOut);
+						numSteps = numSteps.add(route.poolIds.length);
+						maxAssets = maxAssets.add(route.assets.length);
+					}
+				}
+			}
+		}
+		if (numSteps == 0) {
+			return;
+		}
 
-		// uint256 decReward = ERC20(address(rewardToken)).decimals();
-		// uint256 decWant = ERC20(address(want)).decimals();
-		if (amount > 10**12) {
-			uint256 length = swapSteps.poolIds.length;
-			IBalancerVault.BatchSwapStep[] memory steps = new IBalancerVault.BatchSwapStep[](length);
-			int256[] memory limits = new int256[](length + 1);
-			limits[0] = int256(amount);
-			for (uint256 j = 0; j < length; j++) {
-				steps[j] = IBalancerVault.BatchSwapStep(swapSteps.poolIds[j], j, j + 1, j == 0 ? amount : 0, abi.encode(0));
+		(IBalancerVault.BatchSwapStep[] memory steps, IAsset[] memory swapAssets, int256[] memory limits) =
+			_rewardSwaps(amounts, numSteps, maxAssets);
+		// Every route ends in want, a negative limit is the least amount received
+		for (uint256 i = 0; i < swapAssets.length; i++) {
+			if (address(swapAssets[i]) == address(want)) {
+				limits[i] = -int256(minOut.mul(basisOne - maxSlippageOut).div(basisOne));
 			}
+		}
+		int256[] memory deltas =
 			balancerVault.batchSwap(
 				IBalancerVault.SwapKind.GIVEN_IN,
 				steps,
-				swapSteps.assets,
+				swapAssets,
 				IBalancerVault.FundManagement(address(this), false, address(this), false),
 				limits,
 				now + 10
 			);
+		uint256 wantOut;
+		for (uint256 i = 0; i < swapAssets.length; i++) {
+			if (address(swapAssets[i]) == address(want)) {
+				wantOut = uint256(-deltas[i]);
+			}
+		}
+		// The batchSwap nets the routes, the want out of each token is its share of the quotes
+		for (uint256 r = 0; r < amounts.length; r++) {
+			if (amounts[r] > 0) {
+				emit RewardsSold(address(rewardTokens[r]), amounts[r], wantOut.mul(quoted[r]).div(minOut));
+			}
+		}
+		// rewardToken is always rewardTokens[0], removeReward never moves it
+		_position.rewards = _position.rewards.sub(amounts[0]);
+	}
+
+	/**
+	 * Size the sale of a reward from one quote along its swap steps.
+	 * The price impact is the shortfall of the quote against the same route quoted for 1/impactProbe
+	 * of the amount. Over maxRewardImpact the sale is scaled down to the cap, impact grows about
+	 * linearly with the size so a few rescalings get close to it. The rest waits for the next harvests.
+	 * A sale that does not pay for the gas of its swap steps is skipped.
+	 * @param _steps: swap steps of the reward
+	 * @param _amount: balance of the reward, over its minRewardSale
+	 * @param _stepCost: gas of one swap step, in want
+	 * @return _sale: amount to sell, 0 to skip the reward
+	 * @return _amountOut: quoted want out of _sale
+	 */
+	function _rewardSale(
+		SwapSteps storage _steps,
+		uint256 _amount,
+		uint256 _stepCost
+	) internal view returns (uint256 _sale, uint256 _amountOut) {
+		_sale = _amount;
+		_amountOut = _quoteSwapSteps(_steps, _sale, 0);
+		uint256 spotOut = _quoteSwapSteps(_steps, _sale.div(impactProbe), 0).mul(impactProbe);
+		// A quote of 0, over the pools max in ratio, is a 100% impact
+		for (
+			uint256 i = 0;
+			i < impactChecks && maxRewardImpact > 0 && _amountOut.mul(basisOne) < spotOut.mul(basisOne - maxRewardImpact);
+			i++
+		) {
+			uint256 impact = spotOut.sub(_amountOut).mul(basisOne).div(spotOut);
+			_sale = _sale.mul(maxRewardImpact).div(impact);
+			spotOut = spotOut.mul(maxRewardImpact).div(impact);
+			_amountOut = _quoteSwapSteps(_steps, _sale, 0);
+		}
+		if (_amountOut <= _stepCost.mul(_steps.poolIds.length)) {
+			return (0, 0);
 		}
 	}
 
+	/**
+	 * Merge the swap steps of the rewards to sell into one batchSwap.
+	 * Each route stays contiguous, every hop after the first swaps the output of the previous one.
+	 * @param _amounts: amount to sell of each reward token, 0 to skip it.
+	 */
+	function _rewardSwaps(
+		uint256[] memory _amounts,
+		uint256 _numSteps,
+		uint256 _maxAssets
+	)
+		internal
+		view
+		returns (
+			IBalancerVault.BatchSwapStep[] memory _steps,
+			IAsset[] memory _assets,
+			int256[] memory _limits
+		)
+	{
+		_steps = new IBalancerVault.BatchSwapStep[](_numSteps);
+		IAsset[] memory assetsFound = new IAsset[](_maxAssets);
+		int256[] memory limitsFound = new int256[](_maxAssets);
+		uint256 numAssets;
+		uint256 k;
+		for (uint256 r = 0; r < _amounts.length; r++) {
+			if (_amounts[r] == 0) {
+				continue;
+			}
+			SwapSteps storage route = rewardSwapSteps[address(rewardTokens[r])];
+			uint256 assetIn;
+			(assetIn, numAssets) = _assetIndex(assetsFound, numAssets, route.assets[0]);
+			limitsFound[assetIn] = limitsFound[assetIn] + int256(_amounts[r]);
+			for (uint256 j = 0; j < route.poolIds.length; j++) {
+				uint256 assetOut;
+				(assetOut, numAssets) = _assetIndex(assetsFound, numAssets, route.assets[j + 1]);
+				_steps[k++] = IBalancerVault.BatchSwapStep(
+					route.poolIds[j],
+					assetIn,
+					assetOut,
+					j == 0 ? _amounts[r] : 0,
+					abi.encode(0)
+				);
+				assetIn = assetOut;
+			}
+		}
+
+		_assets = new IAsset[](numAssets);
+		_limits = new int256[](numAssets);
+		for (uint256 i = 0; i < numAssets; i++) {
+			_assets[i] = assetsFound[i];
+			_limits[i] = limitsFound[i];
+		}
+	}
+
+	/**
+	 * Index of _asset in the first _length entries of _assets, appended if missing.
+	 */
+	function _assetIndex(
+		IAsset[] memory _assets,
+		uint256 _length,
+		IAsset _asset
+	) internal pure returns (uint256 _index, uint256 _newLength) {
+		for (uint256 i = 0; i < _length; i++) {
+			if (address(_assets[i]) == address(_asset)) {
+				return (i, _length);
+			}
+		}
+		_assets[_length] = _asset;
+		return (_length, _length + 1);
+	}
+
 	/**
 	 * This method withdraws assets for masterChef and Pool to collect the profits from trading fees.
 	 * note Deposits on MAI.finance masterChef have a 0.5% fee,
 	 * 			so we should only withdraw from masterChef what is strictly necessary.
-	 * note The wantToLPAmount is not exact so should be used with care and with tolerances.
 	 */
-	function collectTradingFees() internal {
+	function collectTradingFees(Position memory _position) internal {
 		uint256 debt = vault.strategies(address(this)).totalDebt;
-		if (estimatedTotalAssets() > debt) {
-			// Withdraw ONLY the needed bpt out of masterChef
-			masterChef.withdraw(masterChefPoolId, wantToLPAmount(estimatedTotalAssets().sub(debt)));
+		uint256 totalAssets = _position.want.add(_position.pooled);
+		if (totalAssets > debt) {
 			// Exit pool for the profit amount generated
-			exitPoolExactToken(estimatedTotalAssets().sub(debt));
-			// Put remaining bpt back into masterChef
-			masterChef.deposit(masterChefPoolId, balanceOfBpt());
+			_exitPoolForWant(totalAssets.sub(debt), _position);
+			emit TradingFeesCollected(balanceOfWant().sub(_position.want));
 		}
 	}
 
@@ -500,13 +1298,14 @@ contract Strategy is BaseStrategy {
 	 * Withdraw exact amount of Tokens (want) to get from the pool.
 	 * Could revert due to single exit limit enforced by balancer.
 	 * @param  _amountTokenOut: Amount of tokens we want to withdraw from the pool.
+	 * @param  _assets: pool tokens, from getPoolTokens.
 	 */
-	function exitPoolExactToken(uint256 _amountTokenOut) internal {
+	function exitPoolExactToken(uint256 _amountTokenOut, IAsset[] memory _assets) internal {
 		uint256[] memory amountsOut = new uint256[](numTokens);
 		amountsOut[tokenIndex] = _amountTokenOut;
 		bytes memory userData = abi.encode(IBalancerVault.ExitKind.BPT_IN_FOR_EXACT_TOKENS_OUT, amountsOut, balanceOfBpt());
 		IBalancerVault.ExitPoolRequest memory request =
-			IBalancerVault.ExitPoolRequest(assets, minAmountsOut, userData, false);
+			IBalancerVault.ExitPoolRequest(_assets, new uint256[](numTokens), userData, false);
 		balancerVault.exitPool(balancerPoolId, address(this), address(this), request);
 	}
 
@@ -535,6 +1334,13 @@ contract Strategy is BaseStrategy {
 		return false;
 	}
 
+	function _asAssets(IERC20[] memory _tokens) internal pure returns (IAsset[] memory _assets) {
+		_assets = new IAsset[](_tokens.length);
+		for (uint256 i = 0; i < _tokens.length; i++) {
+			_assets[i] = IAsset(address(_tokens[i]));
+		}
+	}
+
 	/**
 	 * Enforce that amount exited didn't slip beyond our tolerance.
 	 * Revert if slippage out exceeds our requirement.
@@ -550,19 +1356,37 @@ contract Strategy is BaseStrategy {
 	 * This function maintains the configure ratio of staked amount.
 	 * The % of staked rewards depends on the stakePercentage.
 	 */
-	function consolidate() internal {
+	function consolidate(Position memory _position) internal {
+		uint256 unstaked;
 		// UnStake a % of staked beets
-		unstake();
+		if (unstake(_position.stakeBptInMasterChef)) {
+			uint256 rewards = balanceOfReward();
+			unstaked = rewards.sub(_position.rewards);
+			_position.rewards = rewards;
+		}
 		// Stake pre-calc amount of QI for higher apy
-		stake(balanceOfReward().mul(stakePercentage).div(basisOne));
+		uint256 toStake = _position.rewards.mul(stakePercentage).div(basisOne);
+		if (stake(toStake)) {
+			_position.rewards = balanceOfReward();
+		} else {
+			toStake = 0;
+		}
+		if (unstaked > 0 || toStake > 0) {
+			emit Consolidated(toStake, unstaked);
+		}
 	}
 
 	/**
 	 * Deposits a certain amount of QI into QI-wFTM beethoven pool.
 	 * Then it deposits those LP into mai.finance masterChef.
+	 * @return _staked: true if the reward balance changed.
 	 */
-	function stake(uint256 _amount) internal {
-		if (joinPool(_amount, stakeAssets, stakeAssets.length, stakeTokenIndex, stakePoolId)) {
+	function stake(uint256 _amount) internal returns (bool _staked) {
+		if (address(stakeBpt) == address(0)) {
+			return false;
+		}
+		_staked = joinPool(_amount, stakeAssets, stakeAssets.length, stakeTokenIndex, stakePoolId);
+		if (_staked) {
 			masterChef.deposit(masterChefStakePoolId, stakeBpt.balanceOf(address(this)));
 		}
 	}
@@ -570,11 +1394,16 @@ contract Strategy is BaseStrategy {
 	/**
 	 * UnStake a % QI-wFTM LP from masterChef.
 	 * Then with the UnStaked LP exits pool with the reward token (QI).
+	 * @return _unstaked: true if the reward balance changed.
 	 */
-	function unstake() internal {
-		uint256 bpts = balanceOfStakeBptInMasterChef().mul(unstakePercentage).div(basisOne);
+	function unstake(uint256 _stakeBptInMasterChef) internal returns (bool _unstaked) {
+		uint256 bpts = _stakeBptInMasterChef.mul(unstakePercentage).div(basisOne);
+		if (bpts == 0) {
+			return false;
+		}
 		withdrawAndHarvest(masterChefStakePoolId, bpts);
 		exitPoolExactBpt(bpts, stakeAssets, stakeTokenIndex, stakePoolId, new uint256[](stakeAssets.length));
+		return true;
 	}
 
 	//--------------------------//
@@ -590,14 +1419,87 @@ contract Strategy is BaseStrategy {
 	}
 
 	/**
-	 * Setups the reward token address.
+	 * Setups a reward token, or updates the steps of one already whitelisted.
+	 * The first reward whitelisted is the masterChef reward (rewardToken).
 	 * Approves reward token transfers.
 	 * Specifies the steps to to sell this reward token for want tokens
 	 */
 	function whitelistReward(address _rewardToken, SwapSteps memory _steps) public onlyVaultManagers {
-		rewardToken = IERC20(_rewardToken);
-		rewardToken.approve(address(balancerVault), type(uint256).max);
-		swapSteps = _steps;
+		_whitelistReward(_rewardToken, _steps);
+	}
+
+	function _whitelistReward(address _rewardToken, SwapSteps memory _steps) internal {
+		require(_steps.assets.length == _steps.poolIds.length + 1 && _steps.poolIds.length > 0, '!steps');
+		require(address(_steps.assets[0]) == _rewardToken, '!steps');
+		require(address(_steps.assets[_steps.poolIds.length]) == address(want), '!steps');
+		if (rewardSwapSteps[_rewardToken].poolIds.length == 0) {
+			rewardTokens.push(IERC20(_rewardToken));
+			minRewardSale[_rewardToken] = defaultMinRewardSale;
+			if (address(rewardToken) == address(0)) {
+				rewardToken = IERC20(_rewardToken);
+			}
+			IERC20(_rewardToken).safeApprove(address(balancerVault), type(uint256).max);
+		}
+		rewardSwapSteps[_rewardToken] = _steps;
+	}
+
+	/**
+	 * Stop selling a reward token, its balance can then be swept.
+	 * The masterChef reward can not be removed.
+	 */
+	function removeReward(address _rewardToken) external onlyVaultManagers {
+		require(_rewardToken != address(rewardToken), '!rewardToken');
+		uint256 length = rewardTokens.length;
+		for (uint256 r = 0; r < length; r++) {
+			if (address(rewardTokens[r]) == _rewardToken) {
+				rewardTokens[r] = rewardTokens[length - 1];
+				rewardTokens.pop();
+				delete rewardSwapSteps[_rewardToken];
+				delete minRewardSale[_rewardToken];
+				IERC20(_rewardToken).safeApprove(address(balancerVault), 0);
+				return;
+			}
+		}
+	}
+
+	/**
+	 * Route a pool token other than want takes to want after a proportional exit,
+	 * 	e.g. through a deeper pool than the strategy pool. Empty steps swap it back through the strategy pool.
+	 */
+	function setExitSwapSteps(address _token, SwapSteps memory _steps) external onlyVaultManagers {
+		require(_token != address(want), '!token');
+		if (_steps.poolIds.length > 0) {
+			require(_steps.assets.length == _steps.poolIds.length + 1, '!steps');
+			require(address(_steps.assets[0]) == _token, '!steps');
+			require(address(_steps.assets[_steps.poolIds.length]) == address(want), '!steps');
+		}
+		exitSwapSteps[_token] = _steps;
+	}
+
+	/**
+	 * Minimum amount of a reward token for sellRewards to sell it.
+	 * @param _minSale: in the reward token decimals
+	 */
+	function setMinRewardSale(address _rewardToken, uint256 _minSale) external onlyVaultManagers {
+		require(rewardSwapSteps[_rewardToken].poolIds.length > 0, '!reward');
+		minRewardSale[_rewardToken] = _minSale;
+	}
+
+	/**
+	 * Cap of the price impact of a reward sale, larger balances are sold over several harvests.
+	 * @param _maxRewardImpact: bips, 0 for no cap
+	 */
+	function setMaxRewardImpact(uint256 _maxRewardImpact) external onlyVaultManagers {
+		require(_maxRewardImpact < basisOne);
+		maxRewardImpact = uint16(_maxRewardImpact);
+	}
+
+	/**
+	 * Wrapped gas token used by ethToWant.
+	 * Has to be one of the reward swap step assets to be priced.
+	 */
+	function setWNative(address _wNative) external onlyVaultManagers {
+		wNative = IERC20(_wNative);
 	}
 
 	/**
@@ -612,14 +1514,26 @@ contract Strategy is BaseStrategy {
 		uint256 _maxSingleDeposit,
 		uint256 _minDepositPeriod
 	) public onlyVaultManagers {
+		_setParams(_maxSlippageIn, _maxSlippageOut, _maxSingleDeposit, _minDepositPeriod);
+	}
+
+	/**
+	 * note maxSingleDeposit over uint128 is stored as uint128 max, both mean no cap.
+	 */
+	function _setParams(
+		uint256 _maxSlippageIn,
+		uint256 _maxSlippageOut,
+		uint256 _maxSingleDeposit,
+		uint256 _minDepositPeriod
+	) internal {
 		require(_maxSlippageIn <= basisOne);
-		maxSlippageIn = _maxSlippageIn;
+		maxSlippageIn = uint16(_maxSlippageIn);
 
 		require(_maxSlippageOut <= basisOne);
-		maxSlippageOut = _maxSlippageOut;
+		maxSlippageOut = uint16(_maxSlippageOut);
 
-		maxSingleDeposit = _maxSingleDeposit;
-		minDepositPeriod = _minDepositPeriod;
+		maxSingleDeposit = uint128(Math.min(_maxSingleDeposit, type(uint128).max));
+		minDepositPeriod = _minDepositPeriod.toUint32();
 	}
 
 	/**
@@ -628,11 +1542,16 @@ contract Strategy is BaseStrategy {
 	function setMasterChef(address _masterChef) public onlyGovernance {
 		_withdrawFromMasterChef(address(this));
 
+		bool staking = address(stakeBpt) != address(0);
 		bpt.approve(address(masterChef), 0);
-		stakeBpt.approve(address(masterChef), 0);
+		if (staking) {
+			stakeBpt.approve(address(masterChef), 0);
+		}
 		masterChef = IQiMasterChef(_masterChef);
 		bpt.approve(address(masterChef), type(uint256).max);
-		stakeBpt.approve(address(masterChef), type(uint256).max);
+		if (staking) {
+			stakeBpt.approve(address(masterChef), type(uint256).max);
+		}
 	}
 
 	/**
@@ -642,8 +1561,13 @@ contract Strategy is BaseStrategy {
 	 *@param _unstakePercentageBips: 10_000 = 100%
 	 */
 	function setStakeParams(uint256 _stakePercentageBips, uint256 _unstakePercentageBips) public onlyVaultManagers {
-		stakePercentage = _stakePercentageBips;
-		unstakePercentage = _unstakePercentageBips;
+		_setStakeParams(_stakePercentageBips, _unstakePercentageBips);
+	}
+
+	function _setStakeParams(uint256 _stakePercentageBips, uint256 _unstakePercentageBips) internal {
+		require(_stakePercentageBips <= basisOne && _unstakePercentageBips <= basisOne);
+		stakePercentage = uint16(_stakePercentageBips);
+		unstakePercentage = uint16(_unstakePercentageBips);
 	}
 
 	/**
@@ -657,13 +1581,24 @@ contract Strategy is BaseStrategy {
 		uint256 _stakeWantIndex,
 		uint256 _masterChefStakePoolId
 	) public onlyVaultManagers {
+		_setStakeInfo(_stakeAssets, _stakePool, _stakeTokenIndex, _stakeWantIndex, _masterChefStakePoolId);
+	}
+
+	function _setStakeInfo(
+		IAsset[] memory _stakeAssets,
+		address _stakePool,
+		uint256 _stakeTokenIndex,
+		uint256 _stakeWantIndex,
+		uint256 _masterChefStakePoolId
+	) internal {
+		require(_stakeTokenIndex < _stakeAssets.length && _stakeWantIndex < _stakeAssets.length);
 		stakeAssets = _stakeAssets;
-		masterChefStakePoolId = _masterChefStakePoolId;
+		masterChefStakePoolId = _masterChefStakePoolId.toUint32();
 		stakeBpt = IBalancerPool(_stakePool);
 		stakePoolId = stakeBpt.getPoolId();
 		stakeBpt.approve(address(masterChef), type(uint256).max);
-		stakeTokenIndex = _stakeTokenIndex;
-		stakeWantIndex = _stakeWantIndex;
+		stakeTokenIndex = uint8(_stakeTokenIndex);
+		stakeWantIndex = uint8(_stakeWantIndex);
 	}
 
 	/**
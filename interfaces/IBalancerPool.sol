@@ -27,11 +27,18 @@ interface IBalancerPool is IERC20 {
 
     function getRate() external view returns (uint256);
 
-    // function onSwap(
-    //     SwapRequest memory swapRequest,
-    //     uint256 balanceTokenIn,
-    //     uint256 balanceTokenOut
-    // ) external view returns (uint256 amount);
+    function getNormalizedWeights() external view returns (uint256[] memory);
+
+    function getSwapFeePercentage() external view returns (uint256);
+
+    // Minimal swap info and two token pools
+    function onSwap(
+        SwapRequest memory swapRequest,
+        uint256 balanceTokenIn,
+        uint256 balanceTokenOut
+    ) external view returns (uint256 amount);
+
+    // General pools
     function onSwap(
         SwapRequest memory swapRequest,
         uint256[] memory balances,
@@ -38,6 +38,18 @@ interface IQiMasterChef {
 	// Info of each pool.
 	function poolInfo(uint256 _pid) external view returns (PoolInfo memory pInf);
 
+	// ERC20 tokens rewarded per block.
+	function rewardPerBlock() external view returns (uint256);
+
+	// Total allocation points. Must be the sum of all allocation points in all pools.
+	function totalAllocPoint() external view returns (uint256);
+
+	// Block number when the ERC20 rewards end.
+	function endBlock() external view returns (uint256);
+
+	// View function to see a user's pending ERC20s.
+	function pending(uint256 _pid, address _user) external view returns (uint256);
+
 	// Deposit LP tokens to Farm for ERC20 allocation.
 	function deposit(uint256 _pid, uint256 _amount) external;
 
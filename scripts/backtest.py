@@ -0,0 +1,348 @@
+"""
+Backtest of strategyConfig entries over a recorded history of the pools and the masterChef.
+
+The history is a single .npy file holding a structured array, one row per
+sample (every block or coarser), with the columns from seriesFields:
+
+- timestamp, block
+- <pool>_balance<i>, <pool>_supply for the strategy pool (main) and every hop
+  of the reward route (hop0, hop1, ...), plus stake when the stake pool is not a hop.
+  Reward prices (QI/wFTM/want) come from the route pool balances.
+- rewardPerBlock, totalAllocPoint, alloc<pid> and lpSupply<pid> for the masterChef
+  pools of the strategy, lpSupply being the lp of everybody else
+
+The file is memory mapped and only the rows where a harvest or a tend happens are
+materialized. The masterChef emission between them is summed with numpy over the
+rows, so multi-year block level histories run in seconds. The strategy logic is
+strategySimulator's, every step is streamed to a csv:
+
+    python scripts/backtest.py history.npy MAI_Concerto MAI_Concerto_staking --out reports/backtest
+    python scripts/backtest.py --from-csv history.csv history.npy
+
+Several configs run on a process pool, one config per worker. Between samples the
+pools are assumed to be arbitraged back to the recorded state, the strategy keeps
+its share of each pool on top of it.
+"""
+import argparse
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+script_dir = os.path.dirname(__file__)
+scripts_dir = os.path.join(script_dir)
+sys.path.append(scripts_dir)
+
+import strategyConfig
+from strategySimulator import StrategySimulator, VaultSimulator, defaultMarket
+
+STEP_COLUMNS = [
+    "timestamp",
+    "block",
+    "action",
+    "ok",
+    "totalAssets",
+    "totalDebt",
+    "wantBalance",
+    "pooled",
+    "rewards",
+    "stakedBpt",
+]
+
+
+def poolLabels(config, market):
+    """{label: pool} of the pools recorded in the history, the stake pool only when it is not a hop."""
+    deployArgs = config["deployArgs"]
+    poolIds = config["whitelistReward"]["steps"][0]
+    pools = {"main": market.pool(deployArgs[2])}
+    for j, poolId in enumerate(poolIds):
+        pools[f"hop{j}"] = market.pool(poolId)
+    if config["stakeInfo"]:
+        stakePool = market.pool(config["stakeInfo"]["stakePool"])
+        if all(stakePool is not pool for pool in pools.values()):
+            pools["stake"] = stakePool
+    return pools
+
+
+def masterChefPids(config):
+    pids = [config["deployArgs"][8]]
+    if config["stakeInfo"]:
+        pids.append(config["stakeInfo"]["masterChefStakePoolId"])
+    return pids
+
+
+def seriesFields(config, market=None):
+    """Column names of a history for config."""
+    market = market or defaultMarket(config)
+    fields = ["timestamp", "block", "rewardPerBlock", "totalAllocPoint"]
+    for label, pool in poolLabels(config, market).items():
+        fields += [f"{label}_balance{i}" for i in range(len(pool.balances))] + [
+            f"{label}_supply"
+        ]
+    for pid in masterChefPids(config):
+        fields += [f"alloc{pid}", f"lpSupply{pid}"]
+    return fields
+
+
+def saveSeries(path, columns):
+    """Writes {column: array} as the structured .npy a backtest reads."""
+    length = len(columns["timestamp"])
+    series = np.empty(length, dtype=[(name, "f8") for name in columns])
+    for name, values in columns.items():
+        series[name] = values
+    np.save(path, series)
+
+
+def csvToSeries(csvPath, path):
+    saveSeries(
+        path, {name: column for name, column in _readCsvColumns(csvPath).items()}
+    )
+
+
+def _readCsvColumns(csvPath):
+    data = np.genfromtxt(csvPath, delimiter=",", names=True, dtype="f8")
+    return {name: data[name] for name in data.dtype.names}
+
+
+class Backtest:
+    """
+    Replays a history through StrategySimulator for one config.
+    @param deposit: want units (with decimals) deposited in the vault at the first sample.
+    """
+
+    def __init__(
+        self,
+        config,
+        seriesPath,
+        deposit,
+        harvestPeriod=86400,
+        tendPeriod=3600,
+        wantDecimals=6,
+    ):
+        self.config = config
+        self.series = np.load(seriesPath, mmap_mode="r")
+        self.strategy = StrategySimulator(
+            config, defaultMarket(config), wantDecimals=wantDecimals
+        )
+        self.vault = VaultSimulator(self.strategy)
+        self.vault.deposit(deposit)
+        self.harvestPeriod = harvestPeriod
+        self.tendPeriod = tendPeriod
+        self.pids = masterChefPids(config)
+
+        missing = set(seriesFields(config, self.market)) - set(self.series.dtype.names)
+        if missing:
+            raise ValueError(f"history is missing {sorted(missing)}")
+
+    @property
+    def market(self):
+        # a reverted step restores a copy of the market with the strategy state
+        return self.strategy.market
+
+    def schedule(self):
+        """Row index and action of every step, harvests win over tends on the same row."""
+        timestamps = self.series["timestamp"]
+        start, end = timestamps[0], timestamps[-1]
+        harvests = np.searchsorted(
+            timestamps, np.arange(start, end + 1, self.harvestPeriod)
+        )
+        tends = (
+            np.searchsorted(timestamps, np.arange(start, end + 1, self.tendPeriod))
+            if self.tendPeriod
+            else []
+        )
+        steps = {int(i): "tend" for i in tends}
+        steps.update({int(i): "harvest" for i in harvests})
+        return sorted(steps.items())
+
+    def accrue(self, fromRow, toRow):
+        """Adds the masterChef emission of rows [fromRow, toRow) to the strategy's accPerShare."""
+        if toRow <= fromRow:
+            return
+        series = self.series
+        rows = slice(fromRow, toRow)
+        blocks = np.diff(series["block"][fromRow : toRow + 1])
+        masterChef = self.market.masterChef
+        for pid in self.pids:
+            supply = series[f"lpSupply{pid}"][rows] + masterChef.amount[pid]
+            reward = (
+                series["rewardPerBlock"][rows]
+                * series[f"alloc{pid}"][rows]
+                / series["totalAllocPoint"][rows]
+            )
+            perShare = np.where(
+                supply > 0, reward * blocks / np.where(supply > 0, supply, 1), 0
+            )
+            masterChef.accPerShare[pid] += float(perShare.sum())
+            masterChef.lastRewardBlock[pid] = int(series["block"][toRow])
+
+    def load(self, row):
+        """Pools, masterChef and clock at a row, with the strategy's own bpt on top of the recorded pools."""
+        sample = self.series[row]
+        market = self.market
+        market.timestamp = float(sample["timestamp"])
+        market.block = int(sample["block"])
+        masterChef = market.masterChef
+        masterChef.rewardPerBlock = float(sample["rewardPerBlock"])
+        masterChef.totalAllocPoint = float(sample["totalAllocPoint"])
+        for pid in self.pids:
+            masterChef.allocPoints[pid] = float(sample[f"alloc{pid}"])
+            masterChef.lpSupply[pid] = float(sample[f"lpSupply{pid}"])
+
+        strategy = self.strategy
+        owned = {id(strategy.pool): strategy.totalBalanceOfBpt()}
+        if strategy.stakePool is not None:
+            owned[
+                id(market.pool(strategy.stakePool))
+            ] = strategy.balanceOfStakeBptInMasterChef()
+        for label, pool in poolLabels(self.config, market).items():
+            supply = float(sample[f"{label}_supply"])
+            scale = (supply + owned.get(id(pool), 0.0)) / supply
+            pool.balances = [
+                float(sample[f"{label}_balance{i}"]) * scale
+                for i in range(len(pool.balances))
+            ]
+            pool.totalSupply = supply * scale
+
+    def run(self, outPath):
+        strategy = self.strategy
+        vault = self.vault
+        startAssets = vault.totalAssets()
+        counts = {"harvest": 0, "tend": 0}
+        lastRow = 0
+        with open(outPath, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(STEP_COLUMNS)
+            for row, action in self.schedule():
+                self.accrue(lastRow, row)
+                lastRow = row
+                self.load(row)
+                if action == "tend" and not strategy.tendTrigger():
+                    continue
+                ok = vault.harvest() if action == "harvest" else vault.tend()
+                counts[action] += ok
+                writer.writerow(
+                    [
+                        self.market.timestamp,
+                        self.market.block,
+                        action,
+                        int(ok),
+                        vault.totalAssets(),
+                        vault.totalDebt,
+                        strategy.wantBalance,
+                        strategy.balanceOfPooled(),
+                        strategy.rewards,
+                        strategy.balanceOfStakeBptInMasterChef(),
+                    ]
+                )
+
+        timestamps = self.series["timestamp"]
+        duration = max(float(timestamps[-1] - timestamps[0]), 1.0)
+        endAssets = vault.totalAssets()
+        return {
+            "harvests": counts["harvest"],
+            "tends": counts["tend"],
+            "reverts": vault.reverts,
+            "startAssets": startAssets,
+            "endAssets": endAssets,
+            "apr": (endAssets - startAssets) / startAssets * (86400 * 365) / duration,
+        }
+
+
+def runConfig(
+    configName, seriesPath, outDir, deposit, harvestPeriod, tendPeriod, stakeParams=None
+):
+    """One backtest, in a worker process when called from compare."""
+    config = strategyConfig.getStrategyConfig(configName, None)
+    if stakeParams is not None:
+        config["stakeParams"] = list(stakeParams)
+    name = configName + (
+        f"_{stakeParams[0]}_{stakeParams[1]}" if stakeParams is not None else ""
+    )
+    outPath = os.path.join(outDir, f"{name}.csv")
+    result = Backtest(config, seriesPath, deposit, harvestPeriod, tendPeriod).run(
+        outPath
+    )
+    return {"name": name, "steps": outPath, **result}
+
+
+def compare(
+    runs,
+    seriesPath,
+    outDir,
+    deposit=100_000 * 10 ** 6,
+    harvestPeriod=86400,
+    tendPeriod=3600,
+    workers=None,
+):
+    """
+    runs: [configName or (configName, stakeParams)], each one backtested on its own process.
+    """
+    os.makedirs(outDir, exist_ok=True)
+    runs = [run if isinstance(run, tuple) else (run, None) for run in runs]
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [
+            pool.submit(
+                runConfig,
+                name,
+                seriesPath,
+                outDir,
+                deposit,
+                harvestPeriod,
+                tendPeriod,
+                stakeParams,
+            )
+            for name, stakeParams in runs
+        ]
+        return [future.result() for future in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("series", help="history .npy")
+    parser.add_argument(
+        "configs", nargs="*", help="strategyConfig entries, name or name:stake:unstake"
+    )
+    parser.add_argument(
+        "--from-csv",
+        metavar="CSV",
+        help="write the CSV history (one column per field) to the .npy and exit",
+    )
+    parser.add_argument("--out", default="reports/backtest")
+    parser.add_argument(
+        "--deposit", type=float, default=100_000, help="want, without decimals"
+    )
+    parser.add_argument("--harvest-period", type=int, default=86400)
+    parser.add_argument("--tend-period", type=int, default=3600)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    if args.from_csv:
+        csvToSeries(args.from_csv, args.series)
+        return
+
+    runs = []
+    for entry in args.configs:
+        name, *stake = entry.split(":")
+        runs.append((name, tuple(int(value) for value in stake)) if stake else name)
+    results = compare(
+        runs,
+        args.series,
+        args.out,
+        args.deposit * 10 ** 6,
+        args.harvest_period,
+        args.tend_period,
+        args.workers,
+    )
+    for result in results:
+        print(
+            f'{result["name"]}: apr {result["apr"] * 100:.2f}%, {result["harvests"]} harvests, {result["tends"]} tends, {result["reverts"]} reverts -> {result["steps"]}'
+        )
+
+
+if __name__ == "__main__":
+    main()
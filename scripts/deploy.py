@@ -1,9 +1,17 @@
 from pathlib import Path
+import sys
+import os
 
-from brownie import Strategy, accounts, config, network, project, web3
+from brownie import BalancerRouting, Strategy, accounts, config, network, project, web3
 from eth_utils import is_checksum_address
 import click
 
+script_dir = os.path.dirname( __file__ )
+strategyReader_dir = os.path.join( script_dir )
+sys.path.append( strategyReader_dir )
+
+from strategyReader import readCalls
+
 API_VERSION = config["dependencies"][0].split("@")[-1]
 Vault = project.load(
     Path.home() / ".brownie" / "packages" / config["dependencies"][0]
@@ -41,18 +49,20 @@ def main():
         print("You should deploy one vault using scripts from Vault project")
         return  # TODO: Deploy one using scripts from Vault project
 
+    token, name, symbol = readCalls([(vault.token, ()), (vault.name, ()), (vault.symbol, ())])
     print(
         f"""
     Strategy Parameters
 
        api: {API_VERSION}
-     token: {vault.token()}
-      name: '{vault.name()}'
-    symbol: '{vault.symbol()}'
+     token: {token}
+      name: '{name}'
+    symbol: '{symbol}'
     """
     )
     publish_source = click.confirm("Verify source on etherscan?")
     if input("Deploy Strategy? y/[N]: ").lower() != "y":
         return
 
+    BalancerRouting.deploy({"from": dev}, publish_source=publish_source)
     Strategy.deploy(vault, {"from": dev}, publish_source=publish_source)
@@ -2,7 +2,7 @@ from pathlib import Path
 import sys
 import os
 
-from brownie import Strategy, accounts, config, network, project, web3, CommonHealthCheck
+from brownie import ZERO_ADDRESS, BalancerRouting, Strategy, StrategyFactory, accounts, config, network, project, web3, CommonHealthCheck
 from eth_utils import is_checksum_address
 import click
 
@@ -11,6 +11,7 @@ strategyConfig_dir = os.path.join( script_dir )
 sys.path.append( strategyConfig_dir )
 
 import strategyConfig
+from strategyReader import readCalls
 
 API_VERSION = config["dependencies"][0].split("@")[-1]
 Vault = project.load(
@@ -43,6 +44,7 @@ def main():
     print(f"You are using: 'dev' [{gov.address}]")
 
     vault = Vault.at("0x162A433068F51e18b7d13932F27e66a3f99E6890")
+    token, name, symbol = readCalls([(vault.token, ()), (vault.name, ()), (vault.symbol, ())])
 
     print(
         f"""
@@ -51,9 +53,9 @@ def main():
 
         api: {API_VERSION}
         vault: {vault}
-        token: {vault.token()}
-        name: '{vault.name()}'
-        symbol: '{vault.symbol()}'
+        token: {token}
+        name: '{name}'
+        symbol: '{symbol}'
 
         """
     )
@@ -87,16 +89,28 @@ def main():
     
 
 
-def addHealthCheck(strategy, gov, deployer):
+def addHealthCheck(strategy, gov, deployer, healthCheck=None):
+    # A CommonHealthCheck keeps limits per strategy, one can be shared by every strategy
+    if healthCheck is None:
+        healthCheck = deployHealthCheck(gov, deployer)
+    strategy.setHealthCheck(healthCheck,{"from":deployer})
+
+    return healthCheck
+
+def deployHealthCheck(gov, deployer):
     healthCheck = CommonHealthCheck.deploy({"from":deployer})
     healthCheck.setGovernance(gov, {"from":deployer})
     healthCheck.setManagement(gov, {"from":deployer})
-    strategy.setHealthCheck(healthCheck,{"from":deployer})
-
     return healthCheck
 
-def deploy(Strategy, deployer, gov ,vault):
-    config = strategyConfig.getStrategyConfig("MAI_Concerto_staking", vault)
+def deployLibraries(deployer):
+    # Strategy links against the last deployed BalancerRouting, one serves every strategy
+    if len(BalancerRouting) == 0:
+        BalancerRouting.deploy({"from": deployer})
+
+def deploy(Strategy, deployer, gov ,vault, stratConfig=None):
+    config = stratConfig or strategyConfig.getStrategyConfig("MAI_Concerto_staking", vault)
+    deployLibraries(deployer)
 
     deployArgs = config["deployArgs"]
     stakeParams = config["stakeParams"]
@@ -110,14 +124,60 @@ def deploy(Strategy, deployer, gov ,vault):
         whitelistReward["steps"],
         {"from": gov}
     )
-    strategy.setStakeInfo(
-        stakeInfo["assets"], 
-        stakeInfo["stakePool"],
-        stakeInfo["stakeTokenIndex"], 
-        stakeInfo["stakeWantIndex"], 
-        stakeInfo["masterChefStakePoolId"], 
-        {"from": gov}
-    )
+    # Configs without a stake pool leave the stake info unset
+    if stakeInfo:
+        strategy.setStakeInfo(
+            stakeInfo["assets"], 
+            stakeInfo["stakePool"],
+            stakeInfo["stakeTokenIndex"], 
+            stakeInfo["stakeWantIndex"], 
+            stakeInfo["masterChefStakePoolId"], 
+            {"from": gov}
+        )
+    strategy.setWNative(config["wNative"], {"from": gov})
     
     return strategy
-    
+
+
+def initParams(config):
+    """Strategy.InitParams of a strategyConfig entry, the deploy arguments after the vault."""
+    return tuple(config["deployArgs"][1:])
+
+def setupParams(config, healthCheck=ZERO_ADDRESS):
+    """Strategy.Setup of a strategyConfig entry, what deploy sends after Strategy.deploy."""
+    stakeInfo = config["stakeInfo"]
+    whitelistReward = config["whitelistReward"]
+    return (
+        config["stakeParams"][0],
+        config["stakeParams"][1],
+        whitelistReward["rewardToken"],
+        whitelistReward["steps"],
+        stakeInfo.get("assets", []),
+        stakeInfo.get("stakePool", ZERO_ADDRESS),
+        stakeInfo.get("stakeTokenIndex", 0),
+        stakeInfo.get("stakeWantIndex", 0),
+        stakeInfo.get("masterChefStakePoolId", 0),
+        config["wNative"],
+        healthCheck,
+    )
+
+def deployFactory(implementation, deployer):
+    """Factory of clones of implementation, a Strategy deployed with deploy."""
+    return StrategyFactory.deploy(implementation, {"from": deployer})
+
+def clone(factory, deployer, vault, stratConfig=None, strategist=None, rewards=None, keeper=None, healthCheck=ZERO_ADDRESS):
+    """
+    Clone and configure a strategy in one transaction.
+    strategist, rewards and keeper default to the deployer, pass a shared health check to reuse it.
+    """
+    config = stratConfig or strategyConfig.getStrategyConfig("MAI_Concerto_staking", vault)
+    tx = factory.clone(
+        vault,
+        strategist or deployer,
+        rewards or deployer,
+        keeper or deployer,
+        initParams(config),
+        setupParams(config, healthCheck),
+        {"from": deployer},
+    )
+    return Strategy.at(tx.events["Cloned"]["strategy"])
@@ -0,0 +1,147 @@
+"""
+Before/after gas report of the strategy entry points.
+
+Runs tests/test_gas.py at two git revisions, each in its own worktree, and prints
+the gas of every entry point and internal function both runs measured:
+
+    python scripts/gasReport.py <before> <after>
+    python scripts/gasReport.py HEAD~1 HEAD --match harvest -- --network ftm-main-fork
+
+A revision can also be a gas report written by a previous run (reports/gas-benchmark.json).
+Revisions older than a benchmark can take it from another one with --tests-from, e.g. the
+first benchmark compared with its parent. The numbers are read from the `-s` output of the
+benchmark, "<entry point>: <gas>" lines each followed by their "    <function>: <gas>" breakdown,
+so every version of the benchmark can be compared.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCHMARK = "tests/test_gas.py"
+
+ENTRY = re.compile(r"^(\S.*?): (\d+)(?: \(.*\))?$")
+BREAKDOWN = re.compile(r"^    (\w+): (\d+)$")
+
+
+def parseOutput(output):
+    """{entry point: gas, "entry point / function": gas} from the printed benchmark."""
+    results = {}
+    entry = None
+    for line in output.splitlines():
+        match = BREAKDOWN.match(line)
+        if match and entry:
+            results[f"{entry} / {match[1]}"] = int(match[2])
+            continue
+        match = ENTRY.match(line)
+        entry = match[1] if match else None
+        if entry:
+            results[entry] = int(match[2])
+    return results
+
+
+def runBenchmark(revision, testsFrom=None, passthrough=()):
+    """Gas of revision, from a gas report file or from the benchmark run in a worktree of the revision."""
+    if os.path.isfile(revision):
+        with open(revision) as f:
+            return json.load(f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        worktree = Path(tmp) / "worktree"
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", str(worktree), revision],
+            cwd=ROOT,
+            check=True,
+        )
+        try:
+            if testsFrom:
+                for path in (BENCHMARK, "tests/util.py"):
+                    source = subprocess.run(
+                        ["git", "show", f"{testsFrom}:{path}"],
+                        cwd=ROOT,
+                        check=True,
+                        capture_output=True,
+                    )
+                    (worktree / path).write_bytes(source.stdout)
+            run = subprocess.run(
+                ["brownie", "test", BENCHMARK, "-s", *passthrough],
+                cwd=worktree,
+                capture_output=True,
+                text=True,
+            )
+        finally:
+            subprocess.run(
+                ["git", "worktree", "remove", "--force", str(worktree)],
+                cwd=ROOT,
+                check=True,
+            )
+    results = parseOutput(run.stdout)
+    if run.returncode:
+        print(
+            f"{BENCHMARK} failed at {revision}, comparing the {len(results)} entries it measured",
+            file=sys.stderr,
+        )
+        print(run.stdout[-2_000:], file=sys.stderr)
+    return results
+
+
+def report(before, after, match=None):
+    """Markdown table of the entries measured in both runs, then the ones only one of them measured."""
+    names = [
+        name
+        for name in after
+        if name in before and (not match or re.search(match, name))
+    ]
+    lines = ["| Entry point | Before | After | Change | |", "|---|---:|---:|---:|---:|"]
+    for name in names:
+        change = after[name] - before[name]
+        percent = f"{change / before[name]:+.1%}" if before[name] else ""
+        lines.append(
+            f"| `{name}` | {before[name]} | {after[name]} | {change:+d} | {percent} |"
+        )
+    for label, only in (
+        ("before", set(before) - set(after)),
+        ("after", set(after) - set(before)),
+    ):
+        only = sorted(name for name in only if not match or re.search(match, name))
+        if only:
+            lines.append(
+                f"\nOnly measured {label}: {', '.join(f'`{name}`' for name in only)}"
+            )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("before", help="git revision or gas report file")
+    parser.add_argument("after", help="git revision or gas report file")
+    parser.add_argument(
+        "--tests-from",
+        help=f"revision to take {BENCHMARK} and tests/util.py from, for both runs",
+    )
+    parser.add_argument(
+        "--match", help="only the entries matching this regular expression"
+    )
+    parser.add_argument("--out", help="also write both runs to this json file")
+    argv = sys.argv[1:] if argv is None else argv
+    passthrough = argv[argv.index("--") + 1 :] if "--" in argv else []
+    args = parser.parse_args(argv[: argv.index("--")] if "--" in argv else argv)
+
+    before = runBenchmark(args.before, args.tests_from, passthrough)
+    after = runBenchmark(args.after, args.tests_from, passthrough)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"before": before, "after": after}, f, indent=2, sort_keys=True)
+    print(report(before, after, args.match))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
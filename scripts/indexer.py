@@ -0,0 +1,354 @@
+"""
+Incremental log indexer for a strategy into a local SQLite file.
+
+Pulls the logs of the strategy, its yearn vault, the Qi masterChef pools of the
+strategy and the Beethoven pool balances by block range, decodes them and
+appends them to the database. Every window is committed together with its
+checkpoint, so a run resumes where the last one stopped:
+
+    INDEXER_STRATEGY=0xStrategy:MAI_Concerto_staking INDEXER_DB=reports/index.sqlite brownie run indexer --network ftm-main
+
+Queries then run on the local file, e.g. the harvest profit per week:
+
+    INDEXER_DB=reports/index.sqlite INDEXER_QUERY=weeklyProfit brownie run indexer
+
+Logs are read with one eth_getLogs per source and window. The window shrinks
+when the node refuses a range and grows back after windows with few logs.
+"""
+import json
+import logging
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from brownie import Contract, MockQiMasterChef, Strategy, interface, web3
+from hexbytes import HexBytes
+from web3._utils.events import get_event_data
+
+script_dir = os.path.dirname(__file__)
+scripts_dir = os.path.join(script_dir)
+sys.path.append(scripts_dir)
+
+import strategyConfig
+from strategyReader import ERC20_ABI
+
+log = logging.getLogger("indexer")
+
+# Events of contracts outside this project, same signatures as yearn vault 0.4.x and the Balancer V2 vault
+VAULT_EVENTS = [
+    {
+        "name": "StrategyReported",
+        "type": "event",
+        "anonymous": False,
+        "inputs": [
+            {"name": "strategy", "type": "address", "indexed": True},
+            {"name": "gain", "type": "uint256", "indexed": False},
+            {"name": "loss", "type": "uint256", "indexed": False},
+            {"name": "debtPaid", "type": "uint256", "indexed": False},
+            {"name": "totalGain", "type": "uint256", "indexed": False},
+            {"name": "totalLoss", "type": "uint256", "indexed": False},
+            {"name": "totalDebt", "type": "uint256", "indexed": False},
+            {"name": "debtAdded", "type": "uint256", "indexed": False},
+            {"name": "debtRatio", "type": "uint256", "indexed": False},
+        ],
+    },
+    {
+        "name": "Transfer",
+        "type": "event",
+        "anonymous": False,
+        "inputs": [
+            {"name": "sender", "type": "address", "indexed": True},
+            {"name": "receiver", "type": "address", "indexed": True},
+            {"name": "value", "type": "uint256", "indexed": False},
+        ],
+    },
+]
+BALANCER_EVENTS = [
+    {
+        "name": "Swap",
+        "type": "event",
+        "anonymous": False,
+        "inputs": [
+            {"name": "poolId", "type": "bytes32", "indexed": True},
+            {"name": "tokenIn", "type": "address", "indexed": True},
+            {"name": "tokenOut", "type": "address", "indexed": True},
+            {"name": "amountIn", "type": "uint256", "indexed": False},
+            {"name": "amountOut", "type": "uint256", "indexed": False},
+        ],
+    },
+    {
+        "name": "PoolBalanceChanged",
+        "type": "event",
+        "anonymous": False,
+        "inputs": [
+            {"name": "poolId", "type": "bytes32", "indexed": True},
+            {"name": "liquidityProvider", "type": "address", "indexed": True},
+            {"name": "tokens", "type": "address[]", "indexed": False},
+            {"name": "deltas", "type": "int256[]", "indexed": False},
+            {"name": "protocolFeeAmounts", "type": "uint256[]", "indexed": False},
+        ],
+    },
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    block INTEGER, logIndex INTEGER, tx TEXT, source TEXT, name TEXT, args TEXT,
+    PRIMARY KEY (block, logIndex)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS eventsByName ON events (source, name, block);
+CREATE TABLE IF NOT EXISTS blocks (block INTEGER PRIMARY KEY, timestamp INTEGER);
+CREATE TABLE IF NOT EXISTS harvests (
+    block INTEGER PRIMARY KEY, timestamp INTEGER, profit REAL, loss REAL, debtPayment REAL, debtOutstanding REAL
+);
+CREATE TABLE IF NOT EXISTS poolBalances (
+    block INTEGER, poolId TEXT, token TEXT, balance REAL, PRIMARY KEY (block, poolId, token)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS checkpoints (name TEXT PRIMARY KEY, block INTEGER);
+"""
+
+QUERIES = {
+    "weeklyProfit": """
+        SELECT strftime('%Y-%W', timestamp, 'unixepoch') AS week, COUNT(*) AS harvests, SUM(profit) AS profit, SUM(loss) AS loss
+        FROM harvests GROUP BY week ORDER BY week
+    """,
+}
+
+
+@dataclass
+class Source:
+    """Logs of one or more addresses, filtered by topics and decoded with the given event ABIs."""
+
+    name: str
+    addresses: list
+    events: list
+    topics: list = None  # extra topics after topic0, None matches anything
+
+    def __post_init__(self):
+        self.byTopic = {
+            eventTopic(event): event
+            for event in self.events
+            if event["type"] == "event"
+        }
+
+    def filter(self, fromBlock, toBlock):
+        return {
+            "address": self.addresses,
+            "fromBlock": fromBlock,
+            "toBlock": toBlock,
+            "topics": [list(self.byTopic)] + (self.topics or []),
+        }
+
+    def decode(self, entry):
+        event = self.byTopic.get(toHex(entry["topics"][0]) if entry["topics"] else None)
+        if event is None:
+            return None
+        return get_event_data(web3.codec, event, entry)
+
+
+def toHex(value):
+    return "0x" + bytes(HexBytes(value)).hex()
+
+
+def eventTopic(event):
+    signature = f'{event["name"]}({",".join(arg["type"] for arg in event["inputs"])})'
+    return toHex(web3.keccak(text=signature))
+
+
+def topicOf(value):
+    return toHex(
+        int(value).to_bytes(32, "big")
+        if isinstance(value, int)
+        else bytes(HexBytes(value)).rjust(32, b"\0")
+    )
+
+
+def jsonArgs(args):
+    def convert(value):
+        if isinstance(value, (bytes, bytearray)):
+            return toHex(value)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return str(value)  # exact, sqlite integers stop at 2**63
+        if isinstance(value, (list, tuple)):
+            return [convert(item) for item in value]
+        return value
+
+    return json.dumps({key: convert(value) for key, value in args.items()})
+
+
+class Indexer:
+    def __init__(self, strategy, config, dbPath, window=10_000, minWindow=100):
+        self.strategy = strategy
+        self.db = sqlite3.connect(dbPath)
+        self.db.executescript(SCHEMA)
+        self.window = window
+        self.maxWindow = window
+        self.minWindow = minWindow
+
+        deployArgs = config["deployArgs"]
+        vault = strategy.vault()
+        self.wantDecimals = Contract.from_abi(
+            "ERC20", strategy.want(), ERC20_ABI, persist=False
+        ).decimals()
+        self.balancerVault = interface.IBalancerVault(deployArgs[1])
+        self.poolIds = [interface.IBalancerPool(deployArgs[2]).getPoolId()]
+        pids = [deployArgs[8]]
+        if config["stakeInfo"]:
+            self.poolIds.append(
+                interface.IBalancerPool(config["stakeInfo"]["stakePool"]).getPoolId()
+            )
+            pids.append(config["stakeInfo"]["masterChefStakePoolId"])
+
+        self.sources = [
+            Source("strategy", [strategy.address], Strategy.abi),
+            Source("vault", [vault], VAULT_EVENTS),
+            # Deposit(user, pid, amount): pid is the second indexed topic
+            Source(
+                "masterChef",
+                [deployArgs[3]],
+                MockQiMasterChef.abi,
+                [None, [topicOf(pid) for pid in pids]],
+            ),
+            Source(
+                "balancer",
+                [deployArgs[1]],
+                BALANCER_EVENTS,
+                [[topicOf(poolId) for poolId in self.poolIds]],
+            ),
+        ]
+
+    def checkpoint(self):
+        row = self.db.execute(
+            "SELECT block FROM checkpoints WHERE name = ?", (self.strategy.address,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def run(self, fromBlock=0, toBlock=None):
+        """Index up to toBlock (the latest block by default), from the checkpoint or fromBlock."""
+        toBlock = web3.eth.block_number if toBlock is None else toBlock
+        checkpoint = self.checkpoint()
+        start = checkpoint + 1 if checkpoint is not None else fromBlock
+        while start <= toBlock:
+            end = min(start + self.window - 1, toBlock)
+            try:
+                logs = [
+                    (source, entry)
+                    for source in self.sources
+                    for entry in web3.eth.get_logs(source.filter(start, end))
+                ]
+            except Exception as error:  # range or result limits of the node, the error type depends on the provider
+                if self.window <= self.minWindow:
+                    raise
+                self.window = max(self.window // 2, self.minWindow)
+                log.info(f"{start}-{end}: {error}, window down to {self.window}")
+                continue
+            self.store(start, end, logs)
+            log.info(f"{start}-{end}: {len(logs)} logs")
+            if len(logs) < 1_000:
+                self.window = min(self.window * 2, self.maxWindow)
+            start = end + 1
+        return self
+
+    def store(self, start, end, logs):
+        events = []
+        for source, entry in logs:
+            event = source.decode(entry)
+            if event is not None:
+                events.append((source.name, event))
+        timestamps = self.timestamps(
+            {event["blockNumber"] for _, event in events} | {end}
+        )
+        balances = self.poolBalances(end)
+
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO blocks VALUES (?, ?)", timestamps.items()
+            )
+            self.db.executemany(
+                "INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        event["blockNumber"],
+                        event["logIndex"],
+                        toHex(event["transactionHash"]),
+                        name,
+                        event["event"],
+                        jsonArgs(event["args"]),
+                    )
+                    for name, event in events
+                ],
+            )
+            scale = 10 ** self.wantDecimals
+            self.db.executemany(
+                "INSERT OR REPLACE INTO harvests VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        event["blockNumber"],
+                        timestamps[event["blockNumber"]],
+                        event["args"]["profit"] / scale,
+                        event["args"]["loss"] / scale,
+                        event["args"]["debtPayment"] / scale,
+                        event["args"]["debtOutstanding"] / scale,
+                    )
+                    for name, event in events
+                    if name == "strategy" and event["event"] == "Harvested"
+                ],
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO poolBalances VALUES (?, ?, ?, ?)",
+                [(end, *row) for row in balances],
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?)",
+                (self.strategy.address, end),
+            )
+
+    def timestamps(self, blocks):
+        with ThreadPoolExecutor(8) as pool:
+            return dict(
+                zip(
+                    blocks,
+                    pool.map(
+                        lambda block: web3.eth.get_block(block)["timestamp"], blocks
+                    ),
+                )
+            )
+
+    def poolBalances(self, block):
+        """Pool balances at the end of the window, the logs give the changes in between."""
+        rows = []
+        for poolId in self.poolIds:
+            tokens, balances, _ = self.balancerVault.getPoolTokens.call(
+                poolId, block_identifier=block
+            )
+            rows += [
+                (toHex(poolId), token, balance / 1e18)
+                for token, balance in zip(tokens, balances)
+            ]
+        return rows
+
+
+def query(dbPath, name):
+    db = sqlite3.connect(dbPath)
+    cursor = db.execute(QUERIES[name])
+    return [column[0] for column in cursor.description], cursor.fetchall()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    dbPath = os.getenv("INDEXER_DB", "reports/index.sqlite")
+    if os.getenv("INDEXER_QUERY"):
+        header, rows = query(dbPath, os.getenv("INDEXER_QUERY"))
+        print("\t".join(header))
+        for row in rows:
+            print("\t".join(str(value) for value in row))
+        return
+
+    address, configName = os.getenv("INDEXER_STRATEGY").split(":")
+    strategy = Strategy.at(address)
+    config = strategyConfig.getStrategyConfig(configName, strategy.vault())
+    indexer = Indexer(
+        strategy, config, dbPath, int(os.getenv("INDEXER_WINDOW", 10_000))
+    )
+    indexer.run(int(os.getenv("INDEXER_FROM_BLOCK", 0)))
@@ -0,0 +1,337 @@
+"""
+Keeper for the strategies of this repo.
+
+Polls each strategy, values what a harvest would realize (pending QI from the
+masterChef accrual math, loose rewards and trading fees, priced along the
+strategy's getSwapSteps route) and only calls harvest or tend when that beats
+the gas cost by a margin:
+
+    KEEPER_ACCOUNT=keeper KEEPER_STRATEGIES=0xStrategy:MAI_Concerto_staking brownie run keeper --network ftm-main
+
+Strategies are served from one asyncio loop, at most KEEPER_CONCURRENCY of them
+hitting the node at once. Brownie calls are blocking and run in worker threads,
+transactions are sent one at a time from the keeper account.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass
+
+from brownie import Contract, accounts, interface, web3
+
+script_dir = os.path.dirname(__file__)
+scripts_dir = os.path.join(script_dir)
+sys.path.append(scripts_dir)
+
+import strategyConfig
+from strategyReader import StrategyReader, getMulticall, readCalls
+from strategySimulator import Revert, WeightedPool
+
+YEAR = 86400 * 365
+ACC_PRECISION = 10 ** 12  # masterChef accERC20PerShare precision
+WFTM = "0x21be370D5312f44cB42ce377BC9b8a0cEF1A4C83"
+
+log = logging.getLogger("keeper")
+
+
+@dataclass
+class KeeperSettings:
+    pollInterval: int = 300  # seconds between checks of a strategy
+    concurrency: int = 8  # strategies read at the same time
+    profitMargin: float = 0.5  # profit has to beat gas * (1 + profitMargin)
+    harvestInterval: int = (
+        86400  # expected time a tended deposit earns before the next harvest
+    )
+    blockTime: float = 1.0  # seconds, for the masterChef emission rate
+    nativeToken: str = WFTM  # gas token, priced along the swap route
+    dryRun: bool = False
+
+    @classmethod
+    def fromEnv(cls):
+        return cls(
+            pollInterval=int(os.getenv("KEEPER_POLL_INTERVAL", cls.pollInterval)),
+            concurrency=int(os.getenv("KEEPER_CONCURRENCY", cls.concurrency)),
+            profitMargin=float(os.getenv("KEEPER_PROFIT_MARGIN", cls.profitMargin)),
+            harvestInterval=int(
+                os.getenv("KEEPER_HARVEST_INTERVAL", cls.harvestInterval)
+            ),
+            blockTime=float(os.getenv("KEEPER_BLOCK_TIME", cls.blockTime)),
+            nativeToken=os.getenv("KEEPER_NATIVE_TOKEN", cls.nativeToken),
+            dryRun=os.getenv("KEEPER_DRY_RUN", "") not in ("", "0", "false"),
+        )
+
+
+def pendingReward(
+    userAmount,
+    rewardDebt,
+    accPerShare,
+    lastRewardBlock,
+    allocPoint,
+    lpSupply,
+    rewardPerBlock,
+    totalAllocPoint,
+    block,
+    endBlock,
+):
+    """masterChef.pending from poolInfo and userInfo, same integer math as the farm."""
+    lastBlock = min(block, endBlock)
+    if lpSupply > 0 and lastBlock > lastRewardBlock and totalAllocPoint > 0:
+        reward = (
+            (lastBlock - lastRewardBlock)
+            * rewardPerBlock
+            * allocPoint
+            // totalAllocPoint
+        )
+        accPerShare += reward * ACC_PRECISION // lpSupply
+    return userAmount * accPerShare // ACC_PRECISION - rewardDebt
+
+
+class StrategyWatch:
+    """One strategy served by the keeper, with the contracts it needs cached."""
+
+    def __init__(self, strategy, config, multicall):
+        self.strategy = strategy
+        self.reader = StrategyReader(strategy, multicall)
+        self.multicall = multicall
+
+        deployArgs = config["deployArgs"]
+        self.balancerVault = interface.IBalancerVault(deployArgs[1])
+        self.masterChef = interface.IQiMasterChef(deployArgs[3])
+        self.pids = [deployArgs[8]]
+        if config["stakeInfo"]:
+            self.pids.append(config["stakeInfo"]["masterChefStakePoolId"])
+
+        state = self.reader.snapshot()
+        self.swapPoolIds = state.swapPoolIds
+        self.swapAssets = [asset.lower() for asset in state.swapAssets]
+        pools = readCalls(
+            [(self.balancerVault.getPool, (poolId,)) for poolId in self.swapPoolIds],
+            multicall,
+        )
+        self.swapPools = [interface.IBalancerPool(pool[0]) for pool in pools]
+        # Weights and fees do not change, only the balances are read on each check
+        static = readCalls(
+            [(pool.getNormalizedWeights, ()) for pool in self.swapPools]
+            + [(pool.getSwapFeePercentage, ()) for pool in self.swapPools]
+            + [(self.masterChef.poolInfo, (pid,)) for pid in self.pids],
+            multicall,
+        )
+        hops = len(self.swapPools)
+        self.weights = [
+            [weight / 1e18 for weight in weights] for weights in static[:hops]
+        ]
+        self.swapFees = [fee / 1e18 for fee in static[hops : 2 * hops]]
+        self.lpTokens = [
+            interface.IERC20(poolInfo[0]) for poolInfo in static[2 * hops :]
+        ]
+        self.lastAction = None
+
+    def read(self):
+        """Strategy snapshot plus everything the estimates need, in two aggregate calls."""
+        state = self.reader.snapshot()
+        masterChef = self.masterChef
+        calls = (
+            [(masterChef.poolInfo, (pid,)) for pid in self.pids]
+            + [(masterChef.userInfo, (pid, self.strategy)) for pid in self.pids]
+            + [(lpToken.balanceOf, (masterChef,)) for lpToken in self.lpTokens]
+            + [
+                (self.balancerVault.getPoolTokens, (poolId,))
+                for poolId in self.swapPoolIds
+            ]
+            + [
+                (masterChef.rewardPerBlock, ()),
+                (masterChef.totalAllocPoint, ()),
+                (masterChef.endBlock, ()),
+            ]
+        )
+        results = readCalls(calls, self.multicall, state.block)
+        n = len(self.pids)
+        hops = len(self.swapPoolIds)
+        return state, {
+            "poolInfo": results[:n],
+            "userInfo": results[n : 2 * n],
+            "lpSupply": results[2 * n : 3 * n],
+            "poolTokens": results[3 * n : 3 * n + hops],
+            "rewardPerBlock": results[-3],
+            "totalAllocPoint": results[-2],
+            "endBlock": results[-1],
+        }
+
+    def pendingRewards(self, state, chain):
+        total = 0
+        for poolInfo, userInfo, lpSupply in zip(
+            chain["poolInfo"], chain["userInfo"], chain["lpSupply"]
+        ):
+            total += pendingReward(
+                userInfo[0],
+                userInfo[1],
+                poolInfo[3],
+                poolInfo[2],
+                poolInfo[1],
+                lpSupply,
+                chain["rewardPerBlock"],
+                chain["totalAllocPoint"],
+                state.block,
+                chain["endBlock"],
+            )
+        return total
+
+    def rewardRate(self, chain):
+        """Reward tokens per block paid to the strategy on the main pool."""
+        poolInfo, userInfo, lpSupply = (
+            chain["poolInfo"][0],
+            chain["userInfo"][0],
+            chain["lpSupply"][0],
+        )
+        if lpSupply == 0 or chain["totalAllocPoint"] == 0:
+            return 0
+        return (
+            chain["rewardPerBlock"]
+            * poolInfo[1]
+            / chain["totalAllocPoint"]
+            * userInfo[0]
+            / lpSupply
+        )
+
+    def quote(self, chain, amountIn, fromAsset=None):
+        """Want out for amountIn of a route asset (the reward token by default), hop by hop along getSwapSteps."""
+        start = self.swapAssets.index(fromAsset.lower()) if fromAsset else 0
+        amount = amountIn
+        for hop in range(start, len(self.swapPoolIds)):
+            if amount <= 0:
+                return 0
+            tokens, balances, _ = chain["poolTokens"][hop]
+            pool = WeightedPool(
+                tokens, balances, self.weights[hop], self.swapFees[hop], 1
+            )
+            amount = pool.outGivenIn(
+                pool.index(self.swapAssets[hop]),
+                pool.index(self.swapAssets[hop + 1]),
+                amount,
+            )
+        return amount
+
+
+class Keeper:
+    def __init__(self, account, watches, settings):
+        self.account = account
+        self.watches = watches
+        self.settings = settings
+        self.txLock = asyncio.Lock()
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self.settings.concurrency)
+        await asyncio.gather(*(self.serve(watch, semaphore) for watch in self.watches))
+
+    async def serve(self, watch, semaphore):
+        while True:
+            try:
+                async with semaphore:
+                    action, reason = await asyncio.to_thread(self.check, watch)
+                if action:
+                    async with self.txLock:
+                        await asyncio.to_thread(self.send, watch, action, reason)
+            except Exception:
+                log.exception(f"{watch.strategy.address}: check failed")
+            await asyncio.sleep(self.settings.pollInterval)
+
+    def gasCost(self, watch, chain, method):
+        """Gas of the call in want, None if the call would revert."""
+        try:
+            gas = method.estimate_gas({"from": self.account})
+        except Exception:
+            return None
+        nativeCost = gas * web3.eth.gas_price
+        if self.settings.nativeToken.lower() not in watch.swapAssets:
+            raise ValueError(
+                f"{self.settings.nativeToken} is not on the swap route of {watch.strategy.address}"
+            )
+        return watch.quote(chain, nativeCost, self.settings.nativeToken)
+
+    def check(self, watch):
+        """Returns ("harvest" | "tend" | None, reason)."""
+        settings = self.settings
+        state, chain = watch.read()
+        params = state.vaultParams
+        if params.activation == 0 or (params.debtRatio == 0 and params.totalDebt == 0):
+            return None, "inactive"
+
+        rewards = watch.pendingRewards(state, chain) + state.balanceOfReward
+        tradingFees = max(state.estimatedTotalAssets - params.totalDebt, 0)
+        try:
+            profit = watch.quote(chain, rewards) + tradingFees
+        except Revert:
+            profit = tradingFees  # rewards too large for the route, harvest would fail to sell them too
+
+        sinceReport = state.timestamp - params.lastReport
+        if sinceReport >= state.minReportDelay:
+            harvestCost = self.gasCost(watch, chain, watch.strategy.harvest)
+            if harvestCost is not None:
+                if sinceReport >= state.maxReportDelay:
+                    return (
+                        "harvest",
+                        f"maxReportDelay, profit {state.toUnits(profit):.2f}",
+                    )
+                if profit > harvestCost * (1 + settings.profitMargin):
+                    return (
+                        "harvest",
+                        f"profit {state.toUnits(profit):.2f} > gas {state.toUnits(harvestCost):.4f}",
+                    )
+
+        # Tending pays off by earning rewards on the loose want until the next harvest
+        if (
+            state.balanceOfWant > 0
+            and state.timestamp - state.lastDepositTime > state.minDepositPeriod
+        ):
+            tendCost = self.gasCost(watch, chain, watch.strategy.tend)
+            if tendCost is not None and state.balanceOfPooled > 0:
+                # One block of rewards is priced at about spot, scaled to a year
+                yearlyRewards = (
+                    watch.quote(chain, watch.rewardRate(chain))
+                    * YEAR
+                    / settings.blockTime
+                )
+                earned = (
+                    state.balanceOfWant
+                    * yearlyRewards
+                    / state.balanceOfPooled
+                    * settings.harvestInterval
+                    / YEAR
+                )
+                if earned > tendCost * (1 + settings.profitMargin):
+                    return (
+                        "tend",
+                        f"earns {state.toUnits(earned):.2f} > gas {state.toUnits(tendCost):.4f}",
+                    )
+
+        return None, f"profit {state.toUnits(profit):.2f}"
+
+    def send(self, watch, action, reason):
+        log.info(f"{watch.strategy.address}: {action} ({reason})")
+        if self.settings.dryRun:
+            return
+        tx = getattr(watch.strategy, action)({"from": self.account})
+        watch.lastAction = (action, tx.txid, time.time())
+        log.info(f"{watch.strategy.address}: {action} {tx.txid} gas {tx.gas_used}")
+
+
+def loadWatches(targets, multicall):
+    """targets: "address:configName,address:configName" """
+    watches = []
+    for target in targets.split(","):
+        address, configName = target.split(":")
+        strategy = Contract(address)
+        config = strategyConfig.getStrategyConfig(configName, strategy.vault())
+        watches.append(StrategyWatch(strategy, config, multicall))
+    return watches
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    settings = KeeperSettings.fromEnv()
+    account = accounts.load(os.getenv("KEEPER_ACCOUNT"))
+    watches = loadWatches(os.getenv("KEEPER_STRATEGIES"), getMulticall())
+    log.info(f"serving {len(watches)} strategies from {account.address}")
+    asyncio.run(Keeper(account, watches, settings).run())
@@ -0,0 +1,162 @@
+import sys
+import os
+
+from brownie import (
+    MockERC20,
+    MockWrappedNative,
+    MockBalancerVault,
+    MockWeightedPool,
+    MockQiMasterChef,
+    chain,
+)
+
+try:
+    from eth_abi import encode
+except ImportError:
+    from eth_abi import encode_abi as encode
+
+script_dir = os.path.dirname(__file__)
+strategyConfig_dir = os.path.join(script_dir)
+sys.path.append(strategyConfig_dir)
+
+import strategyConfig
+
+# Local stand-ins for the Fantom protocols the strategy talks to.
+# Deployed on a plain development network so the test suite runs without a fork.
+# Pools, weights and fees are an approximation of the Beethoven pools on Fantom.
+
+# Fantom addresses and pool ids used in strategyConfig.py
+FORK_ADDRESSES = {
+    "usdc": "0x04068DA6C83AFCFA0e13ba15A6696662335D5B75",
+    "qi": "0x68Aa691a8819B07988B18923F712F3f4C8d36346",
+    "wftm": "0x21be370D5312f44cB42ce377BC9b8a0cEF1A4C83",
+    "balancerVault": "0x20dd72Ed959b6147912C2e529F0a0C651c33c9ce",
+    "maiConcerto": "0x985976228a4685ac4ecb0cfdbeed72154659b6d9",
+    "qiMajor": "0x7aE6A223cde3A17E0B95626ef71A2DB5F03F540A",
+    "masterChef": "0x230917f8a262bF9f2C3959eC495b11D1B7E1aFfC",
+}
+FORK_POOL_IDS = {
+    "qiMajor": "0x7ae6a223cde3a17e0b95626ef71a2db5f03f540a00020000000000000000008a",
+    "fantomOfTheOpera": "0xcdf68a4d525ba2e90fe959c74330430a5a6b8226000200000000000000000008",
+}
+
+ONE = 10 ** 18
+DEPOSIT_FEE_BP = 50  # 0.5% masterChef deposit fee
+QI_PER_BLOCK = ONE  # QI emitted per block by the masterChef
+JOIN_KIND_INIT = 0
+
+
+def deploy(deployer):
+    tx = {"from": deployer}
+
+    usdc = MockERC20.deploy("USD Coin", "USDC", 6, tx)
+    mai = MockERC20.deploy("Mai Stablecoin", "miMATIC", 18, tx)
+    wftm = MockWrappedNative.deploy("Wrapped Fantom", "WFTM", tx)
+    qi = MockERC20.deploy("Qi Dao", "QI", 18, tx)
+    balancerVault = MockBalancerVault.deploy(tx)
+
+    # MAI Concerto: USDC 50% / MAI 50%
+    maiConcerto = deployPool(
+        balancerVault,
+        "MAI Concerto",
+        "BPT-MAIC",
+        [usdc, mai],
+        [ONE // 2, ONE // 2],
+        ONE // 1000,
+        [10_000_000 * 10 ** 6, 10_000_000 * ONE],
+        deployer,
+    )
+    # Qi Major: wFTM 40% / QI 60%, wFTM at 2$ and QI at 1$
+    qiMajor = deployPool(
+        balancerVault,
+        "Qi Major",
+        "BPT-QIMAJOR",
+        [wftm, qi],
+        [4 * ONE // 10, 6 * ONE // 10],
+        3 * ONE // 1000,
+        [1_000_000 * ONE, 3_000_000 * ONE],
+        deployer,
+    )
+    # Fantom of the Opera: wFTM 70% / USDC 30%
+    fantomOfTheOpera = deployPool(
+        balancerVault,
+        "Fantom of the Opera",
+        "BPT-FOTO",
+        [wftm, usdc],
+        [7 * ONE // 10, 3 * ONE // 10],
+        2 * ONE // 1000,
+        [7_000_000 * ONE, 6_000_000 * 10 ** 6],
+        deployer,
+    )
+
+    masterChef = MockQiMasterChef.deploy(
+        qi, QI_PER_BLOCK, chain.height, 2 ** 256 - 1, deployer, tx
+    )
+    # Both pids charge the 0.5% deposit fee of the Fantom masterChef
+    masterChef.add(100, maiConcerto, DEPOSIT_FEE_BP, tx)  # pid 0
+    masterChef.add(100, qiMajor, DEPOSIT_FEE_BP, tx)  # pid 1
+    qi.mint(masterChef, 100_000_000 * ONE, tx)
+
+    addresses = {
+        FORK_ADDRESSES["usdc"]: usdc.address,
+        FORK_ADDRESSES["qi"]: qi.address,
+        FORK_ADDRESSES["wftm"]: wftm.address,
+        FORK_ADDRESSES["balancerVault"]: balancerVault.address,
+        FORK_ADDRESSES["maiConcerto"]: maiConcerto.address,
+        FORK_ADDRESSES["qiMajor"]: qiMajor.address,
+        FORK_ADDRESSES["masterChef"]: masterChef.address,
+        FORK_POOL_IDS["qiMajor"]: str(qiMajor.getPoolId()),
+        FORK_POOL_IDS["fantomOfTheOpera"]: str(fantomOfTheOpera.getPoolId()),
+    }
+
+    return {
+        "usdc": usdc,
+        "mai": mai,
+        "wftm": wftm,
+        "qi": qi,
+        "balancerVault": balancerVault,
+        "maiConcerto": maiConcerto,
+        "qiMajor": qiMajor,
+        "fantomOfTheOpera": fantomOfTheOpera,
+        "masterChef": masterChef,
+        "addresses": {key.lower(): value for key, value in addresses.items()},
+    }
+
+
+def deployPool(
+    balancerVault, name, symbol, tokens, weights, swapFee, balances, deployer
+):
+    tx = {"from": deployer}
+    pool = MockWeightedPool.deploy(
+        name, symbol, balancerVault, tokens, weights, swapFee, tx
+    )
+    for token, balance in zip(tokens, balances):
+        token.mint(deployer, balance, tx)
+        token.approve(balancerVault, balance, tx)
+
+    userData = encode(["uint256", "uint256[]"], [JOIN_KIND_INIT, balances])
+    balancerVault.joinPool(
+        pool.getPoolId(), deployer, deployer, (tokens, balances, userData, False), tx
+    )
+    return pool
+
+
+def getStrategyConfig(strategyName, vault, protocols):
+    """
+    Same config as strategyConfig.getStrategyConfig with the Fantom addresses
+    and pool ids replaced by the local deployments.
+    """
+    config = strategyConfig.getStrategyConfig(strategyName, vault)
+    if config is None:
+        return None
+    return _replaceAddresses(config, protocols["addresses"])
+
+
+def _replaceAddresses(value, addresses):
+    if isinstance(value, str):
+        return addresses.get(value.lower(), value)
+    if isinstance(value, dict):
+        return {key: _replaceAddresses(item, addresses) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_replaceAddresses(item, addresses) for item in value)
+    return value
@@ -0,0 +1,269 @@
+"""
+Runs the test suite on several fork instances at once.
+
+Every worker gets its own ganache fork on its own port, all pinned to the same
+fork block, and runs a shard of the tests with `brownie test`:
+
+    python scripts/parallelTest.py -n 16
+    python scripts/parallelTest.py -n 16 --block 52000000 -- -k harvest
+
+The per-worker networks (<network>-w<i>) are added to the brownie network config
+with the settings of the base network. Tests are sharded by their duration in
+reports/test-timing-session.json when it exists (written by tests/conftest.py),
+round robin otherwise. With the session fixtures every test starts from the same
+snapshot, so a test gives the same result on any worker and in a serial run at
+the same block (`-n 1`).
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import urllib.request
+import xml.etree.ElementTree as ElementTree
+from pathlib import Path
+
+import yaml
+
+ROOT = Path(__file__).resolve().parent.parent
+REPORTS = ROOT / "reports"
+NETWORK_CONFIG = Path.home() / ".brownie" / "network-config.yaml"
+
+
+def loadNetworks():
+    with open(NETWORK_CONFIG) as f:
+        config = yaml.safe_load(f)
+    live = {
+        network["id"]: network
+        for group in config["live"]
+        for network in group["networks"]
+    }
+    development = {network["id"]: network for network in config["development"]}
+    return live, development
+
+
+def forkSettings(networkId):
+    """cmd settings of the base fork network, with the fork url and explorer resolved."""
+    live, development = loadNetworks()
+    base = development[networkId]
+    settings = dict(base["cmd_settings"])
+    explorer = base.get("explorer")
+    fork = settings["fork"]
+    if fork in live:
+        settings.setdefault("chain_id", int(live[fork]["chainid"]))
+        explorer = explorer or live[fork].get("explorer")
+        fork = live[fork]["host"]
+    settings["fork"] = os.path.expandvars(fork.split("@")[0])
+    return base, settings, explorer
+
+
+def latestBlock(url):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(
+            {"jsonrpc": "2.0", "id": 1, "method": "eth_blockNumber", "params": []}
+        ).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return int(json.load(response)["result"], 16)
+
+
+def registerNetworks(networkId, workers, basePort, block):
+    """Adds or updates <networkId>-w<i>, forking at block on basePort + i."""
+    base, settings, explorer = forkSettings(networkId)
+    _, development = loadNetworks()
+    ids = []
+    for i in range(workers):
+        workerId = f"{networkId}-w{i}"
+        workerSettings = dict(
+            settings, port=basePort + i, fork=f"{settings['fork']}@{block}"
+        )
+        args = [f"{key}={value}" for key, value in workerSettings.items()]
+        args += [f"host={base['host']}", f"timeout={base.get('timeout', 120)}"]
+        if explorer:
+            args.append(f"explorer={explorer}")
+
+        if workerId in development:
+            command = ["brownie", "networks", "modify", workerId]
+        else:
+            command = [
+                "brownie",
+                "networks",
+                "add",
+                "Development",
+                workerId,
+                f"cmd={base['cmd']}",
+            ]
+        subprocess.run(command + args, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        ids.append(workerId)
+    return ids
+
+
+def collectTests(paths):
+    """Test node ids in file order, parametrized tests are kept whole."""
+    files = []
+    for path in paths:
+        path = ROOT / path
+        files += sorted(path.glob("test_*.py")) if path.is_dir() else [path]
+    tests = []
+    for file in files:
+        names = re.findall(r"^def (test_\w+)\(", file.read_text(), re.MULTILINE)
+        tests += [f"{file.relative_to(ROOT)}::{name}" for name in names]
+    return tests
+
+
+def loadDurations(path):
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        timings = json.load(f)["tests"]
+    durations = {}
+    for nodeid, phases in timings.items():
+        test = nodeid.split("[")[0]
+        durations[test] = durations.get(test, 0) + sum(phases.values())
+    return durations
+
+
+def shard(tests, workers, durations):
+    """Longest tests first onto the least loaded worker, each shard keeps the file order."""
+    default = sorted(durations.values())[len(durations) // 2] if durations else 1
+    loads = [0.0] * workers
+    shards = [[] for _ in range(workers)]
+    for test in sorted(tests, key=lambda test: -durations.get(test, default)):
+        i = loads.index(min(loads))
+        loads[i] += durations.get(test, default)
+        shards[i].append(test)
+    order = {test: i for i, test in enumerate(tests)}
+    used = [i for i in range(workers) if shards[i]]
+    return [sorted(shards[i], key=order.get) for i in used], [loads[i] for i in used]
+
+
+def mergeTimings(scope):
+    merged = {}
+    parts = sorted(glob.glob(str(REPORTS / f"test-timing-{scope}-w*.json")))
+    for part in parts:
+        with open(part) as f:
+            report = json.load(f)
+        merged.update(report["tests"])
+        os.remove(part)
+    if merged:
+        with open(REPORTS / f"test-timing-{scope}.json", "w") as f:
+            json.dump(
+                {"scope": scope, "network": report["network"], "tests": merged},
+                f,
+                indent=2,
+            )
+
+
+def readResults(path):
+    if not path.exists():
+        return {
+            "tests": 0,
+            "failures": 1,
+            "errors": 0,
+            "skipped": 0,
+            "failed": [f"{path.name} missing"],
+        }
+    root = ElementTree.parse(path).getroot()
+    suite = root if root.tag == "testsuite" else root.find("testsuite")
+    failed = [
+        f"{case.get('classname')}::{case.get('name')}"
+        for case in suite.iter("testcase")
+        if case.find("failure") is not None or case.find("error") is not None
+    ]
+    counts = {
+        key: int(suite.get(key, 0))
+        for key in ("tests", "failures", "errors", "skipped")
+    }
+    return dict(counts, failed=failed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("paths", nargs="*", default=["tests"])
+    parser.add_argument("-n", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--network",
+        default="ftm-main-fork",
+        help="base fork network, its settings are copied to the workers",
+    )
+    parser.add_argument(
+        "--block",
+        type=int,
+        help="fork block, the latest block of the fork url by default",
+    )
+    parser.add_argument("--base-port", type=int, default=8600)
+    argv = sys.argv[1:] if argv is None else argv
+    passthrough = argv[argv.index("--") + 1 :] if "--" in argv else []
+    args = parser.parse_args(argv[: argv.index("--")] if "--" in argv else argv)
+
+    _, settings, _ = forkSettings(args.network)
+    block = args.block or latestBlock(settings["fork"])
+    tests = collectTests(args.paths)
+    shards, loads = shard(
+        tests, args.workers, loadDurations(REPORTS / "test-timing-session.json")
+    )
+    networks = registerNetworks(args.network, len(shards), args.base_port, block)
+    print(
+        f"{len(tests)} tests on {len(shards)} workers, {args.network} at block {block}"
+    )
+
+    (REPORTS / "parallel").mkdir(parents=True, exist_ok=True)
+    start = time.time()
+    processes = []
+    for i, (tests, network) in enumerate(zip(shards, networks)):
+        log = open(REPORTS / "parallel" / f"worker-{i}.log", "w")
+        command = [
+            "brownie",
+            "test",
+            *tests,
+            "--network",
+            network,
+            "--junitxml",
+            str(REPORTS / "parallel" / f"worker-{i}.xml"),
+            *passthrough,
+        ]
+        env = dict(os.environ, PARALLEL_WORKER=str(i))
+        processes.append(
+            (
+                subprocess.Popen(
+                    command, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT, env=env
+                ),
+                log,
+            )
+        )
+
+    for process, log in processes:
+        process.wait()
+        log.close()
+    elapsed = time.time() - start
+    mergeTimings("session")
+
+    totals = {"tests": 0, "failures": 0, "errors": 0, "skipped": 0}
+    failed = []
+    for i in range(len(shards)):
+        results = readResults(REPORTS / "parallel" / f"worker-{i}.xml")
+        print(
+            f"worker {i}: {results['tests']} tests, {results['failures'] + results['errors']} failed, expected {loads[i]:.0f}s"
+        )
+        for key in totals:
+            totals[key] += results[key]
+        failed += results["failed"]
+
+    print(
+        f"\n{totals['tests']} tests, {totals['failures']} failures, {totals['errors']} errors, {totals['skipped']} skipped in {elapsed:.0f}s"
+    )
+    print(f"serial estimate {sum(loads):.0f}s, logs in {REPORTS / 'parallel'}")
+    for test in failed:
+        print(f"FAILED {test}")
+    return 1 if failed or any(process.returncode for process, _ in processes) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""
+Vectorized sweep of the strategy parameters over pool-state scenarios.
+
+Evaluates every combination of maxSlippageIn, maxSlippageOut, maxSingleDeposit,
+minDepositPeriod and stakeParams against a set of scenarios and reports the
+Pareto front of net APR against worst-case slippage:
+
+    brownie run paramSweep
+    python scripts/paramSweep.py
+
+The pool math is done on (points, scenarios) arrays, there is no python loop per
+grid point. The model is deliberately coarser than strategySimulator.py:
+- the strategy pool is a two-token weighted pool, want and its pair
+- a deposit is deployed in maxSingleDeposit chunks, one tend per minDepositPeriod
+  (or per keeperInterval if longer), a chunk that slips more than maxSlippageIn is never deployed
+- worst-case slippage is the largest real join cost a grid point lets through
+- a grid point that cannot liquidate all positions within maxSlippageOut in some
+  scenario is infeasible and never on the front
+- staking stakePercentage of the rewards earns stakeApr on the staked stock, which
+  settles at stakePercentage / unstakePercentage harvests of rewards
+"""
+import numpy as np
+
+BASIS_ONE = 10_000
+YEAR = 86400 * 365
+
+# Grid axes in constructor units: bips, bips, want units (no decimals), seconds, bips, bips
+DEFAULT_GRID = {
+    "maxSlippageIn": np.arange(5, 105, 10),
+    "maxSlippageOut": np.geomspace(5, 500, 10).round(),
+    "maxSingleDeposit": np.geomspace(10_000, 10_000_000, 20),
+    "minDepositPeriod": np.array(
+        [0, 600, 1800, 3600, 7200, 14400, 28800, 43200, 86400, 172800]
+    ),
+    "stakeParams": [
+        (0, 0),
+        (2_500, 5_000),
+        (5_000, 5_000),
+        (5_000, 10_000),
+        (10_000, 2_500),
+    ],
+}
+
+# Pool balances in want units, rates as yearly fractions, costs in want units
+DEFAULT_SCENARIOS = {
+    "name": ["calm", "thin", "imbalanced", "whale deposit"],
+    "probability": [0.5, 0.2, 0.2, 0.1],
+    "wantBalance": [10_000_000, 2_000_000, 4_000_000, 10_000_000],
+    "pairBalance": [10_000_000, 2_000_000, 16_000_000, 10_000_000],
+    "wantWeight": [0.5, 0.5, 0.5, 0.5],
+    "swapFee": [0.001, 0.001, 0.001, 0.001],
+    "tvl": [1_000_000, 1_000_000, 1_000_000, 5_000_000],
+    "depositSize": [50_000, 50_000, 50_000, 2_000_000],
+    "depositsPerYear": [52, 52, 52, 4],
+    "rewardApr": [0.12, 0.2, 0.15, 0.12],
+    "tradingFeeApr": [0.01, 0.02, 0.02, 0.01],
+    "stakeApr": [0.3, 0.3, 0.3, 0.3],
+    "stakeCost": [0.003, 0.003, 0.003, 0.003],
+    "tendCost": [0.5, 0.5, 0.5, 0.5],
+    "harvestsPerYear": [365, 365, 365, 365],
+    "keeperInterval": [3600, 3600, 3600, 3600],
+}
+
+
+def makeGrid(grid=DEFAULT_GRID):
+    """Cartesian product of the grid axes as flat arrays, stakeParams split into two axes."""
+    stakeParams = np.asarray(grid["stakeParams"], dtype=float)
+    axes = [
+        np.asarray(grid["maxSlippageIn"], dtype=float),
+        np.asarray(grid["maxSlippageOut"], dtype=float),
+        np.asarray(grid["maxSingleDeposit"], dtype=float),
+        np.asarray(grid["minDepositPeriod"], dtype=float),
+        np.arange(len(stakeParams)),
+    ]
+    mesh = [axis.ravel() for axis in np.meshgrid(*axes, indexing="ij")]
+    stakeIndex = mesh[4].astype(int)
+    return {
+        "maxSlippageIn": mesh[0],
+        "maxSlippageOut": mesh[1],
+        "maxSingleDeposit": mesh[2],
+        "minDepositPeriod": mesh[3],
+        "stakePercentage": stakeParams[stakeIndex, 0],
+        "unstakePercentage": stakeParams[stakeIndex, 1],
+    }
+
+
+def makeScenarios(scenarios=DEFAULT_SCENARIOS):
+    return {
+        key: (value if key == "name" else np.asarray(value, dtype=float))
+        for key, value in scenarios.items()
+    }
+
+
+def joinSlippage(amountIn, wantBalance, pairBalance, wantWeight, swapFee, spot=False):
+    """
+    Fraction of amountIn lost on a single sided EXACT_TOKENS_IN join, valued like balanceOfPooled:
+    the want share plus the pair share swapped into want after the join.
+    With spot the pair share is valued at the spot price before the join instead, which is the
+    real cost of the join. The balanceOfPooled valuation is what the 'Slipped in!' check sees and
+    it understates large joins, the pool price has moved in favour of selling the pair back.
+    """
+    pairWeight = 1 - wantWeight
+    # Only the non proportional part of the join pays the swap fee
+    amountInWithoutFee = amountIn * (wantWeight + pairWeight * (1 - swapFee))
+    share = ((wantBalance + amountInWithoutFee) / wantBalance) ** wantWeight - 1
+    share = share / (1 + share)  # of the supply after the join
+    wantAfter = wantBalance + amountIn
+    pairOut = share * pairBalance
+    if spot:
+        value = share * wantAfter + pairOut * (wantBalance / wantWeight) / (
+            pairBalance / pairWeight
+        )
+    else:
+        value = share * wantAfter + _outGivenIn(
+            pairBalance, pairWeight, wantAfter, wantWeight, pairOut, swapFee
+        )
+    return np.maximum(amountIn - value, 0) / amountIn
+
+
+def exitSlippage(share, wantBalance, pairBalance, wantWeight, swapFee):
+    """
+    Fraction of the pooled value lost exiting a share of the supply into want only
+    (EXACT_BPT_IN_FOR_ONE_TOKEN_OUT), against the balanceOfPooled valuation.
+    """
+    pairWeight = 1 - wantWeight
+    value = share * wantBalance + _outGivenIn(
+        pairBalance, pairWeight, wantBalance, wantWeight, share * pairBalance, swapFee
+    )
+    amountOutWithoutFee = wantBalance * (1 - (1 - share) ** (1 / wantWeight))
+    amountOut = amountOutWithoutFee * (wantWeight + pairWeight * (1 - swapFee))
+    return np.maximum(value - amountOut, 0) / value
+
+
+def _outGivenIn(balanceIn, weightIn, balanceOut, weightOut, amountIn, swapFee):
+    return balanceOut * (
+        1
+        - (balanceIn / (balanceIn + amountIn * (1 - swapFee))) ** (weightIn / weightOut)
+    )
+
+
+def evaluate(points, scenarios):
+    """
+    Net APR and worst-case slippage of every grid point.
+    Arrays are shaped (points, scenarios) and reduced over the scenarios with their probability.
+    """
+    p = {key: value[:, None] for key, value in points.items()}
+    s = {key: value[None, :] for key, value in scenarios.items() if key != "name"}
+    poolArgs = (s["wantBalance"], s["pairBalance"], s["wantWeight"], s["swapFee"])
+
+    # Deposits go in maxSingleDeposit chunks, one per tend
+    chunk = np.minimum(p["maxSingleDeposit"], s["depositSize"])
+    joins = joinSlippage(chunk, *poolArgs) * BASIS_ONE <= p["maxSlippageIn"]
+    slipIn = joinSlippage(chunk, *poolArgs, spot=True)
+    tendsPerDeposit = np.ceil(s["depositSize"] / chunk)
+
+    # A deposit waits on average for half of its tends to go in, plus half a period for the first one.
+    # Tends are at least minDepositPeriod apart and never closer than the keeper runs.
+    tendPeriod = np.maximum(p["minDepositPeriod"], s["keeperInterval"])
+    idleTime = tendsPerDeposit * tendPeriod / 2
+    idleFraction = np.minimum(
+        s["depositsPerYear"] * s["depositSize"] * idleTime / (s["tvl"] * YEAR), 1
+    )
+    idleFraction = np.where(joins, idleFraction, 1.0)
+
+    depositFlow = s["depositsPerYear"] * s["depositSize"] / s["tvl"]
+    joinCostApr = np.where(joins, depositFlow * slipIn, 0)
+    tendCostApr = np.where(
+        joins, s["depositsPerYear"] * tendsPerDeposit * s["tendCost"] / s["tvl"], 0
+    )
+
+    # Steady state staked stock, in yearly rewards
+    stake = p["stakePercentage"] / BASIS_ONE
+    unstake = p["unstakePercentage"] / BASIS_ONE
+    stakedStock = np.where(
+        unstake > 0, stake / np.maximum(unstake, 1e-18) / s["harvestsPerYear"], 0
+    )
+    rewardApr = s["rewardApr"] * np.where(
+        unstake > 0, 1 + stakedStock * s["stakeApr"] - stake * s["stakeCost"], 1 - stake
+    )
+
+    grossApr = rewardApr + s["tradingFeeApr"]
+    netApr = grossApr * (1 - idleFraction) - joinCostApr - tendCostApr
+
+    # Liquidating everything has to stay within maxSlippageOut
+    positionShare = s["tvl"] / (s["tvl"] + s["wantBalance"] + s["pairBalance"])
+    slipOut = exitSlippage(positionShare, *poolArgs)
+    exits = slipOut * BASIS_ONE <= p["maxSlippageOut"]
+
+    probability = s["probability"] / s["probability"].sum()
+    worstSlippage = np.where(joins, slipIn, 0).max(axis=1)
+    return {
+        "netApr": (netApr * probability).sum(axis=1),
+        "worstSlippage": worstSlippage,
+        "feasible": exits.all(axis=1),
+        "deploys": joins.all(axis=1),
+    }
+
+
+def paretoFront(netApr, worstSlippage, feasible):
+    """Indices of the feasible points no other point beats on both net APR and worst slippage."""
+    candidates = np.flatnonzero(feasible)
+    order = candidates[np.lexsort((-netApr[candidates], worstSlippage[candidates]))]
+    best = np.maximum.accumulate(netApr[order])
+    improves = np.empty(len(order), dtype=bool)
+    improves[:1] = True
+    improves[1:] = netApr[order][1:] > best[:-1]
+    return order[improves]
+
+
+def sweep(grid=DEFAULT_GRID, scenarios=DEFAULT_SCENARIOS):
+    points = makeGrid(grid)
+    result = evaluate(points, makeScenarios(scenarios))
+    front = paretoFront(result["netApr"], result["worstSlippage"], result["feasible"])
+    return points, result, front
+
+
+def main():
+    points, result, front = sweep()
+    print(
+        f'{len(result["netApr"])} points, {result["feasible"].sum()} feasible, {len(front)} on the front\n'
+    )
+    header = [
+        "netApr %",
+        "worstSlip bps",
+        "maxSlippageIn",
+        "maxSlippageOut",
+        "maxSingleDeposit",
+        "minDepositPeriod",
+        "stakeParams",
+    ]
+    print(" | ".join(header))
+    for i in front:
+        print(
+            " | ".join(
+                [
+                    f'{result["netApr"][i] * 100:.2f}',
+                    f'{result["worstSlippage"][i] * BASIS_ONE:.1f}',
+                    f'{points["maxSlippageIn"][i]:.0f}',
+                    f'{points["maxSlippageOut"][i]:.0f}',
+                    f'{points["maxSingleDeposit"][i]:.0f}',
+                    f'{points["minDepositPeriod"][i]:.0f}',
+                    f'[{points["stakePercentage"][i]:.0f}, {points["unstakePercentage"][i]:.0f}]',
+                ]
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
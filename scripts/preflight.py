@@ -0,0 +1,408 @@
+"""
+Preflight of a strategy deployment, nothing is broadcast.
+
+Builds the plan of a strategyConfig entry: the BalancerRouting library, the Strategy
+deploy and its setters as deployStrategy.deploy sends them (or one StrategyFactory
+clone), then the vault and health check set up. The config is checked against the chain, then the whole
+plan is sent on a throwaway fork and the gas of each transaction is printed:
+
+    PREFLIGHT_VAULT=<vault> PREFLIGHT_DEPLOYER=<address> brownie run preflight --network ftm-main
+
+- PREFLIGHT_CONFIG: strategyConfig entry, MAI_Concerto_staking by default
+- PREFLIGHT_GOV: sends the setters and the vault transactions, the deployer by default
+- PREFLIGHT_FACTORY: clone from this StrategyFactory instead of deploying a Strategy
+
+The check reads every address, pool id, token index and route hop the constructor
+and the setters rely on in one pass of two aggregate calls, the pool ids of the
+pool addresses are only known after the first one. On a live network the plan is
+simulated on `<network>-fork`, priced at the live gas price.
+"""
+import os
+import sys
+from dataclasses import dataclass
+from typing import Optional
+
+from brownie import (
+    BalancerRouting,
+    CommonHealthCheck,
+    Contract,
+    Strategy,
+    StrategyFactory,
+    accounts,
+    interface,
+    network,
+    web3,
+)
+from brownie.exceptions import VirtualMachineError
+from eth_utils import is_address
+
+script_dir = os.path.dirname(__file__)
+scripts_dir = os.path.join(script_dir)
+sys.path.append(scripts_dir)
+
+import strategyConfig
+from deployStrategy import Vault, initParams, setupParams
+from strategyReader import ERC20_ABI, VAULT_ABI, getMulticall, readCalls
+
+BASIS_ONE = 10_000
+
+# vault.addStrategy arguments of deployStrategy.main
+DEBT_RATIO = 10_000
+MIN_DEBT_PER_HARVEST = 0
+MAX_DEBT_PER_HARVEST = 1_000_000_000_000
+PERFORMANCE_FEE = 0
+
+
+@dataclass(frozen=True)
+class Step:
+    """
+    One transaction of a plan, target.method(*args) sent from sender.
+    Targets and args naming an account ("deployer", "gov") or an earlier result
+    ("strategy", "healthCheck") stand for it, results are only known once simulated.
+    """
+
+    target: str
+    method: str
+    args: tuple = ()
+    sender: str = "deployer"
+    result: Optional[str] = None
+
+    @property
+    def label(self):
+        return f"{self.target}.{self.method}"
+
+
+def deploymentPlan(config, factory=False):
+    """The transactions of a deployment of config, in order."""
+    deployArgs = config["deployArgs"]
+    healthCheck = [
+        Step("CommonHealthCheck", "deploy", result="healthCheck"),
+        Step("healthCheck", "setGovernance", ("gov",)),
+        Step("healthCheck", "setManagement", ("gov",)),
+    ]
+    addStrategy = Step(
+        "vault",
+        "addStrategy",
+        (
+            "strategy",
+            DEBT_RATIO,
+            MIN_DEBT_PER_HARVEST,
+            MAX_DEBT_PER_HARVEST,
+            PERFORMANCE_FEE,
+        ),
+        "gov",
+    )
+
+    if factory:
+        # The clone is initialized with the health check, it has to exist first
+        clone = Step(
+            "factory",
+            "clone",
+            (
+                deployArgs[0],
+                "deployer",
+                "deployer",
+                "deployer",
+                initParams(config),
+                setupParams(config, "healthCheck"),
+            ),
+            result="strategy",
+        )
+        return healthCheck + [clone, addStrategy]
+
+    stakeParams = config["stakeParams"]
+    whitelistReward = config["whitelistReward"]
+    stakeInfo = config["stakeInfo"]
+    steps = [
+        # Strategy links against the library, deployed first on a fresh chain
+        Step("BalancerRouting", "deploy", result="balancerRouting"),
+        Step("Strategy", "deploy", tuple(deployArgs), result="strategy"),
+        Step("strategy", "setStakeParams", (stakeParams[0], stakeParams[1]), "gov"),
+        Step(
+            "strategy",
+            "whitelistReward",
+            (whitelistReward["rewardToken"], whitelistReward["steps"]),
+            "gov",
+        ),
+    ]
+    if stakeInfo:
+        steps.append(
+            Step(
+                "strategy",
+                "setStakeInfo",
+                (
+                    stakeInfo["assets"],
+                    stakeInfo["stakePool"],
+                    stakeInfo["stakeTokenIndex"],
+                    stakeInfo["stakeWantIndex"],
+                    stakeInfo["masterChefStakePoolId"],
+                ),
+                "gov",
+            )
+        )
+    steps.append(Step("strategy", "setWNative", (config["wNative"],), "gov"))
+    return (
+        steps
+        + [addStrategy]
+        + healthCheck
+        + [Step("strategy", "setHealthCheck", ("healthCheck",), "gov")]
+    )
+
+
+def _same(a, b):
+    return str(a).lower() == str(b).lower()
+
+
+def _contains(addresses, address):
+    return any(_same(item, address) for item in addresses)
+
+
+def check(config, multicall=None):
+    """
+    What in config would revert the deployment or leave the strategy misconfigured, [] when it is good to go.
+    """
+    deployArgs = config["deployArgs"]
+    whitelistReward = config["whitelistReward"]
+    rewardToken = whitelistReward["rewardToken"]
+    poolIds, routeAssets = whitelistReward["steps"]
+    stakeInfo = config["stakeInfo"]
+
+    addresses = {
+        "vault": deployArgs[0],
+        "balancerVault": deployArgs[1],
+        "balancerPool": deployArgs[2],
+        "masterChef": deployArgs[3],
+        "rewardToken": rewardToken,
+        "wNative": config["wNative"],
+        **{f"route asset {j}": asset for j, asset in enumerate(routeAssets)},
+    }
+    if stakeInfo:
+        addresses["stakePool"] = stakeInfo["stakePool"]
+        addresses.update(
+            {f"stake asset {j}": asset for j, asset in enumerate(stakeInfo["assets"])}
+        )
+    problems = [
+        f"{name}: {address} is not an address"
+        for name, address in addresses.items()
+        if not is_address(str(address))
+    ]
+    if problems:
+        return problems
+
+    # The requires of the constructor and the setters that need no chain state
+    if deployArgs[4] > BASIS_ONE or deployArgs[5] > BASIS_ONE:
+        problems.append("maxSlippageIn and maxSlippageOut are bips, at most 10000")
+    if any(bips > BASIS_ONE for bips in config["stakeParams"]):
+        problems.append("stakeParams are bips, at most 10000")
+    if len(poolIds) == 0 or len(routeAssets) != len(poolIds) + 1:
+        problems.append(
+            f"route: {len(poolIds)} pool ids need {len(poolIds) + 1} assets, not {len(routeAssets)}"
+        )
+    elif not _same(routeAssets[0], rewardToken):
+        problems.append(
+            f"route: starts with {routeAssets[0]}, not the reward token {rewardToken}"
+        )
+    if stakeInfo and max(
+        stakeInfo["stakeTokenIndex"], stakeInfo["stakeWantIndex"]
+    ) >= len(stakeInfo["assets"]):
+        problems.append(
+            f"stakeTokenIndex and stakeWantIndex must be below the {len(stakeInfo['assets'])} stake assets"
+        )
+    if problems:
+        return problems
+
+    multicall = multicall or getMulticall()
+    vault = Contract.from_abi("Vault", deployArgs[0], VAULT_ABI, persist=False)
+    balancerVault = interface.IBalancerVault(deployArgs[1])
+    masterChef = interface.IQiMasterChef(deployArgs[3])
+    pools = {"balancerPool": deployArgs[2]}
+    pids = {"masterChefPoolId": (deployArgs[8], deployArgs[2])}
+    if stakeInfo:
+        pools["stakePool"] = stakeInfo["stakePool"]
+        pids["masterChefStakePoolId"] = (
+            stakeInfo["masterChefStakePoolId"],
+            stakeInfo["stakePool"],
+        )
+    tokens = {"rewardToken": rewardToken, "wNative": config["wNative"]}
+
+    results = readCalls(
+        [(vault.token, ())]
+        + [(interface.IBalancerPool(pool).getPoolId, ()) for pool in pools.values()]
+        + [(masterChef.poolInfo, (pid,)) for pid, _ in pids.values()]
+        + [(balancerVault.getPoolTokens, (poolId,)) for poolId in poolIds]
+        + [
+            (Contract.from_abi("ERC20", token, ERC20_ABI, persist=False).decimals, ())
+            for token in tokens.values()
+        ],
+        multicall,
+    )
+    want = results[0]
+    results = results[1:]
+    poolIdsOf = dict(zip(pools, results[: len(pools)]))
+    results = results[len(pools) :]
+    poolInfos = dict(zip(pids, results[: len(pids)]))
+    results = results[len(pids) :]
+    hopTokens = results[: len(poolIds)]
+    decimals = dict(zip(tokens, results[len(poolIds) :]))
+
+    registered = [name for name, poolId in poolIdsOf.items() if poolId is not None]
+    poolTokens = dict(
+        zip(
+            registered,
+            readCalls(
+                [
+                    (balancerVault.getPoolTokens, (poolIdsOf[name],))
+                    for name in registered
+                ],
+                multicall,
+            ),
+        )
+    )
+
+    if want is None:
+        problems.append(f"vault: {deployArgs[0]} has no token()")
+    for name, pool in pools.items():
+        if poolIdsOf[name] is None:
+            problems.append(f"{name}: {pool} is not a Balancer pool")
+        elif poolTokens[name] is None:
+            problems.append(
+                f"{name}: pool id {poolIdsOf[name]} is not registered in the balancerVault {deployArgs[1]}"
+            )
+    if (
+        want is not None
+        and poolTokens.get("balancerPool")
+        and not _contains(poolTokens["balancerPool"][0], want)
+    ):
+        problems.append(f"balancerPool: the want {want} is not in the pool")
+
+    for name, (pid, pool) in pids.items():
+        if pid >= 2 ** 32:
+            problems.append(f"{name}: {pid} does not fit an uint32")
+        elif poolInfos[name] is None:
+            problems.append(f"{name}: the masterChef has no pool {pid}")
+        elif not _same(poolInfos[name][0], pool):
+            problems.append(
+                f"{name}: masterChef pool {pid} stakes {poolInfos[name][0]}, not {pool}"
+            )
+
+    for j, (poolId, hop) in enumerate(zip(poolIds, hopTokens)):
+        if hop is None:
+            problems.append(
+                f"route hop {j}: pool id {poolId} is not registered in the balancerVault"
+            )
+            continue
+        for asset in routeAssets[j : j + 2]:
+            if not _contains(hop[0], asset):
+                problems.append(f"route hop {j}: {asset} is not in the pool {poolId}")
+    if want is not None and not _same(routeAssets[-1], want):
+        problems.append(f"route: ends with {routeAssets[-1]}, not the want {want}")
+
+    for name, value in decimals.items():
+        if value is None:
+            problems.append(f"{name}: {tokens[name]} is not an ERC20")
+
+    if stakeInfo and poolTokens.get("stakePool"):
+        stakeAssets = stakeInfo["assets"]
+        # joinPool and exitPool take the pool tokens in the pool order
+        if len(stakeAssets) != len(poolTokens["stakePool"][0]) or not all(
+            map(_same, stakeAssets, poolTokens["stakePool"][0])
+        ):
+            problems.append(
+                f"stakeInfo: assets {stakeAssets} are not the stake pool tokens {list(poolTokens['stakePool'][0])}"
+            )
+        elif not _same(stakeAssets[stakeInfo["stakeTokenIndex"]], rewardToken):
+            problems.append(
+                f"stakeTokenIndex: {stakeAssets[stakeInfo['stakeTokenIndex']]} is not the reward token {rewardToken}"
+            )
+    return problems
+
+
+def _resolve(value, context):
+    if isinstance(value, str) and value in context:
+        return context[value]
+    if isinstance(value, (list, tuple)):
+        return type(value)(_resolve(item, context) for item in value)
+    return value
+
+
+def simulate(plan, vault, deployer, gov, factory=None):
+    """
+    Sends the plan on the active chain, a development or fork network only.
+    Returns [(step, gasUsed, revert)] up to the first revert and the contracts the plan deployed.
+    """
+    active = network.show_active()
+    if active != "development" and "fork" not in active:
+        raise ValueError(f"'{active}' is not a throwaway chain, simulate on a fork")
+
+    context = {
+        "BalancerRouting": BalancerRouting,
+        "Strategy": Strategy,
+        "CommonHealthCheck": CommonHealthCheck,
+        "vault": Vault.at(str(vault)),
+        "deployer": accounts.at(str(deployer), force=True),
+        "gov": accounts.at(str(gov), force=True),
+    }
+    if factory:
+        context["factory"] = StrategyFactory.at(str(factory))
+
+    results = []
+    deployed = {}
+    for step in plan:
+        method = getattr(context[step.target], step.method)
+        try:
+            result = method(
+                *_resolve(step.args, context), {"from": context[step.sender]}
+            )
+        except VirtualMachineError as e:
+            results.append((step, None, e.revert_msg or str(e)))
+            break
+        tx = getattr(result, "tx", result)
+        if step.result:
+            context[step.result] = deployed[step.result] = (
+                Strategy.at(tx.events["Cloned"]["strategy"])
+                if step.method == "clone"
+                else result
+            )
+        results.append((step, tx.gas_used, None))
+    return results, deployed
+
+
+def main():
+    vault = os.getenv("PREFLIGHT_VAULT")
+    deployer = os.getenv("PREFLIGHT_DEPLOYER")
+    gov = os.getenv("PREFLIGHT_GOV") or deployer
+    factory = os.getenv("PREFLIGHT_FACTORY")
+    configName = os.getenv("PREFLIGHT_CONFIG", "MAI_Concerto_staking")
+    config = strategyConfig.getStrategyConfig(configName, vault)
+    plan = deploymentPlan(config, bool(factory))
+
+    print(f"{configName} on '{network.show_active()}', {len(plan)} transactions:")
+    for i, step in enumerate(plan):
+        print(f"  {i + 1}. {step.label} from {step.sender}")
+
+    problems = check(config)
+    if problems:
+        print("Config problems, not simulated:")
+        for problem in problems:
+            print(f"  - {problem}")
+        sys.exit(1)
+
+    gasPrice = web3.eth.gas_price
+    active = network.show_active()
+    if active != "development" and "fork" not in active:
+        network.disconnect()
+        network.connect(f"{active}-fork")
+
+    results, _ = simulate(plan, vault, deployer, gov, factory)
+    total = 0
+    for step, gasUsed, revert in results:
+        if revert is not None:
+            print(f"  {step.label:<32} reverted: {revert}")
+            sys.exit(1)
+        total += gasUsed
+        print(
+            f"  {step.label:<32} {gasUsed:>10,} gas {gasUsed * gasPrice / 1e18:>12.4f}"
+        )
+    print(
+        f"  {'total':<32} {total:>10,} gas {total * gasPrice / 1e18:>12.4f} at {gasPrice / 1e9:.1f} gwei"
+    )
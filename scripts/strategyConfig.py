@@ -46,7 +46,8 @@ def getStrategyConfig(strategyName, vault):
       "deployArgs": deployArgs, 
       "stakeParams":  stakeParams, 
       "whitelistReward":  whitelistReward,
-      "stakeInfo":  stakeInfo
+      "stakeInfo":  stakeInfo,
+      "wNative": "0x21be370D5312f44cB42ce377BC9b8a0cEF1A4C83" # wFTM, prices the harvest gas
     }
 
   if(strategyName == "MAI_Concerto_staking"):
@@ -98,7 +99,8 @@ def getStrategyConfig(strategyName, vault):
       "deployArgs": deployArgs, 
       "stakeParams":  stakeParams, 
       "whitelistReward":  whitelistReward,
-      "stakeInfo":  stakeInfo
+      "stakeInfo":  stakeInfo,
+      "wNative": "0x21be370D5312f44cB42ce377BC9b8a0cEF1A4C83" # wFTM, prices the harvest gas
     }
 
   return None
@@ -0,0 +1,317 @@
+"""
+Batched reads of the strategy state.
+
+Gathers the views of a strategy, its vault and its want token into a single
+Multicall aggregate call and returns a typed snapshot:
+
+    reader = StrategyReader(strategy)
+    state = reader.snapshot()
+    state.estimatedTotalAssets, state.vaultParams.totalDebt
+
+A Multicall is deployed on development and fork networks when none is given.
+On live networks set MULTICALL_ADDRESS, without it the reads are sent one by one.
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from brownie import Contract, Multicall, accounts, network, web3
+from brownie.exceptions import VirtualMachineError
+
+# Only the views the reader needs, works with any ERC20 and yearn vault 0.4.x
+ERC20_ABI = [
+    {
+        "name": "symbol",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [],
+        "outputs": [{"name": "", "type": "string"}],
+    },
+    {
+        "name": "decimals",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [],
+        "outputs": [{"name": "", "type": "uint256"}],
+    },
+]
+VAULT_ABI = ERC20_ABI + [
+    {
+        "name": "name",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [],
+        "outputs": [{"name": "", "type": "string"}],
+    },
+    {
+        "name": "token",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [],
+        "outputs": [{"name": "", "type": "address"}],
+    },
+    {
+        "name": "totalAssets",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [],
+        "outputs": [{"name": "", "type": "uint256"}],
+    },
+    {
+        "name": "pricePerShare",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [],
+        "outputs": [{"name": "", "type": "uint256"}],
+    },
+    {
+        "name": "strategies",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [{"name": "arg0", "type": "address"}],
+        "outputs": [
+            {"name": "performanceFee", "type": "uint256"},
+            {"name": "activation", "type": "uint256"},
+            {"name": "debtRatio", "type": "uint256"},
+            {"name": "minDebtPerHarvest", "type": "uint256"},
+            {"name": "maxDebtPerHarvest", "type": "uint256"},
+            {"name": "lastReport", "type": "uint256"},
+            {"name": "totalDebt", "type": "uint256"},
+            {"name": "totalGain", "type": "uint256"},
+            {"name": "totalLoss", "type": "uint256"},
+        ],
+    },
+]
+
+_multicalls = {}
+
+
+@dataclass(frozen=True)
+class VaultStrategyParams:
+    """vault.strategies(strategy)"""
+
+    performanceFee: int
+    activation: int
+    debtRatio: int
+    minDebtPerHarvest: int
+    maxDebtPerHarvest: int
+    lastReport: int
+    totalDebt: int
+    totalGain: int
+    totalLoss: int
+
+
+@dataclass(frozen=True)
+class StrategySnapshot:
+    block: int
+    timestamp: int
+    name: str
+    want: str
+    wantSymbol: str
+    wantDecimals: int
+    vault: str
+    vaultName: str
+    vaultTotalAssets: int
+    pricePerShare: int
+    vaultParams: VaultStrategyParams
+    balanceOfWant: int
+    balanceOfBpt: int
+    balanceOfBptInMasterChef: int
+    balanceOfStakeBptInMasterChef: int
+    totalBalanceOfBpt: int
+    balanceOfReward: int
+    balanceOfPooled: int
+    estimatedTotalAssets: int
+    maxSlippageIn: int
+    maxSlippageOut: int
+    maxSingleDeposit: int
+    minDepositPeriod: int
+    lastDepositTime: int
+    swapPoolIds: Tuple[str, ...]
+    swapAssets: Tuple[str, ...]
+    bpt: str
+    stakeBpt: str
+    rewardToken: str
+    emergencyExit: bool
+    healthCheck: str
+    doHealthCheck: bool
+    minReportDelay: int
+    maxReportDelay: int
+
+    def toUnits(self, amount):
+        return amount / 10 ** self.wantDecimals
+
+
+class ReadError(ValueError):
+    """Views of a snapshot that reverted or returned nothing."""
+
+    def __init__(self, views, block=None):
+        self.views = views
+        super().__init__(f"{', '.join(views)} failed at block {block or 'latest'}")
+
+
+# Strategy views read on every snapshot, in StrategySnapshot field names
+STRATEGY_VIEWS = [
+    "name",
+    "balanceOfWant",
+    "balanceOfBpt",
+    "balanceOfBptInMasterChef",
+    "balanceOfStakeBptInMasterChef",
+    "totalBalanceOfBpt",
+    "balanceOfReward",
+    "balanceOfPooled",
+    "estimatedTotalAssets",
+    "maxSlippageIn",
+    "maxSlippageOut",
+    "maxSingleDeposit",
+    "minDepositPeriod",
+    "lastDepositTime",
+    "bpt",
+    "stakeBpt",
+    "rewardToken",
+    "emergencyExit",
+    "healthCheck",
+    "doHealthCheck",
+    "minReportDelay",
+    "maxReportDelay",
+]
+
+
+def getMulticall(deployer=None):
+    """
+    Multicall for the active network, from MULTICALL_ADDRESS or deployed on development and fork networks.
+    The deployment is cached and redeployed if a chain revert dropped it.
+    None on a live network without MULTICALL_ADDRESS, readCalls then sends plain calls.
+    """
+    if os.getenv("MULTICALL_ADDRESS"):
+        return Multicall.at(os.getenv("MULTICALL_ADDRESS"))
+
+    active = network.show_active()
+    if active != "development" and "fork" not in active:
+        return None
+
+    multicall = _multicalls.get(active)
+    if multicall is None or len(web3.eth.get_code(multicall.address)) == 0:
+        multicall = Multicall.deploy({"from": deployer or accounts[0]})
+        _multicalls[active] = multicall
+    return multicall
+
+
+def readCalls(calls, multicall=None, block=None):
+    """
+    Reads [(contractMethod, args), ...] in one aggregate call, or one call each without a Multicall.
+    Calls that revert, or return nothing as calls to an address without code do, come back as None.
+    """
+    multicall = multicall or getMulticall()
+    if multicall is None:
+        return [_readCall(method, args, block) for method, args in calls]
+    encoded = [(method._address, method.encode_input(*args)) for method, args in calls]
+    results = multicall.tryAggregate.call(False, encoded, block_identifier=block)
+    return [
+        method.decode_output(returnData) if success and returnData else None
+        for (method, _), (success, returnData) in zip(calls, results)
+    ]
+
+
+def _readCall(method, args, block=None):
+    try:
+        return method.call(*args, block_identifier=block)
+    except (ValueError, VirtualMachineError):
+        # Reverted, or nothing to decode from an address without code
+        return None
+
+
+class StrategyReader:
+    """
+    Reads a strategy, its vault and want token in one call per snapshot.
+    The vault and want addresses are read once, on creation.
+    Without a Multicall the block and timestamp come from the block read.
+    """
+
+    def __init__(self, strategy, multicall=None):
+        self.strategy = strategy
+        self.multicall = multicall or getMulticall()
+        vault, want = readCalls(
+            [(strategy.vault, ()), (strategy.want, ())], self.multicall
+        )
+        if vault is None or want is None:
+            raise ReadError(["vault", "want"])
+        self.vault = Contract.from_abi("Vault", vault, VAULT_ABI, persist=False)
+        self.want = Contract.from_abi("ERC20", want, ERC20_ABI, persist=False)
+
+    def labelledCalls(self):
+        """[(name, (contractMethod, args)), ...] of a snapshot, the names are reported by ReadError."""
+        strategy = self.strategy
+        calls = [(view, (getattr(strategy, view), ())) for view in STRATEGY_VIEWS] + [
+            ("getSwapSteps", (strategy.getSwapSteps, ())),
+            ("want.symbol", (self.want.symbol, ())),
+            ("want.decimals", (self.want.decimals, ())),
+            ("vault.name", (self.vault.name, ())),
+            ("vault.totalAssets", (self.vault.totalAssets, ())),
+            ("vault.pricePerShare", (self.vault.pricePerShare, ())),
+            ("vault.strategies", (self.vault.strategies, (strategy,))),
+        ]
+        if self.multicall is not None:
+            calls += [
+                ("getBlockNumber", (self.multicall.getBlockNumber, ())),
+                (
+                    "getCurrentBlockTimestamp",
+                    (self.multicall.getCurrentBlockTimestamp, ()),
+                ),
+            ]
+        return calls
+
+    def calls(self):
+        return [call for _, call in self.labelledCalls()]
+
+    def snapshot(self, block: Optional[int] = None) -> StrategySnapshot:
+        """Raises ReadError naming the views that failed, a snapshot has no missing fields."""
+        labelled = self.labelledCalls()
+        results = readCalls([call for _, call in labelled], self.multicall, block)
+        failed = [
+            name for (name, _), result in zip(labelled, results) if result is None
+        ]
+        if failed:
+            raise ReadError(failed, block)
+        if self.multicall is None:
+            header = web3.eth.get_block(block if block is not None else "latest")
+            results += [header.number, header.timestamp]
+
+        views = dict(zip(STRATEGY_VIEWS, results))
+        (
+            swapSteps,
+            wantSymbol,
+            wantDecimals,
+            vaultName,
+            vaultTotalAssets,
+            pricePerShare,
+            params,
+            blockNumber,
+            timestamp,
+        ) = results[len(STRATEGY_VIEWS) :]
+        return StrategySnapshot(
+            block=blockNumber,
+            timestamp=timestamp,
+            want=self.want.address,
+            wantSymbol=wantSymbol,
+            wantDecimals=wantDecimals,
+            vault=self.vault.address,
+            vaultName=vaultName,
+            vaultTotalAssets=vaultTotalAssets,
+            pricePerShare=pricePerShare,
+            vaultParams=VaultStrategyParams(*params),
+            swapPoolIds=tuple(str(poolId) for poolId in swapSteps[0]),
+            swapAssets=tuple(swapSteps[1]),
+            **views,
+        )
+
+
+def read(strategy, block=None):
+    return StrategyReader(strategy).snapshot(block)
+
+
+def main():
+    strategy = Contract(os.getenv("STRATEGY"))
+    state = read(strategy)
+    for field, value in state.__dict__.items():
+        print(f"{field}: {value}")
@@ -0,0 +1,878 @@
+"""
+Off-chain model of contracts/strategy.sol.
+
+Mirrors adjustPosition, prepareReturn, consolidate, stake/unstake, sellRewards
+and liquidatePosition on top of a simple model of the Beethoven weighted pools,
+the Qi masterChef reward emission and deposit fee, and the yearn vault report.
+The masterChef calls (claims, withdraws, leftover deposits) follow the contract.
+Where it differs from the contract:
+- gas is priced by gasPrice, in want per unit of gas, 0 (the default) leaves it out;
+- exitSwapSteps are not modelled, proportional exits swap back through the strategy pool;
+- the min out limits of the swaps are not checked, only the maxSlippageIn/Out requires.
+It is driven by the same dicts strategyConfig.getStrategyConfig returns, so
+harvest schedules and stakeParams can be evaluated without a fork:
+
+    config = strategyConfig.getStrategyConfig("MAI_Concerto_staking", None)
+    market = defaultMarket(config)
+    vault = VaultSimulator(StrategySimulator(config, market))
+    vault.deposit(100_000 * 10 ** 6)
+    result = runSchedule(vault, harvestPeriod=86400, tendPeriod=3600, duration=86400 * 30)
+
+All amounts are in token units (want with its decimals) as floats.
+No brownie imports, this module can be used from plain python.
+"""
+import math
+
+BASIS_ONE = 10_000
+MIN_REWARD_SALE = 10 ** 12  # sellRewards dust threshold
+JOIN_SIZE_MARGIN = 9_500  # bips of the fitted join size
+JOIN_SIZE_CHECKS = 3  # halvings of the fitted join size before giving up
+EXIT_BPT_TOLERANCE = 1  # bips over the quoted bpt of an exit
+MAX_REDEPOSIT_COST = 100  # bips of the leftover bpt value paid as deposit gas
+MASTERCHEF_DEPOSIT_GAS = 100_000
+SWAP_STEP_GAS = 70_000  # gas a reward route adds to the batchSwap per swap step
+DEFAULT_MAX_REWARD_IMPACT = 100  # bips of price impact a reward sale may take
+IMPACT_PROBE = 1000  # spot price of a reward sale quoted at 1/IMPACT_PROBE of its size
+IMPACT_CHECKS = 3  # rescalings of a reward sale over maxRewardImpact
+MAX_IN_RATIO = 0.3  # weighted pools MAX_IN_RATIO, also the largest join sized
+EXIT_TRANCHE = 1000  # bips of the pool want balance, or bpt supply, exited at once
+MAX_EXIT_TRANCHES = 8
+
+
+class Revert(Exception):
+    """A call that would revert on chain, the state is rolled back by the caller."""
+
+
+class WeightedPool:
+    """
+    Balancer weighted pool math with floats.
+    Balances, weights and swap fee follow the on-chain pool, weights and fee as fractions of 1.
+    """
+
+    def __init__(self, tokens, balances, weights, swapFee, totalSupply):
+        self.tokens = [token.lower() for token in tokens]
+        self.balances = [float(balance) for balance in balances]
+        self.weights = [float(weight) for weight in weights]
+        self.swapFee = float(swapFee)
+        self.totalSupply = float(totalSupply)
+
+    def index(self, token):
+        return self.tokens.index(token.lower())
+
+    def snapshot(self):
+        return list(self.balances), self.totalSupply
+
+    def restore(self, state):
+        balances, self.totalSupply = state
+        self.balances = list(balances)
+
+    def copy(self):
+        return WeightedPool(
+            self.tokens, self.balances, self.weights, self.swapFee, self.totalSupply
+        )
+
+    def outGivenIn(self, indexIn, indexOut, amountIn):
+        amountIn = amountIn * (1 - self.swapFee)
+        balanceIn = self.balances[indexIn]
+        if amountIn > balanceIn * MAX_IN_RATIO:
+            raise Revert("BAL#304")  # MAX_IN_RATIO
+        ratio = balanceIn / (balanceIn + amountIn)
+        return self.balances[indexOut] * (
+            1 - ratio ** (self.weights[indexIn] / self.weights[indexOut])
+        )
+
+    def swap(self, indexIn, indexOut, amountIn):
+        amountOut = self.outGivenIn(indexIn, indexOut, amountIn)
+        self.balances[indexIn] += amountIn
+        self.balances[indexOut] -= amountOut
+        return amountOut
+
+    def bptOutGivenExactTokensIn(self, amountsIn):
+        ratiosWithFee = [(b + a) / b for b, a in zip(self.balances, amountsIn)]
+        invariantRatioWithFees = sum(r * w for r, w in zip(ratiosWithFee, self.weights))
+        invariantRatio = 1.0
+        for i, amountIn in enumerate(amountsIn):
+            if amountIn == 0:
+                continue
+            amountInWithoutFee = amountIn
+            if ratiosWithFee[i] > invariantRatioWithFees:
+                nonTaxable = self.balances[i] * (invariantRatioWithFees - 1)
+                amountInWithoutFee = nonTaxable + (amountIn - nonTaxable) * (
+                    1 - self.swapFee
+                )
+            invariantRatio *= (
+                (self.balances[i] + amountInWithoutFee) / self.balances[i]
+            ) ** self.weights[i]
+        return self.totalSupply * max(invariantRatio - 1, 0)
+
+    def bptInGivenExactTokensOut(self, amountsOut):
+        ratiosWithoutFee = [(b - a) / b for b, a in zip(self.balances, amountsOut)]
+        invariantRatioWithoutFees = sum(
+            r * w for r, w in zip(ratiosWithoutFee, self.weights)
+        )
+        invariantRatio = 1.0
+        for i, amountOut in enumerate(amountsOut):
+            if amountOut == 0:
+                continue
+            amountOutWithFee = amountOut
+            if invariantRatioWithoutFees > ratiosWithoutFee[i]:
+                nonTaxable = self.balances[i] * (1 - invariantRatioWithoutFees)
+                amountOutWithFee = nonTaxable + (amountOut - nonTaxable) / (
+                    1 - self.swapFee
+                )
+            invariantRatio *= (
+                (self.balances[i] - amountOutWithFee) / self.balances[i]
+            ) ** self.weights[i]
+        return self.totalSupply * (1 - invariantRatio)
+
+    def tokenOutGivenExactBptIn(self, index, bptIn):
+        invariantRatio = (self.totalSupply - bptIn) / self.totalSupply
+        amountOutWithoutFee = self.balances[index] * (
+            1 - invariantRatio ** (1 / self.weights[index])
+        )
+        taxable = amountOutWithoutFee * (1 - self.weights[index])
+        return amountOutWithoutFee - taxable + taxable * (1 - self.swapFee)
+
+    def joinExactTokensIn(self, amountsIn):
+        bptOut = self.bptOutGivenExactTokensIn(amountsIn)
+        self.balances = [b + a for b, a in zip(self.balances, amountsIn)]
+        self.totalSupply += bptOut
+        return bptOut
+
+    def exitExactBptInForOneToken(self, bptIn, index):
+        amountOut = self.tokenOutGivenExactBptIn(index, bptIn)
+        self.balances[index] -= amountOut
+        self.totalSupply -= bptIn
+        return amountOut
+
+    def exitExactBptInForTokensOut(self, bptIn):
+        amountsOut = [b * bptIn / self.totalSupply for b in self.balances]
+        self.balances = [b - a for b, a in zip(self.balances, amountsOut)]
+        self.totalSupply -= bptIn
+        return amountsOut
+
+    def exitBptInForExactTokensOut(self, amountsOut, maxBptIn):
+        bptIn = self.bptInGivenExactTokensOut(amountsOut)
+        if bptIn > maxBptIn:
+            raise Revert("BAL#508")  # BPT_IN_MAX_AMOUNT
+        self.balances = [b - a for b, a in zip(self.balances, amountsOut)]
+        self.totalSupply -= bptIn
+        return bptIn
+
+
+class MasterChef:
+    """
+    Qi masterChef reward accrual for a single user (the strategy).
+    lpSupply is the lp deposited by everybody else in each pool, depositFeeBP the deposit fee of each pool.
+    """
+
+    def __init__(
+        self, rewardPerBlock, totalAllocPoint, allocPoints, lpSupply, depositFeeBP
+    ):
+        self.rewardPerBlock = float(rewardPerBlock)
+        self.totalAllocPoint = float(totalAllocPoint)
+        self.allocPoints = dict(allocPoints)
+        self.lpSupply = {pid: float(supply) for pid, supply in lpSupply.items()}
+        self.depositFeeBP = dict(depositFeeBP)
+        self.amount = {pid: 0.0 for pid in self.allocPoints}
+        self.rewardDebt = {pid: 0.0 for pid in self.allocPoints}
+        self.accPerShare = {pid: 0.0 for pid in self.allocPoints}
+        self.lastRewardBlock = {pid: 0 for pid in self.allocPoints}
+
+    def snapshot(self):
+        return tuple(
+            dict(state)
+            for state in (
+                self.amount,
+                self.rewardDebt,
+                self.accPerShare,
+                self.lastRewardBlock,
+            )
+        )
+
+    def restore(self, state):
+        self.amount, self.rewardDebt, self.accPerShare, self.lastRewardBlock = (
+            dict(pids) for pids in state
+        )
+
+    def _accPerShare(self, pid, block):
+        supply = self.lpSupply[pid] + self.amount[pid]
+        acc = self.accPerShare[pid]
+        if supply > 0 and block > self.lastRewardBlock[pid]:
+            reward = (
+                (block - self.lastRewardBlock[pid])
+                * self.rewardPerBlock
+                * self.allocPoints[pid]
+                / self.totalAllocPoint
+            )
+            acc += reward / supply
+        return acc
+
+    def pending(self, pid, block):
+        return self.amount[pid] * self._accPerShare(pid, block) - self.rewardDebt[pid]
+
+    def updatePool(self, pid, block):
+        self.accPerShare[pid] = self._accPerShare(pid, block)
+        self.lastRewardBlock[pid] = max(block, self.lastRewardBlock[pid])
+
+    def deposit(self, pid, amount, block):
+        """Returns the rewards paid out."""
+        self.updatePool(pid, block)
+        paid = self.amount[pid] * self.accPerShare[pid] - self.rewardDebt[pid]
+        self.amount[pid] += amount * (1 - self.depositFeeBP[pid] / BASIS_ONE)
+        self.rewardDebt[pid] = self.amount[pid] * self.accPerShare[pid]
+        return paid
+
+    def withdraw(self, pid, amount, block):
+        """Returns the rewards paid out."""
+        if amount > self.amount[pid] * (1 + 1e-12):
+            raise Revert("withdraw: can't withdraw more than deposit")
+        self.updatePool(pid, block)
+        paid = self.amount[pid] * self.accPerShare[pid] - self.rewardDebt[pid]
+        self.amount[pid] = max(self.amount[pid] - amount, 0.0)
+        self.rewardDebt[pid] = self.amount[pid] * self.accPerShare[pid]
+        return paid
+
+
+class Market:
+    """
+    Pools reachable by the strategy, keyed by pool address and pool id, plus the masterChef and the clock.
+    """
+
+    def __init__(self, masterChef, timestamp=0, block=0, blockTime=1.0):
+        self.pools = {}
+        self.masterChef = masterChef
+        self.timestamp = timestamp
+        self.block = block
+        self.blockTime = blockTime
+
+    def addPool(self, pool, *keys):
+        for key in keys:
+            self.pools[key.lower()] = pool
+        return pool
+
+    def pool(self, key):
+        return self.pools[key.lower()]
+
+    def sleep(self, seconds):
+        self.timestamp += seconds
+        self.block += int(seconds / self.blockTime)
+
+    def snapshot(self):
+        """State a transaction can change, the pools are listed once whatever the number of keys."""
+        pools = {id(pool): pool for pool in self.pools.values()}
+        return (
+            self.timestamp,
+            self.block,
+            [(pool, pool.snapshot()) for pool in pools.values()],
+            self.masterChef.snapshot(),
+        )
+
+    def restore(self, state):
+        self.timestamp, self.block, pools, masterChef = state
+        for pool, poolState in pools:
+            pool.restore(poolState)
+        self.masterChef.restore(masterChef)
+
+
+class StrategySimulator:
+    """
+    State and logic of Strategy for one strategyConfig entry.
+    """
+
+    def __init__(self, config, market, want=None, wantDecimals=6):
+        deployArgs = config["deployArgs"]
+        self.market = market
+        self.balancerPool = deployArgs[2].lower()
+        self.maxSlippageIn = deployArgs[4]
+        self.maxSlippageOut = deployArgs[5]
+        self.maxSingleDeposit = deployArgs[6] * 10 ** wantDecimals
+        self.minDepositPeriod = deployArgs[7]
+        self.masterChefPoolId = deployArgs[8]
+        self.stakePercentage, self.unstakePercentage = config["stakeParams"]
+        self.maxRewardImpact = DEFAULT_MAX_REWARD_IMPACT
+
+        poolIds, routeAssets = config["whitelistReward"]["steps"]
+        self.swapPoolIds = [poolId.lower() for poolId in poolIds]
+        self.swapAssets = [asset.lower() for asset in routeAssets]
+        self.rewardToken = config["whitelistReward"]["rewardToken"].lower()
+        self.want = (want or self.swapAssets[-1]).lower()
+        self.tokenIndex = self.pool.index(self.want)
+
+        stakeInfo = config["stakeInfo"]
+        self.stakePool = stakeInfo["stakePool"].lower() if stakeInfo else None
+        self.stakeTokenIndex = stakeInfo.get("stakeTokenIndex", 0)
+        self.stakeWantIndex = stakeInfo.get("stakeWantIndex", 0)
+        self.masterChefStakePoolId = stakeInfo.get("masterChefStakePoolId", 0)
+
+        self.wantBalance = 0.0
+        self.bpt = 0.0
+        self.stakeBpt = 0.0
+        self.rewards = 0.0
+        self.lastDepositTime = 0
+        self.totalDebt = 0.0
+        self.gasPrice = (
+            0.0  # want per unit of gas, what ethToWant(tx.gasprice) gives on chain
+        )
+        self.claimed = (
+            False  # the main pool paid its rewards in this call, Position.claimed
+        )
+
+    @property
+    def pool(self):
+        return self.market.pool(self.balancerPool)
+
+    @property
+    def masterChef(self):
+        return self.market.masterChef
+
+    def balanceOfBptInMasterChef(self):
+        return self.masterChef.amount[self.masterChefPoolId]
+
+    def balanceOfStakeBptInMasterChef(self):
+        if self.stakePool is None:
+            return 0.0
+        return self.masterChef.amount[self.masterChefStakePoolId]
+
+    def totalBalanceOfBpt(self):
+        return self.bpt + self.balanceOfBptInMasterChef()
+
+    def balanceOfPooled(self):
+        pool = self.pool
+        bpts = self.totalBalanceOfBpt()
+        if bpts == 0:
+            return 0.0
+        pooled = 0.0
+        for i, balance in enumerate(pool.balances):
+            tokenPooled = balance * bpts / pool.totalSupply
+            if tokenPooled > 0 and i != self.tokenIndex:
+                tokenPooled = pool.outGivenIn(i, self.tokenIndex, tokenPooled)
+            pooled += tokenPooled
+        return pooled
+
+    def estimatedTotalAssets(self):
+        return self.wantBalance + self.balanceOfPooled()
+
+    def wantToLPAmount(self, wantAmount):
+        if wantAmount <= 0:
+            return 0.0
+        amountsOut = [0.0] * len(self.pool.balances)
+        amountsOut[self.tokenIndex] = wantAmount
+        return self.pool.bptInGivenExactTokensOut(amountsOut) * (
+            1 + EXIT_BPT_TOLERANCE / BASIS_ONE
+        )
+
+    def _exitPoolForWant(self, wantAmount):
+        tranches = exitTranches(wantAmount, self.pool.balances[self.tokenIndex])
+        for _ in range(tranches):
+            self._exitTrancheForWant(wantAmount / tranches)
+        self._depositLeftoverBpt()
+
+    def _exitTrancheForWant(self, wantAmount):
+        bptNeeded = min(self.wantToLPAmount(wantAmount), self.totalBalanceOfBpt())
+        proportionalOut = self.proportionalExitOut(bptNeeded)
+        if proportionalOut > wantAmount:
+            bptNeeded = bptNeeded * wantAmount / proportionalOut
+        if bptNeeded > self.bpt:
+            self._withdraw(self.masterChefPoolId, bptNeeded - self.bpt)
+            self.bpt = bptNeeded
+        if proportionalOut > wantAmount:
+            self.exitProportional(bptNeeded)
+        else:
+            self.exitPoolExactToken(wantAmount)
+
+    def _exitPoolExactBptForWant(self, bpts):
+        tranches = exitTranches(bpts, self.pool.totalSupply)
+        for _ in range(tranches):
+            tranche = bpts / tranches
+            if self.proportionalExitOut(tranche) > self.pool.tokenOutGivenExactBptIn(
+                self.tokenIndex, tranche
+            ):
+                self.exitProportional(tranche)
+            else:
+                self.wantBalance += self.pool.exitExactBptInForOneToken(
+                    tranche, self.tokenIndex
+                )
+                self.bpt -= tranche
+
+    def proportionalExitOut(self, bpts):
+        """Want out of a proportional exit with the other tokens swapped back through the pool, 0 if a swap reverts."""
+        pool = self.pool.copy()
+        amountsOut = pool.exitExactBptInForTokensOut(bpts)
+        wantOut = amountsOut[self.tokenIndex]
+        for i, amount in enumerate(amountsOut):
+            if i == self.tokenIndex or amount <= 0:
+                continue
+            try:
+                wantOut += pool.outGivenIn(i, self.tokenIndex, amount)
+            except Revert:
+                return 0.0
+        return wantOut
+
+    def exitProportional(self, bpts):
+        amountsOut = self.pool.exitExactBptInForTokensOut(bpts)
+        self.bpt -= bpts
+        for i, amount in enumerate(amountsOut):
+            if i == self.tokenIndex:
+                self.wantBalance += amount
+            elif amount > 0:
+                self.wantBalance += self.pool.swap(i, self.tokenIndex, amount)
+
+    def _depositLeftoverBpt(self):
+        # Gas only, the deposit fee is charged whenever the leftover goes in
+        if self.bpt <= 0:
+            return
+        totalBpt = self.totalBalanceOfBpt()
+        value = self.bpt * self.balanceOfPooled() / totalBpt
+        if (
+            MASTERCHEF_DEPOSIT_GAS * self.gasPrice * BASIS_ONE
+            <= value * MAX_REDEPOSIT_COST
+        ):
+            self._deposit(self.masterChefPoolId, self.bpt)
+            self.bpt = 0.0
+
+    # -- masterChef -- #
+
+    def _deposit(self, pid, amount):
+        self.claimed |= pid == self.masterChefPoolId
+        self.rewards += self.masterChef.deposit(pid, amount, self.market.block)
+
+    def _withdraw(self, pid, amount):
+        self.claimed |= pid == self.masterChefPoolId
+        self.rewards += self.masterChef.withdraw(pid, amount, self.market.block)
+
+    def claimAllRewards(self):
+        """Skips the pools a deposit or withdraw already paid, like Strategy.claimAllRewards."""
+        if not self.claimed and self.balanceOfBptInMasterChef() > 0:
+            self._deposit(self.masterChefPoolId, 0)
+        stakeBptInMasterChef = self.balanceOfStakeBptInMasterChef()
+        if (
+            stakeBptInMasterChef > 0
+            and stakeBptInMasterChef * self.unstakePercentage / BASIS_ONE == 0
+        ):
+            self._deposit(self.masterChefStakePoolId, 0)
+
+    # -- harvest stages -- #
+
+    def prepareReturn(self, debtOutstanding):
+        loss = 0.0
+        debtPayment = 0.0
+        self.claimed = False
+        if debtOutstanding > 0:
+            debtPayment, loss = self.liquidatePosition(debtOutstanding)
+
+        beforeWant = self.wantBalance
+        self.collectTradingFees()
+        self.claimAllRewards()
+        self.consolidate()
+        self.sellRewards()
+
+        profit = self.wantBalance - beforeWant
+        if profit > loss:
+            return profit - loss, 0.0, debtPayment
+        return 0.0, loss - profit, debtPayment
+
+    def adjustPosition(self, debtOutstanding):
+        if self.market.timestamp - self.lastDepositTime < self.minDepositPeriod:
+            return
+
+        self.claimed = False
+        pooledBefore = self.balanceOfPooled()
+        amountIn = self.maxJoinAmount(min(self.maxSingleDeposit, self.wantBalance))
+        if amountIn > 0:
+            amountsIn = [0.0] * len(self.pool.balances)
+            amountsIn[self.tokenIndex] = amountIn
+            self.bpt += self.pool.joinExactTokensIn(amountsIn)
+            self.wantBalance -= amountIn
+            # The deposit fee is charged on top of maxSlippageIn
+            pooledDelta = self.balanceOfPooled() - pooledBefore
+            joinSlipped = max(amountIn - pooledDelta, 0)
+            if joinSlipped > amountIn * self.maxSlippageIn / BASIS_ONE:
+                raise Revert("Slipped in!")
+
+            self._deposit(self.masterChefPoolId, self.bpt)
+            self.bpt = 0.0
+            self.lastDepositTime = self.market.timestamp
+        else:
+            self._depositLeftoverBpt()
+            if self.wantBalance > 0:
+                self.lastDepositTime = self.market.timestamp
+
+        self.claimAllRewards()
+        self.consolidate()
+
+    def maxJoinAmount(self, amount):
+        """Largest join up to amount within maxSlippageIn, fitted like _maxJoinAmount."""
+        amount = min(amount, self.pool.balances[self.tokenIndex] * MAX_IN_RATIO)
+        if amount <= 0:
+            return 0.0
+        pooled = self._quotePooled(
+            self.pool.balances, self.totalBalanceOfBpt(), self.pool.totalSupply
+        )
+        tolerance = self.maxSlippageIn / BASIS_ONE
+        slippage = self._joinSlippage(amount, pooled) / amount
+        if slippage <= tolerance:
+            return amount
+
+        half = amount / 2
+        halfSlippage = self._joinSlippage(half, pooled) / half
+        if halfSlippage >= slippage:
+            amountIn = half / 2
+        else:
+            amountIn = half + (tolerance - halfSlippage) * (amount - half) / (
+                slippage - halfSlippage
+            )
+            amountIn = max(amountIn, 0.0) * JOIN_SIZE_MARGIN / BASIS_ONE
+        for _ in range(JOIN_SIZE_CHECKS):
+            if amountIn <= 0:
+                break
+            if self._joinSlippage(amountIn, pooled) <= amountIn * tolerance:
+                return amountIn
+            amountIn /= 2
+        return 0.0
+
+    def _joinSlippage(self, amountIn, pooled):
+        pool = self.pool
+        amountsIn = [0.0] * len(pool.balances)
+        amountsIn[self.tokenIndex] = amountIn
+        bptOut = pool.bptOutGivenExactTokensIn(amountsIn)
+        balances = [b + a for b, a in zip(pool.balances, amountsIn)]
+        bpts = self.totalBalanceOfBpt() + bptOut
+        pooledDelta = max(
+            self._quotePooled(balances, bpts, pool.totalSupply + bptOut) - pooled, 0
+        )
+        return max(amountIn - pooledDelta, 0)
+
+    def _quotePooled(self, balances, bpts, totalSupply):
+        pool = self.pool
+        quote = WeightedPool(
+            pool.tokens, balances, pool.weights, pool.swapFee, totalSupply
+        )
+        pooled = 0.0
+        for i, balance in enumerate(balances):
+            tokenPooled = balance * bpts / totalSupply
+            if tokenPooled > 0 and i != self.tokenIndex:
+                if tokenPooled * (1 - pool.swapFee) > balance * MAX_IN_RATIO:
+                    return (
+                        0.0  # over the max in ratio, the join would revert on valuation
+                    )
+                tokenPooled = quote.outGivenIn(i, self.tokenIndex, tokenPooled)
+            pooled += tokenPooled
+        return pooled
+
+    def collectTradingFees(self):
+        totalAssets = self.estimatedTotalAssets()
+        if totalAssets > self.totalDebt:
+            self._exitPoolForWant(totalAssets - self.totalDebt)
+
+    def exitPoolExactToken(self, amountOut):
+        amountsOut = [0.0] * len(self.pool.balances)
+        amountsOut[self.tokenIndex] = amountOut
+        self.bpt -= self.pool.exitBptInForExactTokensOut(amountsOut, self.bpt)
+        self.wantBalance += amountOut
+
+    def consolidate(self):
+        self.unstake()
+        self.stake(self.rewards * self.stakePercentage / BASIS_ONE)
+
+    def stake(self, amount):
+        if amount <= 0 or self.stakePool is None:
+            return
+        stakePool = self.market.pool(self.stakePool)
+        amountsIn = [0.0] * len(stakePool.balances)
+        amountsIn[self.stakeTokenIndex] = amount
+        self.rewards -= amount
+        self.stakeBpt += stakePool.joinExactTokensIn(amountsIn)
+        self._deposit(self.masterChefStakePoolId, self.stakeBpt)
+        self.stakeBpt = 0.0
+
+    def unstake(self):
+        bpts = self.balanceOfStakeBptInMasterChef() * self.unstakePercentage / BASIS_ONE
+        if bpts <= 0:
+            return
+        # The withdraw pays the pending rewards of the stake pool
+        self._withdraw(self.masterChefStakePoolId, bpts)
+        stakePool = self.market.pool(self.stakePool)
+        self.rewards += stakePool.exitExactBptInForOneToken(bpts, self.stakeTokenIndex)
+
+    def quoteRewards(self, amount):
+        """Want out of amount rewards along the swap steps, 0 if a hop rejects it."""
+        for j, poolId in enumerate(self.swapPoolIds):
+            pool = self.market.pool(poolId)
+            try:
+                amount = pool.outGivenIn(
+                    pool.index(self.swapAssets[j]),
+                    pool.index(self.swapAssets[j + 1]),
+                    amount,
+                )
+            except Revert:
+                return 0.0
+        return amount
+
+    def rewardSale(self):
+        """
+        Rewards to sell, capped to about maxRewardImpact of price impact like Strategy._rewardSale.
+        0 if the sale does not pay for the gas of its swap steps.
+        """
+        sale = self.rewards
+        amountOut = self.quoteRewards(sale)
+        spotOut = self.quoteRewards(sale / IMPACT_PROBE) * IMPACT_PROBE
+        for _ in range(IMPACT_CHECKS):
+            if self.maxRewardImpact == 0 or amountOut * BASIS_ONE >= spotOut * (
+                BASIS_ONE - self.maxRewardImpact
+            ):
+                break
+            scale = self.maxRewardImpact / ((spotOut - amountOut) * BASIS_ONE / spotOut)
+            sale *= scale
+            spotOut *= scale
+            amountOut = self.quoteRewards(sale)
+        if amountOut <= SWAP_STEP_GAS * self.gasPrice * len(self.swapPoolIds):
+            return 0.0
+        return sale
+
+    def sellRewards(self):
+        if self.rewards <= MIN_REWARD_SALE:
+            return
+        amount = sale = self.rewardSale()
+        if sale <= 0:
+            return
+        for j, poolId in enumerate(self.swapPoolIds):
+            pool = self.market.pool(poolId)
+            amount = pool.swap(
+                pool.index(self.swapAssets[j]),
+                pool.index(self.swapAssets[j + 1]),
+                amount,
+            )
+        self.rewards -= sale
+        self.wantBalance += amount
+
+    def liquidatePosition(self, amountNeeded):
+        looseAmount = self.wantBalance
+        if amountNeeded <= looseAmount:
+            return amountNeeded, 0.0
+        if self.estimatedTotalAssets() < amountNeeded:
+            liquidated = self.liquidateAllPositions()
+            return liquidated, amountNeeded - liquidated
+
+        toExitAmount = amountNeeded - looseAmount
+        self._exitPoolForWant(toExitAmount)
+
+        liquidated = min(self.wantBalance, amountNeeded)
+        self._enforceSlippageOut(toExitAmount, liquidated - looseAmount)
+        return liquidated, amountNeeded - liquidated
+
+    def liquidateAllPositions(self):
+        eta = self.estimatedTotalAssets()
+        # withdrawAndHarvest, the withdraws pay the pending rewards and nothing is called for 0 lp
+        bptInMasterChef = self.balanceOfBptInMasterChef()
+        if bptInMasterChef > 0:
+            self._withdraw(self.masterChefPoolId, bptInMasterChef)
+            self.bpt += bptInMasterChef
+        stakeBptInMasterChef = self.balanceOfStakeBptInMasterChef()
+        if stakeBptInMasterChef > 0:
+            self._withdraw(self.masterChefStakePoolId, stakeBptInMasterChef)
+            self.stakeBpt += stakeBptInMasterChef
+
+        if self.bpt > 0:
+            self._exitPoolExactBptForWant(self.bpt)
+            self.bpt = 0.0
+        if self.stakeBpt > 0:
+            # Staked bpt exit into the stake pool want token, which is not the strategy want
+            stakePool = self.market.pool(self.stakePool)
+            stakePool.exitExactBptInForOneToken(self.stakeBpt, self.stakeWantIndex)
+            self.stakeBpt = 0.0
+        self.sellRewards()
+
+        liquidated = self.wantBalance
+        self._enforceSlippageOut(eta, liquidated)
+        return liquidated
+
+    def _enforceSlippageOut(self, intended, actual):
+        exitSlipped = max(intended - actual, 0)
+        if exitSlipped > intended * self.maxSlippageOut / BASIS_ONE:
+            raise Revert("Slipped")
+
+    def tendTrigger(self):
+        return (
+            self.market.timestamp - self.lastDepositTime > self.minDepositPeriod
+            and self.wantBalance > 0
+        )
+
+
+class VaultSimulator:
+    """
+    Yearn vault accounting needed to drive harvests: debt ratio, credit and debt outstanding.
+    Fees and profit locking are not modelled.
+    """
+
+    def __init__(self, strategy, debtRatio=BASIS_ONE):
+        self.strategy = strategy
+        self.debtRatio = debtRatio
+        self.totalIdle = 0.0
+        self.reverts = 0
+
+    @property
+    def totalDebt(self):
+        return self.strategy.totalDebt
+
+    def totalAssets(self):
+        return self.totalIdle + self.totalDebt
+
+    def deposit(self, amount):
+        self.totalIdle += amount
+
+    def debtLimit(self):
+        return self.totalAssets() * self.debtRatio / BASIS_ONE
+
+    def creditAvailable(self):
+        if self.totalDebt >= self.debtLimit():
+            return 0.0
+        return min(self.debtLimit() - self.totalDebt, self.totalIdle)
+
+    def debtOutstanding(self):
+        return max(self.totalDebt - self.debtLimit(), 0.0)
+
+    def _transaction(self, fn):
+        """
+        Runs fn, rolling back the strategy and the market if it reverts.
+        Only the state a transaction changes is saved: the strategy fields (scalars, the market and
+        the route lists are kept by reference), the pool balances and the masterChef accounting.
+        """
+        strategy = dict(self.strategy.__dict__)
+        market = self.strategy.market.snapshot()
+        totalIdle = self.totalIdle
+        try:
+            fn()
+            return True
+        except Revert:
+            self.strategy.__dict__.update(strategy)
+            self.strategy.market.restore(market)
+            self.totalIdle = totalIdle
+            self.reverts += 1
+            return False
+
+    def harvest(self):
+        return self._transaction(self._harvest)
+
+    def tend(self):
+        return self._transaction(
+            lambda: self.strategy.adjustPosition(self.debtOutstanding())
+        )
+
+    def _harvest(self):
+        strategy = self.strategy
+        debtOutstanding = self.debtOutstanding()
+        profit, loss, debtPayment = strategy.prepareReturn(debtOutstanding)
+
+        # vault.report
+        strategy.totalDebt -= loss
+        credit = self.creditAvailable()
+        debtPayment = min(debtPayment, self.debtOutstanding())
+        strategy.totalDebt += credit - debtPayment
+        totalAvailable = profit + debtPayment
+        if totalAvailable < credit:
+            strategy.wantBalance += credit - totalAvailable
+            self.totalIdle -= credit - totalAvailable
+        else:
+            strategy.wantBalance -= totalAvailable - credit
+            self.totalIdle += totalAvailable - credit
+
+        strategy.adjustPosition(self.debtOutstanding())
+
+
+def exitTranches(amount, poolAmount):
+    """Tranches Strategy._exitTranches splits an exit of amount in."""
+    tranche = poolAmount * EXIT_TRANCHE / BASIS_ONE
+    if tranche <= 0:
+        return 1
+    return max(1, min(math.ceil(amount / tranche), MAX_EXIT_TRANCHES))
+
+
+def runSchedule(vault, harvestPeriod, tendPeriod, duration, rewardsPerSecond=0):
+    """
+    Harvests every harvestPeriod and tends every tendPeriod (when tendTrigger is true) for duration seconds.
+    rewardsPerSecond airdrops reward tokens to the strategy on top of the masterChef emission.
+    """
+    strategy = vault.strategy
+    market = strategy.market
+    startAssets = vault.totalAssets()
+    step = min(harvestPeriod, tendPeriod) if tendPeriod else harvestPeriod
+    nextHarvest = market.timestamp
+    nextTend = market.timestamp + (tendPeriod or duration + 1)
+    end = market.timestamp + duration
+    harvests = tends = 0
+    while market.timestamp <= end:
+        if market.timestamp >= nextHarvest:
+            harvests += vault.harvest()
+            nextHarvest += harvestPeriod
+        elif market.timestamp >= nextTend:
+            if strategy.tendTrigger():
+                tends += vault.tend()
+            nextTend += tendPeriod
+        market.sleep(step)
+        strategy.rewards += rewardsPerSecond * step
+
+    vault.harvest()
+    endAssets = vault.totalAssets()
+    return {
+        "harvests": harvests,
+        "tends": tends,
+        "reverts": vault.reverts,
+        "startAssets": startAssets,
+        "endAssets": endAssets,
+        "apr": (endAssets - startAssets) / startAssets * (86400 * 365) / duration,
+    }
+
+
+def defaultMarket(config, blockTime=1.0):
+    """
+    Market with pools shaped like the Fantom pools used by strategyConfig.
+    Same balances, weights and fees as scripts/localProtocols.py.
+    """
+    masterChef = MasterChef(
+        rewardPerBlock=10 ** 18,
+        totalAllocPoint=200,
+        allocPoints={0: 100, 1: 100},
+        lpSupply={0: 20_000_000 * 10 ** 18, 1: 4_000_000 * 10 ** 18},
+        depositFeeBP={0: 50, 1: 50},
+    )
+    market = Market(masterChef, blockTime=blockTime)
+
+    deployArgs = config["deployArgs"]
+    poolIds, routeAssets = config["whitelistReward"]["steps"]
+    qi, wftm, usdc = routeAssets
+    mai = "0x0000000000000000000000000000000000000001"
+
+    market.addPool(
+        WeightedPool(
+            [usdc, mai],
+            [10_000_000 * 10 ** 6, 10_000_000 * 10 ** 18],
+            [0.5, 0.5],
+            0.001,
+            20_000_000 * 10 ** 18,
+        ),
+        deployArgs[2],
+    )
+    qiMajor = market.addPool(
+        WeightedPool(
+            [wftm, qi],
+            [1_000_000 * 10 ** 18, 3_000_000 * 10 ** 18],
+            [0.4, 0.6],
+            0.003,
+            4_000_000 * 10 ** 18,
+        ),
+        poolIds[0],
+    )
+    if config["stakeInfo"]:
+        market.addPool(qiMajor, config["stakeInfo"]["stakePool"])
+    market.addPool(
+        WeightedPool(
+            [wftm, usdc],
+            [7_000_000 * 10 ** 18, 6_000_000 * 10 ** 6],
+            [0.7, 0.3],
+            0.002,
+            13_000_000 * 10 ** 18,
+        ),
+        poolIds[1],
+    )
+    return market
@@ -0,0 +1,547 @@
+"""
+Balancer V2 weighted pool math, exact to the wei.
+
+Integer port of FixedPoint, LogExpMath and WeightedMath from balancer-v2-monorepo
+as deployed by Beethoven (WeightedPool / WeightedPool2Tokens): 18 decimals fixed
+point, the LogExpMath pow approximation with its MAX_POW_RELATIVE_ERROR allowance,
+the scaling of each token to 18 decimals, swap fees and the rounding direction of
+every operation. Quotes match the pool's onSwap, joinPool, exitPool and the
+vault's batchSwap for the same state:
+
+    pool = WeightedPoolState(tokens, balances, weights, swapFee, totalSupply, decimals)
+    amountOut = pool.onSwapGivenIn(indexIn, indexOut, amountIn)
+    bptOut = pool.joinExactTokensIn(amountsIn)
+
+The batch functions quote numpy arrays of amounts against one pool state in float64
+with the same formulas, fees and pow error allowances, millions of quotes per second.
+They agree with the exact results to 1e-9 relative, or 1e-15 of the pool balance for
+dust amounts where the 18 decimals ratios on chain run out of resolution:
+
+    amountsOut = batchOutGivenIn(pool, indexIn, indexOut, np.linspace(1e6, 1e12, 1_000_000))
+
+Amounts are integers in token units, weights and fees 18 decimals integers.
+No brownie imports, this module can be used from plain python.
+"""
+import copy
+
+import numpy as np
+
+ONE = 10 ** 18
+MAX_POW_RELATIVE_ERROR = 10_000  # 10^(-14)
+MIN_POW_BASE_FREE_EXPONENT = 7 * 10 ** 17
+
+MAX_IN_RATIO = 3 * 10 ** 17
+MAX_OUT_RATIO = 3 * 10 ** 17
+MAX_INVARIANT_RATIO = 3 * ONE
+MIN_INVARIANT_RATIO = 7 * 10 ** 17
+
+
+class BalancerError(Exception):
+    """A quote the pool or the vault would revert, with the Balancer error name."""
+
+
+def _require(condition, error):
+    if not condition:
+        raise BalancerError(error)
+
+
+def _sdiv(a, b):
+    # Solidity int256 division truncates towards zero
+    q = abs(a) // abs(b)
+    return q if (a >= 0) == (b > 0) else -q
+
+
+def _smod(a, b):
+    return a - _sdiv(a, b) * b
+
+
+# FixedPoint
+
+
+def mulDown(a, b):
+    return a * b // ONE
+
+
+def mulUp(a, b):
+    product = a * b
+    return 0 if product == 0 else (product - 1) // ONE + 1
+
+
+def divDown(a, b):
+    _require(b != 0, "ZERO_DIVISION")
+    return a * ONE // b
+
+
+def divUp(a, b):
+    _require(b != 0, "ZERO_DIVISION")
+    return 0 if a == 0 else (a * ONE - 1) // b + 1
+
+
+def powDown(x, y):
+    raw = logExpPow(x, y)
+    maxError = mulUp(raw, MAX_POW_RELATIVE_ERROR) + 1
+    return 0 if raw < maxError else raw - maxError
+
+
+def powUp(x, y):
+    raw = logExpPow(x, y)
+    return raw + mulUp(raw, MAX_POW_RELATIVE_ERROR) + 1
+
+
+def complement(x):
+    return ONE - x if x < ONE else 0
+
+
+def sub(a, b):
+    _require(b <= a, "SUB_OVERFLOW")
+    return a - b
+
+
+# LogExpMath
+
+ONE_18 = 10 ** 18
+ONE_20 = 10 ** 20
+ONE_36 = 10 ** 36
+MAX_NATURAL_EXPONENT = 130 * ONE_18
+MIN_NATURAL_EXPONENT = -41 * ONE_18
+LN_36_LOWER_BOUND = ONE_18 - 10 ** 17
+LN_36_UPPER_BOUND = ONE_18 + 10 ** 17
+MILD_EXPONENT_BOUND = 2 ** 254 // ONE_20
+
+# e^x for x = 2^7 and 2^6 with 18 decimals x and no decimals e^x
+X0, A0 = 128000000000000000000, 38877084059945950922200000000000000000000000000000000000
+X1, A1 = 64000000000000000000, 6235149080811616882910000000
+# e^x for x = 2^5 ... 2^-4, 20 decimals
+X_20 = [
+    3200000000000000000000,
+    1600000000000000000000,
+    800000000000000000000,
+    400000000000000000000,
+    200000000000000000000,
+    100000000000000000000,
+    50000000000000000000,
+    25000000000000000000,
+    12500000000000000000,
+    6250000000000000000,
+]
+A_20 = [
+    7896296018268069516100000000000000,
+    888611052050787263676000000,
+    298095798704172827474000,
+    5459815003314423907810,
+    738905609893065022723,
+    271828182845904523536,
+    164872127070012814685,
+    128402541668774148407,
+    113314845306682631683,
+    106449445891785942956,
+]
+
+
+def logExpPow(x, y):
+    """x^y with 18 decimals, LogExpMath.pow."""
+    if y == 0:
+        return ONE_18
+    if x == 0:
+        return 0
+    _require(x < 2 ** 255, "X_OUT_OF_BOUNDS")
+    _require(y < MILD_EXPONENT_BOUND, "Y_OUT_OF_BOUNDS")
+
+    if LN_36_LOWER_BOUND < x < LN_36_UPPER_BOUND:
+        ln36 = _ln36(x)
+        logxTimesY = _sdiv(ln36, ONE_18) * y + _sdiv(_smod(ln36, ONE_18) * y, ONE_18)
+    else:
+        logxTimesY = _ln(x) * y
+    logxTimesY = _sdiv(logxTimesY, ONE_18)
+
+    _require(
+        MIN_NATURAL_EXPONENT <= logxTimesY <= MAX_NATURAL_EXPONENT,
+        "PRODUCT_OUT_OF_BOUNDS",
+    )
+    return logExpExp(logxTimesY)
+
+
+def logExpExp(x):
+    """e^x with 18 decimals, LogExpMath.exp."""
+    _require(MIN_NATURAL_EXPONENT <= x <= MAX_NATURAL_EXPONENT, "INVALID_EXPONENT")
+    if x < 0:
+        return _sdiv(ONE_18 * ONE_18, logExpExp(-x))
+
+    if x >= X0:
+        x -= X0
+        firstAN = A0
+    elif x >= X1:
+        x -= X1
+        firstAN = A1
+    else:
+        firstAN = 1
+
+    x *= 100
+    product = ONE_20
+    for xn, an in zip(X_20[:8], A_20[:8]):
+        if x >= xn:
+            x -= xn
+            product = _sdiv(product * an, ONE_20)
+
+    seriesSum = ONE_20
+    term = x
+    seriesSum += term
+    for k in range(2, 13):
+        term = _sdiv(_sdiv(term * x, ONE_20), k)
+        seriesSum += term
+
+    return _sdiv(_sdiv(product * seriesSum, ONE_20) * firstAN, 100)
+
+
+def _ln(a):
+    if a < ONE_18:
+        return -_ln(_sdiv(ONE_18 * ONE_18, a))
+
+    total = 0
+    if a >= A0 * ONE_18:
+        a = _sdiv(a, A0)
+        total += X0
+    if a >= A1 * ONE_18:
+        a = _sdiv(a, A1)
+        total += X1
+
+    total *= 100
+    a *= 100
+    for xn, an in zip(X_20, A_20):
+        if a >= an:
+            a = _sdiv(a * ONE_20, an)
+            total += xn
+
+    z = _sdiv((a - ONE_20) * ONE_20, a + ONE_20)
+    zSquared = _sdiv(z * z, ONE_20)
+    num = z
+    seriesSum = num
+    for k in (3, 5, 7, 9, 11):
+        num = _sdiv(num * zSquared, ONE_20)
+        seriesSum += _sdiv(num, k)
+    seriesSum *= 2
+
+    return _sdiv(total + seriesSum, 100)
+
+
+def _ln36(x):
+    x *= ONE_18
+    z = _sdiv((x - ONE_36) * ONE_36, x + ONE_36)
+    zSquared = _sdiv(z * z, ONE_36)
+    num = z
+    seriesSum = num
+    for k in (3, 5, 7, 9, 11, 13, 15):
+        num = _sdiv(num * zSquared, ONE_36)
+        seriesSum += _sdiv(num, k)
+    return seriesSum * 2
+
+
+# WeightedMath, upscaled 18 decimals amounts
+
+
+def calcInvariant(weights, balances):
+    invariant = ONE
+    for weight, balance in zip(weights, balances):
+        invariant = mulDown(invariant, powDown(balance, weight))
+    _require(invariant > 0, "ZERO_INVARIANT")
+    return invariant
+
+
+def calcOutGivenIn(balanceIn, weightIn, balanceOut, weightOut, amountIn):
+    _require(amountIn <= mulDown(balanceIn, MAX_IN_RATIO), "MAX_IN_RATIO")
+    base = divUp(balanceIn, balanceIn + amountIn)
+    power = powUp(base, divDown(weightIn, weightOut))
+    return mulDown(balanceOut, complement(power))
+
+
+def calcInGivenOut(balanceIn, weightIn, balanceOut, weightOut, amountOut):
+    _require(amountOut <= mulDown(balanceOut, MAX_OUT_RATIO), "MAX_OUT_RATIO")
+    base = divUp(balanceOut, sub(balanceOut, amountOut))
+    power = powUp(base, divUp(weightOut, weightIn))
+    return mulUp(balanceIn, sub(power, ONE))
+
+
+def calcBptOutGivenExactTokensIn(balances, weights, amountsIn, totalSupply, swapFee):
+    balanceRatiosWithFee = [
+        divDown(balance + amountIn, balance)
+        for balance, amountIn in zip(balances, amountsIn)
+    ]
+    invariantRatioWithFees = sum(
+        mulDown(ratio, weight) for ratio, weight in zip(balanceRatiosWithFee, weights)
+    )
+
+    invariantRatio = ONE
+    for i, balance in enumerate(balances):
+        amountInWithoutFee = amountsIn[i]
+        if balanceRatiosWithFee[i] > invariantRatioWithFees:
+            # Only the non proportional part of the join is charged the swap fee
+            nonTaxableAmount = mulDown(balance, sub(invariantRatioWithFees, ONE))
+            taxableAmount = sub(amountsIn[i], nonTaxableAmount)
+            amountInWithoutFee = nonTaxableAmount + mulDown(
+                taxableAmount, sub(ONE, swapFee)
+            )
+        balanceRatio = divDown(balance + amountInWithoutFee, balance)
+        invariantRatio = mulDown(invariantRatio, powDown(balanceRatio, weights[i]))
+
+    return mulDown(totalSupply, invariantRatio - ONE) if invariantRatio >= ONE else 0
+
+
+def calcBptInGivenExactTokensOut(balances, weights, amountsOut, totalSupply, swapFee):
+    balanceRatiosWithoutFee = [
+        divUp(sub(balance, amountOut), balance)
+        for balance, amountOut in zip(balances, amountsOut)
+    ]
+    invariantRatioWithoutFees = sum(
+        mulUp(ratio, weight) for ratio, weight in zip(balanceRatiosWithoutFee, weights)
+    )
+
+    invariantRatio = ONE
+    for i, balance in enumerate(balances):
+        amountOutWithFee = amountsOut[i]
+        if invariantRatioWithoutFees > balanceRatiosWithoutFee[i]:
+            # Only the non proportional part of the exit is charged the swap fee
+            nonTaxableAmount = mulDown(balance, complement(invariantRatioWithoutFees))
+            taxableAmount = sub(amountsOut[i], nonTaxableAmount)
+            amountOutWithFee = nonTaxableAmount + divUp(
+                taxableAmount, complement(swapFee)
+            )
+        balanceRatio = divDown(sub(balance, amountOutWithFee), balance)
+        invariantRatio = mulDown(invariantRatio, powDown(balanceRatio, weights[i]))
+
+    return mulUp(totalSupply, complement(invariantRatio))
+
+
+def calcTokenOutGivenExactBptIn(balance, weight, bptAmountIn, totalSupply, swapFee):
+    invariantRatio = divUp(sub(totalSupply, bptAmountIn), totalSupply)
+    _require(invariantRatio >= MIN_INVARIANT_RATIO, "MIN_BPT_IN_FOR_TOKEN_OUT")
+    balanceRatio = powUp(invariantRatio, divDown(ONE, weight))
+    amountOutWithoutFee = mulDown(balance, complement(balanceRatio))
+
+    # Only the part of the exit that is not proportional to the weight is charged the swap fee
+    taxableAmount = mulUp(amountOutWithoutFee, complement(weight))
+    nonTaxableAmount = sub(amountOutWithoutFee, taxableAmount)
+    return nonTaxableAmount + mulDown(taxableAmount, complement(swapFee))
+
+
+def calcTokensOutGivenExactBptIn(balances, bptAmountIn, totalSupply):
+    bptRatio = divDown(bptAmountIn, totalSupply)
+    return [mulDown(balance, bptRatio) for balance in balances]
+
+
+def calcDueTokenProtocolSwapFeeAmount(
+    balance, weight, previousInvariant, currentInvariant, protocolSwapFee
+):
+    if currentInvariant <= previousInvariant:
+        return 0
+    base = max(divUp(previousInvariant, currentInvariant), MIN_POW_BASE_FREE_EXPONENT)
+    power = powUp(base, divDown(ONE, weight))
+    return mulDown(mulDown(balance, complement(power)), protocolSwapFee)
+
+
+class WeightedPoolState:
+    """
+    State of one weighted pool as the vault hands it to the pool: balances in token units,
+    weights and swap fee with 18 decimals, the decimals of each token.
+    lastInvariant and protocolSwapFee (ProtocolFeesCollector.getSwapFeePercentage) only matter
+    for joins and exits, which pay the protocol its share of the swap fees first.
+    """
+
+    def __init__(
+        self,
+        tokens,
+        balances,
+        weights,
+        swapFee,
+        totalSupply,
+        decimals,
+        lastInvariant=0,
+        protocolSwapFee=0,
+    ):
+        self.tokens = [str(token).lower() for token in tokens]
+        self.balances = [int(balance) for balance in balances]
+        self.weights = [int(weight) for weight in weights]
+        self.swapFee = int(swapFee)
+        self.totalSupply = int(totalSupply)
+        self.scalingFactors = [10 ** (18 - int(d)) for d in decimals]
+        self.lastInvariant = int(lastInvariant)
+        self.protocolSwapFee = int(protocolSwapFee)
+
+    def index(self, token):
+        return self.tokens.index(str(token).lower())
+
+    def _upscaled(self):
+        return [
+            balance * factor
+            for balance, factor in zip(self.balances, self.scalingFactors)
+        ]
+
+    def onSwapGivenIn(self, indexIn, indexOut, amountIn):
+        """Pool onSwap GIVEN_IN: the fee is taken from amountIn before scaling."""
+        amountIn = sub(amountIn, mulUp(amountIn, self.swapFee))
+        amountOut = calcOutGivenIn(
+            self.balances[indexIn] * self.scalingFactors[indexIn],
+            self.weights[indexIn],
+            self.balances[indexOut] * self.scalingFactors[indexOut],
+            self.weights[indexOut],
+            amountIn * self.scalingFactors[indexIn],
+        )
+        return amountOut // self.scalingFactors[indexOut]
+
+    def onSwapGivenOut(self, indexIn, indexOut, amountOut):
+        amountIn = calcInGivenOut(
+            self.balances[indexIn] * self.scalingFactors[indexIn],
+            self.weights[indexIn],
+            self.balances[indexOut] * self.scalingFactors[indexOut],
+            self.weights[indexOut],
+            amountOut * self.scalingFactors[indexOut],
+        )
+        amountIn = _divUpInt(amountIn, self.scalingFactors[indexIn])
+        return divUp(amountIn, complement(self.swapFee))
+
+    def _protocolFees(self, balances):
+        """Upscaled balances after the due protocol swap fees, paid in the heaviest token."""
+        if self.protocolSwapFee == 0 or self.lastInvariant == 0:
+            return balances
+        heaviest = max(range(len(self.weights)), key=lambda i: self.weights[i])
+        due = calcDueTokenProtocolSwapFeeAmount(
+            balances[heaviest],
+            self.weights[heaviest],
+            self.lastInvariant,
+            calcInvariant(self.weights, balances),
+            self.protocolSwapFee,
+        )
+        balances = list(balances)
+        balances[heaviest] = sub(balances[heaviest], due)
+        return balances
+
+    def joinExactTokensIn(self, amountsIn):
+        """bpt minted by an EXACT_TOKENS_IN_FOR_BPT_OUT join."""
+        balances = self._protocolFees(self._upscaled())
+        amountsIn = [
+            amount * factor for amount, factor in zip(amountsIn, self.scalingFactors)
+        ]
+        return calcBptOutGivenExactTokensIn(
+            balances, self.weights, amountsIn, self.totalSupply, self.swapFee
+        )
+
+    def exitExactBptInForOneToken(self, bptIn, index):
+        """Tokens out of an EXACT_BPT_IN_FOR_ONE_TOKEN_OUT exit."""
+        balances = self._protocolFees(self._upscaled())
+        amountOut = calcTokenOutGivenExactBptIn(
+            balances[index], self.weights[index], bptIn, self.totalSupply, self.swapFee
+        )
+        return amountOut // self.scalingFactors[index]
+
+    def exitBptInForExactTokensOut(self, amountsOut):
+        """bpt burned by a BPT_IN_FOR_EXACT_TOKENS_OUT exit."""
+        balances = self._protocolFees(self._upscaled())
+        amountsOut = [
+            amount * factor for amount, factor in zip(amountsOut, self.scalingFactors)
+        ]
+        return calcBptInGivenExactTokensOut(
+            balances, self.weights, amountsOut, self.totalSupply, self.swapFee
+        )
+
+    def exitExactBptInForTokensOut(self, bptIn):
+        """Proportional exit, no swap fee."""
+        balances = self._protocolFees(self._upscaled())
+        amountsOut = calcTokensOutGivenExactBptIn(balances, bptIn, self.totalSupply)
+        return [
+            amount // factor for amount, factor in zip(amountsOut, self.scalingFactors)
+        ]
+
+
+def _divUpInt(a, b):
+    return 0 if a == 0 else (a - 1) // b + 1
+
+
+def queryBatchSwap(pools, swaps, assets):
+    """
+    Deltas of a GIVEN_IN batchSwap like the strategy's sellRewards builds them, without touching pools.
+    pools: {poolId: WeightedPoolState}; swaps: [(poolId, assetInIndex, assetOutIndex, amount)], an amount of 0
+    chains the output of the previous step.
+    """
+    pools = {poolId: copy.deepcopy(pool) for poolId, pool in pools.items()}
+    assets = [str(asset).lower() for asset in assets]
+    deltas = [0] * len(assets)
+    previousOut = None
+    previousAssetOut = None
+    for poolId, assetIn, assetOut, amount in swaps:
+        if amount == 0:
+            _require(previousOut is not None, "UNKNOWN_AMOUNT_IN_FIRST_SWAP")
+            _require(assetIn == previousAssetOut, "MALCONSTRUCTED_MULTIHOP_SWAP")
+            amount = previousOut
+        pool = pools[poolId]
+        indexIn, indexOut = pool.index(assets[assetIn]), pool.index(assets[assetOut])
+        previousOut = pool.onSwapGivenIn(indexIn, indexOut, amount)
+        previousAssetOut = assetOut
+        pool.balances[indexIn] += amount
+        pool.balances[indexOut] -= previousOut
+        deltas[assetIn] += amount
+        deltas[assetOut] -= previousOut
+    return deltas
+
+
+# Batch mode: float64 arrays of amounts against one pool state
+
+POW_ERROR = MAX_POW_RELATIVE_ERROR / ONE
+
+
+def _batchComplementPowUp(logBase, exponent):
+    """complement(powUp(base, exponent)) from log(base), exact for bases close to 1."""
+    power = np.exp(logBase * exponent)
+    return np.maximum(-np.expm1(logBase * exponent) - power * POW_ERROR - 1 / ONE, 0.0)
+
+
+def batchOutGivenIn(pool, indexIn, indexOut, amountsIn):
+    """onSwapGivenIn for an array of amounts in, token units as floats; MAX_IN_RATIO breaches are nan."""
+    amountsIn = np.asarray(amountsIn, dtype=float)
+    scaleIn, scaleOut = pool.scalingFactors[indexIn], pool.scalingFactors[indexOut]
+    balanceIn = pool.balances[indexIn] * scaleIn / ONE
+    balanceOut = pool.balances[indexOut] * scaleOut / ONE
+    amountIn = (amountsIn - np.ceil(amountsIn * pool.swapFee / ONE)) * scaleIn / ONE
+    exponent = pool.weights[indexIn] / pool.weights[indexOut]
+    out = balanceOut * _batchComplementPowUp(-np.log1p(amountIn / balanceIn), exponent)
+    out = np.floor(out * ONE / scaleOut)
+    return np.where(amountIn <= balanceIn * MAX_IN_RATIO / ONE, out, np.nan)
+
+
+def batchJoinExactTokensIn(pool, index, amountsIn):
+    """joinExactTokensIn of single token joins of index for an array of amounts."""
+    amountsIn = np.asarray(amountsIn, dtype=float)
+    balances = pool._protocolFees(pool._upscaled())
+    balance = balances[index] / ONE
+    weight = pool.weights[index] / ONE
+    amountIn = amountsIn * pool.scalingFactors[index] / ONE
+    # The other tokens join nothing, their balance ratio is 1 and powDown(1, w) = 1 - 1e-14 - 1e-18
+    others = (1 - POW_ERROR - 1 / ONE) ** (len(balances) - 1)
+
+    ratioWithFee = amountIn / balance
+    invariantRatioWithFees = weight * ratioWithFee  # minus one
+    taxable = amountIn - balance * invariantRatioWithFees
+    amountInWithoutFee = balance * invariantRatioWithFees + taxable * (
+        1 - pool.swapFee / ONE
+    )
+    logRatio = np.log1p(amountInWithoutFee / balance)
+    # invariantRatio - 1 for powDown(balanceRatio, weight) * others
+    powered = (
+        np.expm1(logRatio * weight) - np.exp(logRatio * weight) * POW_ERROR - 1 / ONE
+    )
+    invariantRatio = (1 + powered) * others - 1
+    return np.floor(np.maximum(pool.totalSupply * invariantRatio, 0.0))
+
+
+def batchTokenOutGivenExactBptIn(pool, index, bptsIn):
+    """exitExactBptInForOneToken for an array of bpt amounts, nan past MIN_INVARIANT_RATIO."""
+    bptsIn = np.asarray(bptsIn, dtype=float)
+    balances = pool._protocolFees(pool._upscaled())
+    balance = balances[index] / ONE
+    weight = pool.weights[index] / ONE
+    logInvariantRatio = np.log1p(-bptsIn / pool.totalSupply)
+    amountOutWithoutFee = balance * _batchComplementPowUp(logInvariantRatio, 1 / weight)
+    taxable = amountOutWithoutFee * (1 - weight)
+    amountOut = amountOutWithoutFee - taxable * pool.swapFee / ONE
+    amountOut = np.floor(amountOut * ONE / pool.scalingFactors[index])
+    return np.where(
+        np.exp(logInvariantRatio) >= MIN_INVARIANT_RATIO / ONE, amountOut, np.nan
+    )
@@ -1,110 +1,265 @@
 import pytest
-from brownie import config, Contract
+from brownie import config, Contract, network
 
+import json
 import sys
 import os
 
-script_dir = os.path.dirname( __file__ )
-strategyDeploy_dir = os.path.join( script_dir ,  ".." , "scripts" )
-sys.path.append( strategyDeploy_dir )
+script_dir = os.path.dirname(__file__)
+strategyDeploy_dir = os.path.join(script_dir, "..", "scripts")
+sys.path.append(strategyDeploy_dir)
 
 from deployStrategy import addHealthCheck, deploy
+import localProtocols
+import strategyConfig
+import util
+
+# Fantom account used as token reserve on the fork
+RESERVE = "0x20dd72Ed959b6147912C2e529F0a0C651c33c9ce"
+
+ABI_CACHE = os.path.join(script_dir, ".abi_cache")
+REPORTS = os.path.join(script_dir, "..", "reports")
+GAS_BASELINE = os.path.join(script_dir, "gas_baseline.json")
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--fixture-scope",
+        choices=["session", "function"],
+        default="session",
+        help="session: deploy the vault and strategy once and revert to a snapshot after each test. "
+        "function: redeploy everything for each test, the previous layout.",
+    )
+
+    parser.addoption(
+        "--update-gas-baseline",
+        action="store_true",
+        help="write the gas measured by tests/test_gas.py to tests/gas_baseline.json instead of checking it",
+    )
+
+
+def fixtureScope(fixture_name, config):
+    return config.getoption("--fixture-scope")
+
+
+@pytest.fixture(autouse=True)
+def isolation(chain):
+    # Not brownie's fn_isolation, its module_isolation resets the chain and would drop the session deployments.
+    # Session fixtures are set up before this snapshot, every test starts from the same deployed state.
+    chain.snapshot()
+    yield
+    chain.revert()
+
+
+# Timing report, written to reports/test-timing-<scope>.json and compared against the other layout
+_timings = {}
+
+
+def pytest_runtest_logreport(report):
+    _timings.setdefault(report.nodeid, {})[report.when] = report.duration
+
+
+def pytest_sessionfinish(session):
+    if not _timings:
+        return
+    os.makedirs(REPORTS, exist_ok=True)
+    scope = session.config.getoption("--fixture-scope")
+    # scripts/parallelTest.py merges the reports of its workers
+    worker = f"-w{os.getenv('PARALLEL_WORKER')}" if os.getenv("PARALLEL_WORKER") else ""
+    with open(os.path.join(REPORTS, f"test-timing-{scope}{worker}.json"), "w") as f:
+        json.dump(
+            {"scope": scope, "network": network.show_active(), "tests": _timings},
+            f,
+            indent=2,
+        )
+
+
+def _phaseTotals(tests):
+    return {
+        when: sum(phases.get(when, 0) for phases in tests.values())
+        for when in ("setup", "call", "teardown")
+    }
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    if not _timings:
+        return
+    scope = config.getoption("--fixture-scope")
+    totals = _phaseTotals(_timings)
+    terminalreporter.section(f"fixture timing ({scope} scope)")
+    terminalreporter.write_line(
+        f"setup {totals['setup']:.1f}s  call {totals['call']:.1f}s  teardown {totals['teardown']:.1f}s  "
+        f"total {sum(totals.values()):.1f}s  ({len(_timings)} tests)"
+    )
+
+    other = "function" if scope == "session" else "session"
+    path = os.path.join(REPORTS, f"test-timing-{other}.json")
+    if not os.path.exists(path):
+        terminalreporter.write_line(
+            f"run with --fixture-scope={other} to compare the layouts"
+        )
+        return
+    with open(path) as f:
+        previous = json.load(f)
+    previousTotals = _phaseTotals(previous["tests"])
+    terminalreporter.write_line(
+        f"{other} scope ({previous['network']}): setup {previousTotals['setup']:.1f}s  call {previousTotals['call']:.1f}s  "
+        f"teardown {previousTotals['teardown']:.1f}s  total {sum(previousTotals.values()):.1f}s  ({len(previous['tests'])} tests)"
+    )
+    terminalreporter.write_line(f"{scope:>9} {other:>9}  slowest tests")
+    for nodeid in sorted(_timings, key=lambda nodeid: -sum(_timings[nodeid].values()))[
+        :10
+    ]:
+        before = sum(previous["tests"].get(nodeid, {}).values())
+        terminalreporter.write_line(
+            f"{sum(_timings[nodeid].values()):8.1f}s {before:8.1f}s  {nodeid}"
+        )
+
+
+def cachedContract(address):
+    # Contract.from_explorer with the abi kept on disk, explorer lookups are slow and rate limited
+    path = os.path.join(ABI_CACHE, f"{address.lower()}.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            cached = json.load(f)
+        return Contract.from_abi(cached["name"], address, cached["abi"])
+
+    contract = Contract.from_explorer(address)
+    os.makedirs(ABI_CACHE, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"name": contract._name, "abi": contract.abi}, f)
+    return contract
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
+def protocols(accounts):
+    # On a plain development network the Fantom protocols are replaced by local stand-ins.
+    # Run with `brownie test --network development` to use them.
+    if network.show_active() == "development":
+        yield localProtocols.deploy(accounts[0])
+    else:
+        yield None
+
+
+def fund(accounts, protocols, token, to, amount):
+    if protocols:
+        token.mint(to, amount, {"from": accounts[0]})
+    else:
+        # In order to get some funds for the token you are about to use,
+        # it impersonate an exchange address to use it's funds.
+        reserve = accounts.at(RESERVE, force=True)
+        token.transfer(to, amount, {"from": reserve})
+
+
+@pytest.fixture(scope=fixtureScope)
 def gov(accounts):
     yield accounts[0]
 
-@pytest.fixture
+
+@pytest.fixture(scope=fixtureScope)
 def user(accounts):
     yield accounts[0]
 
-@pytest.fixture
+
+@pytest.fixture(scope=fixtureScope)
 def user2(accounts):
     yield accounts[9]
 
-@pytest.fixture
+
+@pytest.fixture(scope=fixtureScope)
 def user3(accounts):
     yield accounts[7]
 
-@pytest.fixture
-def userWithWeth(accounts):
-    yield accounts.at("0x39B3bd37208CBaDE74D0fcBDBb12D606295b430a", force=True)
 
+@pytest.fixture(scope=fixtureScope)
+def userWithWeth(accounts, protocols, weth):
+    if protocols:
+        weth.mint(accounts[8], 10_000 * 10 ** 18, {"from": accounts[0]})
+        yield accounts[8]
+    else:
+        yield accounts.at("0x39B3bd37208CBaDE74D0fcBDBb12D606295b430a", force=True)
 
-@pytest.fixture
+
+@pytest.fixture(scope=fixtureScope)
 def rewards(accounts):
     yield accounts[1]
 
 
-@pytest.fixture
+@pytest.fixture(scope=fixtureScope)
 def guardian(accounts):
     yield accounts[0]
 
 
-@pytest.fixture
+@pytest.fixture(scope=fixtureScope)
 def management(accounts):
     yield accounts[0]
 
 
-@pytest.fixture
+@pytest.fixture(scope=fixtureScope)
 def strategist(accounts):
     yield accounts[4]
 
 
-@pytest.fixture
+@pytest.fixture(scope=fixtureScope)
 def keeper(accounts):
     yield accounts[0]
 
 
-@pytest.fixture
-def token():
-    token_address = "0x04068DA6C83AFCFA0e13ba15A6696662335D5B75"  # this should be the address of the ERC-20 used by the strategy/vault (DAI)
-    yield Contract.from_explorer(token_address)
+@pytest.fixture(scope=fixtureScope)
+def token(protocols):
+    if protocols:
+        yield protocols["usdc"]
+    else:
+        token_address = "0x04068DA6C83AFCFA0e13ba15A6696662335D5B75"  # this should be the address of the ERC-20 used by the strategy/vault (DAI)
+        yield cachedContract(token_address)
 
-@pytest.fixture
-def qiDaoToken():
-    token_address = "0x68Aa691a8819B07988B18923F712F3f4C8d36346"
-    yield Contract.from_explorer(token_address)
 
-@pytest.fixture
-def qiToken_whale(accounts):
+@pytest.fixture(scope=fixtureScope)
+def qiDaoToken(protocols):
+    if protocols:
+        yield protocols["qi"]
+    else:
+        token_address = "0x68Aa691a8819B07988B18923F712F3f4C8d36346"
+        yield cachedContract(token_address)
+
+
+@pytest.fixture(scope=fixtureScope)
+def qiToken_whale(accounts, protocols):
+    if protocols:
+        protocols["qi"].mint(accounts[6], 10_000_000 * 10 ** 18, {"from": accounts[0]})
+        return accounts[6]
     token_address = "0x84B67E43474a403Cde9aA181b02Ba07399a54573"
     return accounts.at(token_address, force=True)
 
 
-@pytest.fixture
-def amount(accounts, token, user):
+@pytest.fixture(scope=fixtureScope)
+def amount(accounts, protocols, token, user):
     amount = 100_000 * 10 ** token.decimals()
-    # In order to get some funds for the token you are about to use,
-    # it impersonate an exchange address to use it's funds.
-    reserve = accounts.at("0x20dd72Ed959b6147912C2e529F0a0C651c33c9ce", force=True)
-    token.transfer(user, amount, {"from": reserve})
+    fund(accounts, protocols, token, user, amount)
     yield amount
 
-@pytest.fixture
-def amount2(accounts, token, user2):
+
+@pytest.fixture(scope=fixtureScope)
+def amount2(accounts, protocols, token, user2):
     amount = 10_000 * 10 ** token.decimals()
-    # In order to get some funds for the token you are about to use,
-    # it impersonate an exchange address to use it's funds.
-    reserve = accounts.at("0x20dd72Ed959b6147912C2e529F0a0C651c33c9ce", force=True)
-    token.transfer(user2, amount, {"from": reserve})
+    fund(accounts, protocols, token, user2, amount)
     yield amount
 
-@pytest.fixture
-def amount3(accounts, token, user3):
+
+@pytest.fixture(scope=fixtureScope)
+def amount3(accounts, protocols, token, user3):
     amount = 100_000 * 10 ** token.decimals()
-    # In order to get some funds for the token you are about to use,
-    # it impersonate an exchange address to use it's funds.
-    reserve = accounts.at("0x20dd72Ed959b6147912C2e529F0a0C651c33c9ce", force=True)
-    token.transfer(user3, amount, {"from": reserve})
+    fund(accounts, protocols, token, user3, amount)
     yield amount
 
 
-@pytest.fixture
-def weth():
-    token_address = "0x21be370D5312f44cB42ce377BC9b8a0cEF1A4C83"
-    yield Contract.from_explorer(token_address)
+@pytest.fixture(scope=fixtureScope)
+def weth(protocols):
+    if protocols:
+        yield protocols["wftm"]
+    else:
+        token_address = "0x21be370D5312f44cB42ce377BC9b8a0cEF1A4C83"
+        yield cachedContract(token_address)
 
 
 @pytest.fixture
@@ -114,7 +269,7 @@ def weth_amount(user, weth):
     yield weth_amount
 
 
-@pytest.fixture
+@pytest.fixture(scope=fixtureScope)
 def vault(pm, gov, rewards, guardian, management, token):
     Vault = pm(config["dependencies"][0]).Vault
     vault = guardian.deploy(Vault)
@@ -124,21 +279,40 @@ def vault(pm, gov, rewards, guardian, management, token):
     yield vault
 
 
-@pytest.fixture
-def strategy(strategist, keeper, vault, Strategy, gov):
-    strategy = deployStrategy(Strategy, strategist, gov ,vault)
+@pytest.fixture(scope=fixtureScope)
+def stratConfig(protocols, vault):
+    if protocols:
+        yield localProtocols.getStrategyConfig("MAI_Concerto_staking", vault, protocols)
+    else:
+        yield strategyConfig.getStrategyConfig("MAI_Concerto_staking", vault)
+
+
+@pytest.fixture(scope=fixtureScope)
+def strategy(strategist, keeper, vault, Strategy, gov, stratConfig):
+    strategy = deployStrategy(Strategy, strategist, gov, vault, stratConfig)
     # strategy = strategist.deploy(Strategy, vault)
     strategy.setKeeper(keeper)
     vault.addStrategy(strategy, 10_000, 0, 2 ** 256 - 1, 1_000, {"from": gov})
     addHealthCheck(strategy, gov, gov)
     yield strategy
 
-def deployStrategy(Strategy, strategist, gov, vault):
-    return deploy(Strategy, strategist, gov ,vault)
 
+def deployStrategy(Strategy, strategist, gov, vault, stratConfig=None):
+    return deploy(Strategy, strategist, gov, vault, stratConfig)
+
+
+@pytest.fixture(scope="session")
+def gasBenchmark(request):
+    benchmark = util.GasBenchmark(
+        GAS_BASELINE,
+        os.path.join(REPORTS, "gas-benchmark.json"),
+        request.config.getoption("--update-gas-baseline"),
+    )
+    yield benchmark
+    benchmark.finish()
 
 
 @pytest.fixture(scope="session")
 def RELATIVE_APPROX():
     # this is more permessive due to single sided deposits and pool size which incurres slippage and prize impact
-    yield 1e-2 # 0.1% of slippage
+    yield 1e-2  # 0.1% of slippage
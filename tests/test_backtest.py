@@ -0,0 +1,83 @@
+import csv
+
+import numpy as np
+import pytest
+
+import backtest
+import strategyConfig
+from strategySimulator import defaultMarket
+
+DAYS = 30
+CONFIGS = ["MAI_Concerto", "MAI_Concerto_staking"]  # shipped in strategyConfig.py
+
+
+def flatHistory(config, path, days=DAYS, sample=3600):
+    # defaultMarket state at every sample, one block per second
+    market = defaultMarket(config)
+    timestamps = np.arange(0, days * 86400 + 1, sample, dtype=float)
+    columns = {"timestamp": timestamps, "block": timestamps}
+    for name in backtest.seriesFields(config, market)[2:]:
+        columns[name] = np.zeros(len(timestamps))
+    columns["rewardPerBlock"][:] = market.masterChef.rewardPerBlock
+    columns["totalAllocPoint"][:] = market.masterChef.totalAllocPoint
+    for label, pool in backtest.poolLabels(config, market).items():
+        for i, balance in enumerate(pool.balances):
+            columns[f"{label}_balance{i}"][:] = balance
+        columns[f"{label}_supply"][:] = pool.totalSupply
+    for pid in backtest.masterChefPids(config):
+        columns[f"alloc{pid}"][:] = market.masterChef.allocPoints[pid]
+        columns[f"lpSupply{pid}"][:] = market.masterChef.lpSupply[pid]
+    backtest.saveSeries(path, columns)
+    return path
+
+
+@pytest.mark.parametrize("configName", CONFIGS)
+def test_backtest_flat_history(tmp_path, configName):
+    config = strategyConfig.getStrategyConfig(configName, None)
+    config["deployArgs"][
+        4
+    ] = 55  # MAI_Concerto's 5 bips are below the join fee of the default pools
+    series = flatHistory(config, tmp_path / "history.npy")
+
+    result = backtest.Backtest(config, series, 100_000 * 10 ** 6).run(
+        tmp_path / "steps.csv"
+    )
+    assert result["harvests"] == DAYS + 1
+    assert result["reverts"] == 0
+    assert result["endAssets"] > result["startAssets"]
+
+    with open(tmp_path / "steps.csv") as f:
+        steps = list(csv.DictReader(f))
+    assert [step["action"] for step in steps].count("harvest") == DAYS + 1
+    assert all(step["ok"] == "1" for step in steps)
+
+
+def test_backtest_missing_column(tmp_path):
+    config = strategyConfig.getStrategyConfig("MAI_Concerto", None)
+    backtest.saveSeries(
+        tmp_path / "history.npy",
+        {"timestamp": np.arange(10.0), "block": np.arange(10.0)},
+    )
+    with pytest.raises(ValueError):
+        backtest.Backtest(config, tmp_path / "history.npy", 100_000 * 10 ** 6)
+
+
+def test_compare_configs(tmp_path):
+    # the staking config shares the pool columns of the plain one, plus its stake pid
+    config = strategyConfig.getStrategyConfig("MAI_Concerto_staking", None)
+    series = flatHistory(config, tmp_path / "history.npy", days=7)
+
+    results = backtest.compare(
+        CONFIGS + [("MAI_Concerto_staking", (0, 0))],
+        series,
+        tmp_path / "out",
+        workers=2,
+    )
+    assert [result["name"] for result in results] == CONFIGS + [
+        "MAI_Concerto_staking_0_0"
+    ]
+    for result in results:
+        assert result["reverts"] == 0
+        assert (tmp_path / "out" / f'{result["name"]}.csv').exists()
+    assert results[0]["apr"] == 0  # nothing joins within 5 bips
+    assert results[1]["apr"] > 0
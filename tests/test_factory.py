@@ -0,0 +1,90 @@
+import brownie
+import pytest
+
+from deployStrategy import clone, deployFactory, initParams, setupParams
+
+
+def test_clone_applies_config(
+    vault, strategy, stratConfig, gov, strategist, rewards, keeper
+):
+    # The fixture strategy is the implementation, its health check is shared with the clone
+    factory = deployFactory(strategy, gov)
+    cloned = clone(
+        factory,
+        gov,
+        vault,
+        stratConfig,
+        strategist,
+        rewards,
+        keeper,
+        strategy.healthCheck(),
+    )
+
+    assert cloned.address != strategy.address
+    assert cloned.vault() == vault
+    assert cloned.want() == strategy.want()
+    assert cloned.strategist() == strategist
+    assert cloned.rewards() == rewards
+    assert cloned.keeper() == keeper
+    assert cloned.healthCheck() == strategy.healthCheck()
+
+    for view in [
+        "balancerVault",
+        "bpt",
+        "maxSlippageIn",
+        "maxSlippageOut",
+        "maxSingleDeposit",
+        "minDepositPeriod",
+        "stakeBpt",
+        "rewardToken",
+        "wNative",
+        "getSwapSteps",
+        "getRewardTokens",
+    ]:
+        assert getattr(cloned, view)() == getattr(strategy, view)(), view
+
+
+def test_clone_initializes_once(vault, strategy, stratConfig, gov, strategist):
+    factory = deployFactory(strategy, gov)
+    cloned = clone(factory, gov, vault, stratConfig)
+    args = (
+        vault,
+        strategist,
+        strategist,
+        strategist,
+        initParams(stratConfig),
+        setupParams(stratConfig),
+    )
+
+    with brownie.reverts("Strategy already initialized"):
+        cloned.initialize(*args, {"from": strategist})
+    with brownie.reverts("Strategy already initialized"):
+        strategy.initialize(*args, {"from": strategist})
+
+
+def test_clone_operation(
+    chain,
+    token,
+    vault,
+    strategy,
+    stratConfig,
+    gov,
+    user,
+    strategist,
+    amount,
+    RELATIVE_APPROX,
+):
+    factory = deployFactory(strategy, gov)
+    cloned = clone(factory, gov, vault, stratConfig, strategist)
+    vault.updateStrategyDebtRatio(strategy, 0, {"from": gov})
+    vault.addStrategy(cloned, 10_000, 0, 2 ** 256 - 1, 1_000, {"from": gov})
+
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    chain.sleep(1)
+    cloned.harvest({"from": strategist})
+    assert pytest.approx(cloned.estimatedTotalAssets(), rel=RELATIVE_APPROX) == amount
+    assert cloned.balanceOfBptInMasterChef() > 0
+
+    vault.withdraw(vault.balanceOf(user), user, 10_000, {"from": user})
+    assert pytest.approx(token.balanceOf(user), rel=RELATIVE_APPROX) == amount
@@ -0,0 +1,341 @@
+import pytest
+from brownie import history
+
+import gasReport
+import localProtocols
+import strategyConfig
+import util
+from conftest import deployStrategy
+from deployStrategy import clone, deployFactory
+
+# Gas benchmark for the strategy entry points, checked against tests/gas_baseline.json.
+# Run with `brownie test tests/test_gas.py -s` to print the numbers and the internal breakdown,
+# `--update-gas-baseline` to record a new baseline. An entry point missing from the baseline is reported
+# with a GasBaselineWarning and not checked, record it on the network the benchmark is checked on.
+SIZES = [0.1, 1]  # of amount
+STAKES = [0, 5_000]  # stakePercentage and unstakePercentage
+CONFIGS = ["MAI_Concerto", "MAI_Concerto_staking"]  # shipped in strategyConfig.py
+
+
+def deposit(chain, token, vault, strategy, user, strategist, amount):
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    chain.sleep(1)
+    return strategy.harvest({"from": strategist})
+
+
+@pytest.mark.parametrize("stake", STAKES)
+@pytest.mark.parametrize("size", SIZES)
+def test_harvest_gas(
+    chain,
+    token,
+    vault,
+    strategy,
+    user,
+    strategist,
+    gov,
+    amount,
+    RELATIVE_APPROX,
+    qiDaoToken,
+    qiToken_whale,
+    gasBenchmark,
+    size,
+    stake,
+):
+    strategy.setStakeParams(stake, stake, {"from": gov})
+    amount = int(amount * size)
+
+    # Harvest 1: Send funds through the strategy
+    deposit_tx = deposit(chain, token, vault, strategy, user, strategist, amount)
+    assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == amount
+    gasBenchmark.record(
+        f"harvest deposit [size={size} stake={stake}]", deposit_tx, breakdown=True
+    )
+
+    # Harvest 2: Realize profit
+    time = 86400 * 7  # 1 week of running the strategy
+    util.airdrop_rewards(amount, time, strategy, qiDaoToken, qiToken_whale)
+    chain.sleep(strategy.minDepositPeriod() + 1)
+    chain.mine(1)
+    profit_tx = strategy.harvest({"from": strategist})
+    gasBenchmark.record(
+        f"harvest profit [size={size} stake={stake}]", profit_tx, breakdown=True
+    )
+
+
+@pytest.mark.parametrize("configName", CONFIGS)
+def test_harvest_gas_by_config(
+    chain,
+    token,
+    vault,
+    strategy,
+    Strategy,
+    protocols,
+    user,
+    strategist,
+    gov,
+    amount,
+    qiDaoToken,
+    qiToken_whale,
+    gasBenchmark,
+    configName,
+):
+    # A strategy deployed from each shipped config, with its own stakeParams and stake info
+    if protocols:
+        config = localProtocols.getStrategyConfig(configName, vault, protocols)
+    else:
+        config = strategyConfig.getStrategyConfig(configName, vault)
+    configStrategy = deployStrategy(Strategy, strategist, gov, vault, config)
+    vault.updateStrategyDebtRatio(strategy, 0, {"from": gov})
+    vault.addStrategy(configStrategy, 10_000, 0, 2 ** 256 - 1, 1_000, {"from": gov})
+
+    deposit_tx = deposit(chain, token, vault, configStrategy, user, strategist, amount)
+    gasBenchmark.record(
+        f"harvest deposit [config={configName}]", deposit_tx, breakdown=True
+    )
+
+    util.airdrop_rewards(amount, 86400 * 7, configStrategy, qiDaoToken, qiToken_whale)
+    chain.sleep(configStrategy.minDepositPeriod() + 1)
+    chain.mine(1)
+    profit_tx = configStrategy.harvest({"from": strategist})
+    gasBenchmark.record(
+        f"harvest profit [config={configName}]", profit_tx, breakdown=True
+    )
+
+    full_tx = vault.withdraw(vault.balanceOf(user), user, 10_000, {"from": user})
+    gasBenchmark.record(
+        f"liquidatePosition full [config={configName}]", full_tx, breakdown=True
+    )
+
+
+def test_view_gas(
+    chain, token, vault, strategy, user, strategist, amount, gasBenchmark
+):
+    deposit(chain, token, vault, strategy, user, strategist, amount)
+
+    # Views the keeper, the triggers and every harvest read
+    for view in ["balanceOfPooled", "estimatedTotalAssets", "wantToLPAmount"]:
+        args = [amount // 10] if view == "wantToLPAmount" else []
+        gasBenchmark.record(
+            f"{view} (call)", getattr(strategy, view).estimate_gas(*args)
+        )
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_tend_gas(
+    chain,
+    token,
+    vault,
+    strategy,
+    user,
+    strategist,
+    gov,
+    amount,
+    RELATIVE_APPROX,
+    gasBenchmark,
+    size,
+):
+    amount = int(amount * size)
+    deposit(chain, token, vault, strategy, user, strategist, amount // 2)
+    assert (
+        pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX)
+        == amount // 2
+    )
+
+    # Loose want for tend to deposit
+    token.transfer(strategy, amount // 2, {"from": user})
+    chain.sleep(strategy.minDepositPeriod() + 1)
+    chain.mine(1)
+    assert strategy.tendTrigger(0)
+    tend_tx = strategy.tend({"from": gov})
+    gasBenchmark.record(f"tend [size={size}]", tend_tx, breakdown=True)
+
+
+@pytest.mark.parametrize("stake", STAKES)
+@pytest.mark.parametrize("size", SIZES)
+def test_liquidate_position_gas(
+    chain,
+    token,
+    vault,
+    strategy,
+    user,
+    strategist,
+    gov,
+    amount,
+    RELATIVE_APPROX,
+    gasBenchmark,
+    size,
+    stake,
+):
+    strategy.setStakeParams(stake, stake, {"from": gov})
+    amount = int(amount * size)
+    deposit(chain, token, vault, strategy, user, strategist, amount)
+
+    # vault.withdraw pulls the missing want through liquidatePosition
+    shares = vault.balanceOf(user)
+    partial_tx = vault.withdraw(shares // 2, user, 10_000, {"from": user})
+    gasBenchmark.record(
+        f"liquidatePosition partial [size={size} stake={stake}]",
+        partial_tx,
+        breakdown=True,
+    )
+
+    # More than the estimated assets liquidates all positions
+    full_tx = vault.withdraw(vault.balanceOf(user), user, 10_000, {"from": user})
+    gasBenchmark.record(
+        f"liquidatePosition full [size={size} stake={stake}]", full_tx, breakdown=True
+    )
+
+
+def test_routed_liquidate_position_gas(
+    accounts,
+    chain,
+    protocols,
+    token,
+    vault,
+    strategy,
+    user,
+    strategist,
+    gov,
+    amount,
+    gasBenchmark,
+):
+    if not protocols:
+        pytest.skip("needs a deeper USDC/MAI pool than the fork has")
+    deposit(chain, token, vault, strategy, user, strategist, amount)
+
+    # Same deep pool as test_exit_routed_through_deeper_pool, the exit goes through BalancerRouting
+    mai = protocols["mai"]
+    deepPool = localProtocols.deployPool(
+        protocols["balancerVault"],
+        "Deep MAI",
+        "BPT-DMAI",
+        [token, mai],
+        [10 ** 18 // 2, 10 ** 18 // 2],
+        10 ** 14,
+        [100_000_000 * 10 ** 6, 100_000_000 * 10 ** 18],
+        accounts[0],
+    )
+    strategy.setExitSwapSteps(
+        mai, ([deepPool.getPoolId()], [mai, token]), {"from": gov}
+    )
+    routed_tx = vault.withdraw(vault.balanceOf(user) // 2, user, 10_000, {"from": user})
+    gasBenchmark.record("liquidatePosition partial routed", routed_tx, breakdown=True)
+
+
+def test_contract_size(Strategy, BalancerRouting):
+    # EIP-170, larger runtime code can not be deployed. Library placeholders take the 20 bytes of the address.
+    for contract in (Strategy, BalancerRouting):
+        size = len(contract._build["deployedBytecode"]) // 2
+        print(f"\n{contract._name}: {size} bytes")
+        assert (
+            size <= 24_576
+        ), f"{contract._name} is {size} bytes, over the EIP-170 limit"
+
+
+def test_full_liquidation_gas(
+    chain,
+    token,
+    vault,
+    strategy,
+    user,
+    strategist,
+    amount,
+    RELATIVE_APPROX,
+    gasBenchmark,
+):
+    deposit(chain, token, vault, strategy, user, strategist, amount)
+    assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == amount
+
+    # Emergency exit liquidates all the positions
+    strategy.setEmergencyExit({"from": strategist})
+    chain.sleep(1)
+    liquidation_tx = strategy.harvest({"from": strategist})
+    assert strategy.estimatedTotalAssets() == 0
+    gasBenchmark.record("harvest emergency exit", liquidation_tx, breakdown=True)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_migrate_gas(
+    chain,
+    token,
+    vault,
+    strategy,
+    Strategy,
+    stratConfig,
+    user,
+    strategist,
+    gov,
+    amount,
+    gasBenchmark,
+    size,
+):
+    deposit(chain, token, vault, strategy, user, strategist, int(amount * size))
+    new_strategy = deployStrategy(Strategy, strategist, gov, vault, stratConfig)
+    migrate_tx = vault.migrateStrategy(strategy, new_strategy, {"from": gov})
+    gasBenchmark.record(f"migrate [size={size}]", migrate_tx)
+
+
+def test_clone_gas(Strategy, vault, strategy, stratConfig, gov, gasBenchmark):
+    # A full deploy against a clone that applies the whole config in the same transaction
+    deploy_tx = Strategy.deploy(*stratConfig["deployArgs"], {"from": gov}).tx
+    gasBenchmark.record("Strategy.deploy", deploy_tx)
+
+    factory = deployFactory(strategy, gov)
+    clone(factory, gov, vault, stratConfig, healthCheck=strategy.healthCheck())
+    gasBenchmark.record("clone and configure", history[-1])
+
+
+def test_admin_gas(
+    chain,
+    token,
+    vault,
+    strategy,
+    stratConfig,
+    user,
+    strategist,
+    gov,
+    amount,
+    gasBenchmark,
+):
+    deposit(chain, token, vault, strategy, user, strategist, amount)
+
+    stakeInfo = stratConfig["stakeInfo"]
+    stake_info_tx = strategy.setStakeInfo(
+        stakeInfo["assets"],
+        stakeInfo["stakePool"],
+        stakeInfo["stakeTokenIndex"],
+        stakeInfo["stakeWantIndex"],
+        stakeInfo["masterChefStakePoolId"],
+        {"from": gov},
+    )
+    gasBenchmark.record("setStakeInfo", stake_info_tx)
+
+    # Moves everything out of the masterChef and back into the same one
+    master_chef_tx = strategy.setMasterChef(stratConfig["deployArgs"][3], {"from": gov})
+    gasBenchmark.record("setMasterChef", master_chef_tx)
+
+    chain.sleep(strategy.minDepositPeriod() + 1)
+    strategy.tend({"from": gov})
+    emergency_tx = strategy.emergencyWithdrawFromMasterChef({"from": gov})
+    assert strategy.balanceOfBptInMasterChef() == 0
+    gasBenchmark.record("emergencyWithdrawFromMasterChef", emergency_tx)
+
+
+def test_gas_report_reads_every_benchmark_version():
+    # The first benchmark printed its own labels, later ones print the breakdown under each entry point
+    output = "\n".join(
+        [
+            "deposit harvest: 410000",
+            "tend [size=1]: 380000 (baseline 379000)",
+            "    joinPool: 150000",
+            "  Gas used: 380000 (5.65%)",
+        ]
+    )
+    assert gasReport.parseOutput(output) == {
+        "deposit harvest": 410000,
+        "tend [size=1]": 380000,
+        "tend [size=1] / joinPool": 150000,
+    }
+    table = gasReport.report({"tend [size=1]": 400000}, {"tend [size=1]": 380000})
+    assert "| `tend [size=1]` | 400000 | 380000 | -20000 | -5.0% |" in table
@@ -0,0 +1,38 @@
+import brownie
+
+
+def test_check_batch(CommonHealthCheck, strategy, accounts, gov):
+    healthCheck = CommonHealthCheck.deploy({"from": gov})
+    limited, disabled, default = (
+        strategy.address,
+        accounts[5].address,
+        accounts[6].address,
+    )
+    healthCheck.setStrategyLimits(limited, 500, 0, {"from": gov})
+    healthCheck.setDisabledCheck(disabled, True, {"from": gov})
+
+    totalDebt = 10_000
+    requests = [
+        (limited, 400, 0, 0, 0, totalDebt),  # within its 5% profit limit
+        (limited, 0, 1, 0, 0, totalDebt),  # over its 0% loss limit
+        (default, 200, 0, 0, 0, totalDebt),  # over the default 1% profit limit
+        (default, 0, 55, 0, 0, totalDebt),  # at the default loss limit
+        (disabled, 10_000, 10_000, 0, 0, totalDebt),
+    ]
+    passed, limits = healthCheck.checkBatch(requests)
+
+    assert [bool(passed[0] >> i & 1) for i in range(len(requests))] == [
+        True,
+        False,
+        False,
+        True,
+        True,
+    ]
+    for i, request in enumerate(requests[:4]):
+        assert bool(passed[0] >> i & 1) == healthCheck.check(*request)
+    assert limits[0] == (500, 0, True)
+    assert limits[2] == (100, 55, False)
+    assert limits[4] == (0, 0, False)
+
+    with brownie.reverts():
+        healthCheck.setProfitLimitRatio(10_000, {"from": gov})
@@ -0,0 +1,60 @@
+import sqlite3
+
+from indexer import Indexer, query
+
+
+def test_indexer_resumes_and_queries(
+    chain,
+    token,
+    vault,
+    strategy,
+    stratConfig,
+    user,
+    strategist,
+    amount,
+    qiDaoToken,
+    qiToken_whale,
+    tmp_path,
+):
+    startBlock = chain.height
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    chain.sleep(1)
+    strategy.harvest({"from": strategist})
+
+    dbPath = str(tmp_path / "index.sqlite")
+    Indexer(strategy, stratConfig, dbPath, window=3, minWindow=1).run(startBlock)
+
+    qiDaoToken.transfer(strategy, 1_000 * 10 ** 18, {"from": qiToken_whale})
+    chain.sleep(strategy.minDepositPeriod() + 1)
+    tx = strategy.harvest({"from": strategist})
+
+    # A second run starts from the checkpoint, nothing is indexed twice
+    Indexer(strategy, stratConfig, dbPath, window=3, minWindow=1).run(startBlock)
+    db = sqlite3.connect(dbPath)
+    assert db.execute("SELECT block FROM checkpoints").fetchone()[0] == chain.height
+    harvests = db.execute(
+        "SELECT block, profit FROM harvests ORDER BY block"
+    ).fetchall()
+    assert len(harvests) == 2
+    assert harvests[-1] == (
+        tx.block_number,
+        tx.events["Harvested"]["profit"] / 10 ** token.decimals(),
+    )
+    names = {
+        name
+        for name, in db.execute(
+            "SELECT DISTINCT name FROM events WHERE source = 'masterChef'"
+        )
+    }
+    assert "Deposit" in names
+    assert (
+        db.execute(
+            "SELECT COUNT(*) FROM events WHERE source = 'vault' AND name = 'StrategyReported'"
+        ).fetchone()[0]
+        == 2
+    )
+
+    header, rows = query(dbPath, "weeklyProfit")
+    assert header[0] == "week"
+    assert sum(row[1] for row in rows) == 2
@@ -0,0 +1,54 @@
+import pytest
+
+from keeper import Keeper, KeeperSettings, StrategyWatch
+from strategyReader import getMulticall
+
+
+def test_pending_rewards_match_masterchef(
+    chain, token, vault, strategy, stratConfig, user, strategist, amount, interface
+):
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    chain.sleep(1)
+    strategy.harvest({"from": strategist})
+    chain.mine(20)
+
+    watch = StrategyWatch(strategy, stratConfig, getMulticall())
+    state, masterChefState = watch.read()
+    masterChef = interface.IQiMasterChef(stratConfig["deployArgs"][3])
+    expected = sum(
+        masterChef.pending(pid, strategy, block_identifier=state.block)
+        for pid in watch.pids
+    )
+    assert expected > 0
+    assert watch.pendingRewards(state, masterChefState) == expected
+
+
+def test_keeper_harvests_when_profit_beats_gas(
+    chain,
+    token,
+    vault,
+    strategy,
+    stratConfig,
+    user,
+    strategist,
+    keeper,
+    amount,
+    qiDaoToken,
+    qiToken_whale,
+):
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    chain.sleep(1)
+    strategy.harvest({"from": strategist})
+
+    watch = StrategyWatch(strategy, stratConfig, getMulticall())
+    # Gas is priced through the wFTM of the swap route
+    bot = Keeper(
+        keeper, [watch], KeeperSettings(dryRun=True, nativeToken=watch.swapAssets[1])
+    )
+
+    # Rewards worth far more than the gas of a harvest
+    qiDaoToken.transfer(strategy, 10_000 * 10 ** 18, {"from": qiToken_whale})
+    action, reason = bot.check(watch)
+    assert action == "harvest", reason
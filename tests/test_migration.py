@@ -13,6 +13,7 @@ def test_funds_migration(
     gov,
     user,
     RELATIVE_APPROX,
+    stratConfig,
 ):
     # Deposit to the vault and harvest
     token.approve(vault.address, amount, {"from": user})
@@ -25,7 +26,7 @@ def test_funds_migration(
     balanceOfBptInMasterChef = strategy.balanceOfBptInMasterChef()
     balanceOfStakeBptInMasterChef = strategy.balanceOfStakeBptInMasterChef()
     # deploy new strategy
-    new_strategy = deployStrategy(Strategy, strategist, gov, vault)
+    new_strategy = deployStrategy(Strategy, strategist, gov, vault, stratConfig)
     # migrate to a new strategy
     vault.migrateStrategy(strategy, new_strategy, {"from": gov})
 
@@ -53,6 +54,7 @@ def test_funds_migration_and_user_withdraw(
     gov,
     user,
     RELATIVE_APPROX,
+    stratConfig,
 ):
     # Deposit to the vault and harvest
     token.approve(vault.address, amount, {"from": user})
@@ -63,7 +65,7 @@ def test_funds_migration_and_user_withdraw(
     assert pytest.approx(estimatedTotalAssets, rel=RELATIVE_APPROX) == amount
 
     # deploy new strategy
-    new_strategy = deployStrategy(Strategy, strategist, gov, vault)
+    new_strategy = deployStrategy(Strategy, strategist, gov, vault, stratConfig)
     # migrate to a new strategy
     vault.migrateStrategy(strategy, new_strategy, {"from": gov})
 
@@ -89,6 +91,7 @@ def test_new_strategy_after_migration(
     gov,
     user,
     RELATIVE_APPROX,
+    stratConfig,
 ):
     # Deposit to the vault and harvest
     token.approve(vault.address, amount, {"from": user})
@@ -100,7 +103,7 @@ def test_new_strategy_after_migration(
     strategyStaked =  strategy.balanceOfStakeBptInMasterChef()
 
     # deploy new strategy
-    new_strategy = deployStrategy(Strategy, strategist, gov, vault)
+    new_strategy = deployStrategy(Strategy, strategist, gov, vault, stratConfig)
     new_strategy.setKeeper(gov)
 
     assert (strategy.address != new_strategy.address)
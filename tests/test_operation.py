@@ -1,6 +1,7 @@
 import brownie
 import pytest
 
+import localProtocols
 import util
 
 # Passing but dangerous maxLoss
@@ -122,6 +123,81 @@ def test_deposit_all(chain, token, vault, strategy, user, strategist, amount, RE
     assert pytest.approx(strategy.estimatedTotalAssets(), rel=RELATIVE_APPROX) == half - slippageIn
 
 
+def test_join_sized_to_slippage(chain, token, vault, strategy, user, strategist, gov, stratConfig, interface, amount):
+    # No deposit cap, the join is sized from the pool depth and maxSlippageIn
+    masterChef = interface.IQiMasterChef(stratConfig["deployArgs"][3])
+    depositFee = masterChef.poolInfo(stratConfig["deployArgs"][8])[4]
+    strategy.setParams(strategy.maxSlippageIn(), strategy.maxSlippageOut(), 2 ** 256 - 1, strategy.minDepositPeriod(), {"from": gov})
+    deposit = amount // 2
+    token.approve(vault.address, deposit, {"from": user})
+    vault.deposit(deposit, {"from": user})
+    chain.sleep(1)
+    strategy.harvest({"from": strategist})
+
+    deployed = deposit - strategy.balanceOfWant()
+    assert deployed > 0
+    # The masterChef deposit fee is charged on top of maxSlippageIn
+    assert strategy.balanceOfPooled() >= deployed * (10_000 - strategy.maxSlippageIn() - depositFee) / 10_000
+
+    # Tighter than any join: tend deploys less or nothing instead of reverting with 'Slipped in!'
+    strategy.setParams(0, strategy.maxSlippageOut(), 2 ** 256 - 1, strategy.minDepositPeriod(), {"from": gov})
+    token.transfer(strategy, amount - deposit, {"from": user})
+    chain.sleep(strategy.minDepositPeriod() + 1)
+    chain.mine(1)
+    want = strategy.balanceOfWant()
+    tx = strategy.tend({"from": gov})
+    assert tx.status == 1
+    assert strategy.balanceOfWant() <= want
+    # Nothing could join, tend waits minDepositPeriod before trying again
+    assert strategy.balanceOfWant() == want
+    assert not strategy.tendTrigger(0)
+
+def test_join_not_dust_under_deposit_fee(chain, token, vault, strategy, user, strategist, gov, stratConfig, interface, amount):
+    masterChef = interface.IQiMasterChef(stratConfig["deployArgs"][3])
+    depositFee = masterChef.poolInfo(stratConfig["deployArgs"][8])[4]
+    assert depositFee > 0
+    # A budget under the deposit fee, still over the price slippage of the join
+    strategy.setParams(depositFee // 2, strategy.maxSlippageOut(), 2 ** 256 - 1, strategy.minDepositPeriod(), {"from": gov})
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    chain.sleep(1)
+    tx = strategy.harvest({"from": strategist})
+
+    joined = tx.events["Joined"]
+    assert joined["wantIn"] == amount
+    assert joined["slipped"] <= amount * strategy.maxSlippageIn() // 10_000
+    assert strategy.balanceOfWant() == 0
+
+def test_main_deposit_pays_the_masterchef_fee(chain, token, vault, strategy, user, strategist, stratConfig, interface, amount):
+    # The join path deposits into the main pid, which charges the deposit fee like on Fantom
+    masterChef = interface.IQiMasterChef(stratConfig["deployArgs"][3])
+    depositFee = masterChef.poolInfo(stratConfig["deployArgs"][8])[4]
+    assert depositFee == 50
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    chain.sleep(1)
+    tx = strategy.harvest({"from": strategist})
+
+    bptOut = tx.events["Joined"]["bptOut"]
+    assert strategy.balanceOfBpt() == 0
+    assert strategy.balanceOfBptInMasterChef() == bptOut - bptOut * depositFee // 10_000
+
+def test_join_deeper_than_the_pool(chain, protocols, token, strategy, gov, stratConfig, interface):
+    if not protocols:
+        pytest.skip("mints more want than the pool holds")
+    strategy.setParams(strategy.maxSlippageIn(), strategy.maxSlippageOut(), 2 ** 256 - 1, strategy.minDepositPeriod(), {"from": gov})
+    poolId = interface.IBalancerPool(strategy.bpt()).getPoolId()
+    tokens, balances, _ = interface.IBalancerVault(strategy.balancerVault()).getPoolTokens(poolId)
+    poolWant = balances[list(tokens).index(token)]
+
+    # Twice the pool want balance is clamped before it is quoted, the join is sized instead of reverting
+    token.mint(strategy, poolWant * 2, {"from": gov})
+    chain.sleep(strategy.minDepositPeriod() + 1)
+    chain.mine(1)
+    strategy.tend({"from": gov})
+    joined = poolWant * 2 - strategy.balanceOfWant()
+    assert 0 < joined <= poolWant * 3 // 10
+
 def test_change_debt( chain, gov, token, vault, strategy, user, strategist, amount, RELATIVE_APPROX):
     # Deposit to the vault and harvest
     token.approve(vault.address, amount, {"from": user})
@@ -243,8 +319,13 @@ def test_sweep(gov, vault, strategy, token, user, userWithWeth, amount, weth):
 
 # TODO: check the tend trigger function bcs it is not working
 def test_triggers(
-        chain, gov, vault, strategy, token, amount, user,strategist, qiDaoToken, qiToken_whale
+        chain, gov, vault, strategy, token, amount, user,strategist, qiDaoToken, qiToken_whale, stratConfig, interface
 ):
+    # The route pools have two tokens, ethToWant quotes them with the TWO_TOKEN onSwap like on the fork
+    balancerVault = interface.IBalancerVault(stratConfig["deployArgs"][1])
+    for poolId in stratConfig["whitelistReward"]["steps"][0]:
+        assert balancerVault.getPool(poolId)[1] == 2 # TWO_TOKEN
+
     # Deposit to the vault and harvest
     token.approve(vault.address, amount, {"from": user})
     vault.deposit(amount, {"from": user})
@@ -252,10 +333,13 @@ def test_triggers(
     chain.sleep(1)
     strategy.harvest({"from": strategist})
     
-    assert strategy.harvestTrigger(0) == True # The slippage will make the harvestTrigger return true
+    # The join slippage is not a loss and the few pending rewards do not pay for the call
+    callCost = 1_000_000 * 1000 * 10 ** 9 # 1M gas at 1000 gwei
+    assert strategy.ethToWant(callCost) > 0
+    assert strategy.harvestTrigger(callCost) == False
     time = 86400 * 15 # 1 week of running the strategy
     util.airdrop_rewards(amount, time, strategy, qiDaoToken, qiToken_whale)
-    assert strategy.harvestTrigger(0) == True
+    assert strategy.harvestTrigger(callCost) == True
 
     assert strategy.tendTrigger(0) == False
    
@@ -264,3 +348,189 @@ def test_triggers(
    
     assert strategy.tendTrigger(0) == False # there is not tend function override
 
+def test_pending_rewards(
+        chain, vault, strategy, token, amount, user, strategist, gov, stratConfig, interface
+):
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    chain.sleep(1)
+    strategy.harvest({"from": strategist})
+    chain.mine(10)
+
+    masterChef = interface.IQiMasterChef(stratConfig["deployArgs"][3])
+    pids = [stratConfig["deployArgs"][8], stratConfig["stakeInfo"]["masterChefStakePoolId"]]
+    pending = sum(masterChef.pending(pid, strategy) for pid in pids)
+    assert pending > 0
+    assert strategy.pendingRewards() == pending
+    assert strategy.estimatedRewardsInWant() > 0
+
+def test_multiple_rewards(
+        chain, vault, strategy, token, amount, user, strategist, gov, stratConfig, weth, userWithWeth, qiDaoToken, qiToken_whale
+):
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    chain.sleep(1)
+    strategy.harvest({"from": strategist})
+
+    # wFTM as a second reward, sold on the last hop of the QI route
+    poolIds, assets = stratConfig["whitelistReward"]["steps"]
+    strategy.whitelistReward(weth, ([poolIds[-1]], [weth, token]), {"from": gov})
+    assert strategy.getRewardTokens() == [qiDaoToken, weth]
+    assert strategy.rewardToken() == qiDaoToken
+
+    weth.transfer(strategy, 10 ** 18, {"from": userWithWeth})
+    util.airdrop_rewards(amount, 86400 * 7, strategy, qiDaoToken, qiToken_whale)
+    chain.sleep(strategy.minDepositPeriod() + 1)
+    chain.mine(1)
+    tx = strategy.harvest({"from": strategist})
+
+    # Both rewards sold in a single batchSwap
+    assert weth.balanceOf(strategy) == 0
+    assert qiDaoToken.balanceOf(strategy) == 0
+    assert len([call for call in tx.subcalls if call.get("function", "").startswith("batchSwap")]) == 1
+    # One event per reward token, their want adds up to the batch
+    sold = {event["token"]: event for event in tx.events["RewardsSold"]}
+    assert set(sold) == {qiDaoToken.address, weth.address}
+    assert sold[weth.address]["rewards"] == 10 ** 18
+    assert all(event["wantOut"] > 0 for event in sold.values())
+
+    # Below its minimum sale a reward waits for the next harvest
+    strategy.setMinRewardSale(weth, 10 ** 18, {"from": gov})
+    weth.transfer(strategy, 10 ** 17, {"from": userWithWeth})
+    chain.sleep(strategy.minDepositPeriod() + 1)
+    strategy.harvest({"from": strategist})
+    assert weth.balanceOf(strategy) == 10 ** 17
+
+    strategy.removeReward(weth, {"from": gov})
+    assert strategy.getRewardTokens() == [qiDaoToken]
+
+def test_want_to_lp_amount_exact(chain, token, vault, strategy, user, strategist, amount):
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    chain.sleep(1)
+    strategy.harvest({"from": strategist})
+
+    # liquidatePosition pulls the quoted bpt out of masterChef, the exit burns all but the tolerance
+    toExit = amount // 10
+    quoted = strategy.wantToLPAmount(toExit)
+    totalBpt = strategy.totalBalanceOfBpt()
+    vault.withdraw(vault.balanceOf(user) // 10, user, 10_000, {"from": user})
+    burned = totalBpt - strategy.totalBalanceOfBpt()
+    assert burned <= quoted
+    assert pytest.approx(burned, rel=1e-3) == quoted
+
+def test_harvest_events(chain, token, vault, strategy, user, strategist, amount, qiDaoToken, qiToken_whale):
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    chain.sleep(1)
+    deposit_tx = strategy.harvest({"from": strategist})
+    joined = deposit_tx.events["Joined"]
+    assert joined["wantIn"] > 0 and joined["bptOut"] > 0
+    assert joined["slipped"] <= joined["wantIn"] * strategy.maxSlippageIn() // 10_000
+
+    util.airdrop_rewards(amount, 86400 * 7, strategy, qiDaoToken, qiToken_whale)
+    chain.sleep(strategy.minDepositPeriod() + 1)
+    chain.mine(1)
+    tx = strategy.harvest({"from": strategist})
+
+    # The harvest profit is attributed from the events alone
+    sold = tx.events["RewardsSold"]
+    assert sold["token"] == qiDaoToken
+    assert sold["rewards"] > 0 and sold["wantOut"] > 0
+    fees = sum(event["wantOut"] for event in tx.events["TradingFeesCollected"]) if "TradingFeesCollected" in tx.events else 0
+    if fees:
+        # The want the exit paid, not the amount asked for
+        assert fees == tx.events["Exited"]["wantOut"]
+    assert tx.events["Harvested"]["profit"] == sold["wantOut"] + fees
+
+def test_large_reward_sales_are_split(
+    chain, token, vault, strategy, user, strategist, gov, amount, stratConfig, qiDaoToken, qiToken_whale, interface
+):
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    chain.sleep(1)
+    strategy.harvest({"from": strategist})
+
+    # A twentieth of the QI of the first pool of the route, several times maxRewardImpact in one swap
+    poolIds, _ = stratConfig["whitelistReward"]["steps"]
+    tokens, balances, _ = interface.IBalancerVault(stratConfig["deployArgs"][1]).getPoolTokens(poolIds[0])
+    rewards = balances[list(tokens).index(qiDaoToken)] // 20
+    qiDaoToken.transfer(strategy, rewards, {"from": qiToken_whale})
+    chain.sleep(strategy.minDepositPeriod() + 1)
+    chain.mine(1)
+    tx = strategy.harvest({"from": strategist})
+    sold = tx.events["RewardsSold"]["rewards"]
+    assert 0 < sold < rewards
+    assert strategy.balanceOfReward() > 0
+
+    # Without a cap the rest goes in one sale
+    strategy.setMaxRewardImpact(0, {"from": gov})
+    chain.sleep(strategy.minDepositPeriod() + 1)
+    strategy.harvest({"from": strategist})
+    assert strategy.balanceOfReward() == 0
+
+def test_reward_sale_pays_for_its_gas(strategy, strategist, qiDaoToken, qiToken_whale):
+    # Worth far less than the gas of the swap steps at 10000 gwei
+    qiDaoToken.transfer(strategy, 10 ** 16, {"from": qiToken_whale})
+    strategy.harvest({"from": strategist, "gas_price": 10_000 * 10 ** 9})
+    assert strategy.balanceOfReward() == 10 ** 16
+
+    strategy.harvest({"from": strategist})
+    assert strategy.balanceOfReward() == 0
+
+def test_shipped_route_quotes(protocols, strategy, qiDaoToken, qiToken_whale):
+    if protocols:
+        pytest.skip("quotes the shipped route on the fork pools")
+    # Every hop is quoted by the live pools, a pool that can not quote reverts instead of reading as 0
+    qiDaoToken.transfer(strategy, 100 * 10 ** 18, {"from": qiToken_whale})
+    assert strategy.estimatedRewardsInWant() > 0
+    assert strategy.ethToWant(10 ** 18) > 0
+
+def test_exit_swap_steps(strategy, gov, token, interface):
+    poolId = interface.IBalancerPool(strategy.bpt()).getPoolId()
+    tokens, _, _ = interface.IBalancerVault(strategy.balancerVault()).getPoolTokens(poolId)
+    other = [t for t in tokens if t != token.address][0]
+
+    with brownie.reverts("!token"):
+        strategy.setExitSwapSteps(token, ([poolId], [token, other]), {"from": gov})
+    with brownie.reverts("!steps"):
+        strategy.setExitSwapSteps(other, ([poolId], [token, other]), {"from": gov})
+    with brownie.reverts("!steps"):
+        strategy.setExitSwapSteps(other, ([poolId], [other]), {"from": gov})
+
+    strategy.setExitSwapSteps(other, ([poolId], [other, token]), {"from": gov})
+    assert strategy.getExitSwapSteps(other) == ([poolId], [other, token.address])
+    strategy.setExitSwapSteps(other, ([], []), {"from": gov})
+    assert strategy.getExitSwapSteps(other) == ([], [])
+
+def test_exit_routed_through_deeper_pool(accounts, chain, protocols, token, vault, strategy, user, strategist, gov, amount):
+    if not protocols:
+        pytest.skip("needs a deeper USDC/MAI pool than the fork has")
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    chain.sleep(1)
+    strategy.harvest({"from": strategist})
+
+    # Ten times deeper than MAI Concerto with a tenth of its fee, the proportional exit
+    # swapping MAI through it beats the single sided exit
+    mai = protocols["mai"]
+    deepPool = localProtocols.deployPool(
+        protocols["balancerVault"], "Deep MAI", "BPT-DMAI", [token, mai], [10 ** 18 // 2, 10 ** 18 // 2], 10 ** 14,
+        [100_000_000 * 10 ** 6, 100_000_000 * 10 ** 18], accounts[0]
+    )
+    strategy.setExitSwapSteps(mai, ([deepPool.getPoolId()], [mai, token]), {"from": gov})
+
+    # wantToLPAmount quotes the single sided exit of what liquidatePosition has to exit
+    shares = vault.balanceOf(user) // 2
+    expected = shares * vault.pricePerShare() // 10 ** token.decimals()
+    toExit = expected - token.balanceOf(vault) - strategy.balanceOfWant()
+    quoted = strategy.wantToLPAmount(toExit)
+    totalBpt = strategy.totalBalanceOfBpt()
+    before = token.balanceOf(user)
+    vault.withdraw(shares, user, 10_000, {"from": user})
+
+    assert token.balanceOf(user) - before >= expected * (10_000 - strategy.maxSlippageOut()) // 10_000
+    # About 15 bips less bpt than the single sided exit for this size
+    burned = totalBpt - strategy.totalBalanceOfBpt()
+    assert burned * 10_000 <= quoted * (10_000 - 5)
+    assert mai.balanceOf(strategy) == 0
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+import paramSweep
+from strategySimulator import WeightedPool
+
+
+@pytest.mark.parametrize("amountIn", [10_000, 250_000, 1_000_000])
+def test_join_slippage_matches_simulator(amountIn):
+    # balanceOfPooled valuation of a single sided join, same math as strategySimulator
+    pool = WeightedPool(
+        ["want", "pair"], [10_000_000, 12_000_000], [0.5, 0.5], 0.001, 20_000_000
+    )
+    bptOut = pool.joinExactTokensIn([amountIn, 0])
+    share = bptOut / pool.totalSupply
+    pooled = share * pool.balances[0] + pool.outGivenIn(1, 0, share * pool.balances[1])
+
+    slippage = paramSweep.joinSlippage(
+        np.array(amountIn, dtype=float), 10_000_000, 12_000_000, 0.5, 0.001
+    )
+    assert (
+        pytest.approx(float(slippage), abs=1e-12)
+        == max(amountIn - pooled, 0) / amountIn
+    )
+
+
+def test_exit_slippage_matches_simulator():
+    pool = WeightedPool(
+        ["want", "pair"], [10_000_000, 12_000_000], [0.5, 0.5], 0.001, 20_000_000
+    )
+    share = 0.05
+    pooled = share * pool.balances[0] + pool.outGivenIn(1, 0, share * pool.balances[1])
+    amountOut = pool.tokenOutGivenExactBptIn(0, share * pool.totalSupply)
+
+    slippage = paramSweep.exitSlippage(
+        np.array(share), 10_000_000, 12_000_000, 0.5, 0.001
+    )
+    assert pytest.approx(float(slippage), rel=1e-9) == (pooled - amountOut) / pooled
+
+
+def test_sweep_front_is_not_dominated():
+    points, result, front = paramSweep.sweep()
+    assert len(result["netApr"]) >= 100_000
+    assert len(front) > 0
+    assert result["feasible"][front].all()
+
+    netApr = result["netApr"][result["feasible"]]
+    worstSlippage = result["worstSlippage"][result["feasible"]]
+    for i in front:
+        dominated = (netApr > result["netApr"][i]) & (
+            worstSlippage <= result["worstSlippage"][i]
+        )
+        assert not dominated.any()
@@ -0,0 +1,135 @@
+from deployStrategy import deployFactory
+from preflight import check, deploymentPlan, simulate
+
+
+def withChanges(config, deployArgs=None, whitelistReward=None, stakeInfo=None):
+    changed = dict(config)
+    if deployArgs:
+        changed["deployArgs"] = [
+            deployArgs.get(i, arg) for i, arg in enumerate(config["deployArgs"])
+        ]
+    if whitelistReward:
+        changed["whitelistReward"] = {**config["whitelistReward"], **whitelistReward}
+    if stakeInfo:
+        changed["stakeInfo"] = {**config["stakeInfo"], **stakeInfo}
+    return changed
+
+
+def assertReported(problems, *fragments):
+    for fragment in fragments:
+        assert any(fragment in problem for problem in problems), (fragment, problems)
+
+
+def test_config_passes(stratConfig):
+    assert check(stratConfig) == []
+
+
+def test_bad_config_is_reported(stratConfig):
+    deployArgs = stratConfig["deployArgs"]
+    poolIds, assets = stratConfig["whitelistReward"]["steps"]
+    stakeInfo = stratConfig["stakeInfo"]
+
+    assertReported(
+        check(withChanges(stratConfig, deployArgs={3: "0x1234"})),
+        "masterChef: 0x1234 is not an address",
+    )
+    assertReported(
+        check(withChanges(stratConfig, deployArgs={4: 10_001})), "maxSlippageIn"
+    )
+    assertReported(
+        check(withChanges(stratConfig, deployArgs={8: 99})),
+        "the masterChef has no pool 99",
+    )
+    assertReported(
+        check(
+            withChanges(stratConfig, deployArgs={8: stakeInfo["masterChefStakePoolId"]})
+        ),
+        f"masterChef pool {stakeInfo['masterChefStakePoolId']} stakes",
+    )
+    # The stake pool is a Balancer pool without the want
+    assertReported(
+        check(withChanges(stratConfig, deployArgs={2: stakeInfo["stakePool"]})),
+        "is not in the pool",
+    )
+
+    # Hops that do not chain, a route that does not end in the want
+    assertReported(
+        check(
+            withChanges(stratConfig, whitelistReward={"steps": (poolIds[::-1], assets)})
+        ),
+        "route hop 0",
+        "route hop 1",
+    )
+    assertReported(
+        check(
+            withChanges(
+                stratConfig, whitelistReward={"steps": (poolIds[:1], assets[:2])}
+            )
+        ),
+        "not the want",
+    )
+    assertReported(
+        check(
+            withChanges(stratConfig, whitelistReward={"steps": (poolIds, assets[:2])})
+        ),
+        "route: 2 pool ids need 3 assets",
+    )
+
+    assertReported(
+        check(
+            withChanges(
+                stratConfig,
+                stakeInfo={
+                    "stakeTokenIndex": stakeInfo["stakeWantIndex"],
+                    "stakeWantIndex": stakeInfo["stakeTokenIndex"],
+                },
+            )
+        ),
+        "stakeTokenIndex",
+    )
+    assertReported(
+        check(withChanges(stratConfig, stakeInfo={"stakeTokenIndex": 2})),
+        "below the 2 stake assets",
+    )
+    assertReported(
+        check(
+            withChanges(stratConfig, stakeInfo={"assets": stakeInfo["assets"][::-1]})
+        ),
+        "are not the stake pool tokens",
+    )
+    assert check(withChanges(stratConfig, deployArgs={0: deployArgs[1]})) == [
+        f"vault: {deployArgs[1]} has no token()"
+    ]
+
+
+def test_simulation_deploys_the_plan(vault, stratConfig, gov, strategist):
+    plan = deploymentPlan(stratConfig)
+    results, deployed = simulate(plan, vault, strategist, gov)
+
+    assert [step for step, _, _ in results] == plan
+    assert all(gasUsed > 0 and revert is None for _, gasUsed, revert in results)
+    strategy = deployed["strategy"]
+    assert strategy.strategist() == strategist
+    assert strategy.healthCheck() == deployed["healthCheck"]
+    assert strategy.stakeBpt() == stratConfig["stakeInfo"]["stakePool"]
+    assert vault.strategies(strategy)["debtRatio"] == 10_000
+
+
+def test_simulation_stops_at_revert(vault, strategy, stratConfig, gov, strategist):
+    # The fixture strategy already takes the whole debt ratio
+    results, _ = simulate(deploymentPlan(stratConfig), vault, strategist, gov)
+    step, gasUsed, revert = results[-1]
+    assert step.label == "vault.addStrategy"
+    assert gasUsed is None and revert is not None
+
+
+def test_simulation_of_a_clone(vault, strategy, stratConfig, gov):
+    factory = deployFactory(strategy, gov)
+    vault.updateStrategyDebtRatio(strategy, 0, {"from": gov})
+    plan = deploymentPlan(stratConfig, factory=True)
+    results, deployed = simulate(plan, vault, gov, gov, factory)
+
+    assert [step.label for step, _, _ in results] == [step.label for step in plan]
+    assert all(revert is None for _, _, revert in results)
+    assert deployed["strategy"].healthCheck() == deployed["healthCheck"]
+    assert vault.strategies(deployed["strategy"])["debtRatio"] == 10_000
@@ -0,0 +1,40 @@
+import util
+from strategyReader import StrategyReader
+
+
+def test_snapshot_matches_views(
+    chain, token, vault, strategy, user, strategist, amount, qiDaoToken, qiToken_whale
+):
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    chain.sleep(1)
+    strategy.harvest({"from": strategist})
+    util.airdrop_rewards(amount, 86400, strategy, qiDaoToken, qiToken_whale)
+
+    reader = StrategyReader(strategy)
+    state = reader.snapshot()
+
+    assert state.block == chain.height
+    assert state.name == strategy.name()
+    assert state.want == token.address
+    assert state.wantDecimals == token.decimals()
+    assert state.vault == vault.address
+    assert state.vaultName == vault.name()
+    assert state.balanceOfWant == strategy.balanceOfWant()
+    assert state.balanceOfBptInMasterChef == strategy.balanceOfBptInMasterChef()
+    assert (
+        state.balanceOfStakeBptInMasterChef == strategy.balanceOfStakeBptInMasterChef()
+    )
+    assert state.balanceOfReward == strategy.balanceOfReward()
+    assert state.estimatedTotalAssets == strategy.estimatedTotalAssets()
+    assert state.maxSingleDeposit == strategy.maxSingleDeposit()
+    assert state.vaultParams.totalDebt == vault.strategies(strategy)["totalDebt"]
+    assert state.swapPoolIds == tuple(
+        str(poolId) for poolId in strategy.getSwapSteps()[0]
+    )
+
+    # Snapshots can be read at a past block
+    before = state.block
+    chain.sleep(strategy.minDepositPeriod() + 1)
+    strategy.harvest({"from": strategist})
+    assert reader.snapshot(before).estimatedTotalAssets == state.estimatedTotalAssets
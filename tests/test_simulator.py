@@ -0,0 +1,313 @@
+import copy
+import time
+
+import pytest
+from brownie import interface
+
+import strategyConfig
+import util
+from strategySimulator import (
+    Market,
+    MasterChef,
+    StrategySimulator,
+    VaultSimulator,
+    WeightedPool,
+    defaultMarket,
+    exitTranches,
+    runSchedule,
+)
+
+# The off-chain simulator should track the on-chain strategy for the reference scenarios
+SIMULATOR_APPROX = 1e-4
+
+
+def marketFromChain(chain, stratConfig, strategy):
+    deployArgs = stratConfig["deployArgs"]
+    balancerVault = interface.IBalancerVault(deployArgs[1])
+    qiMasterChef = interface.IQiMasterChef(deployArgs[3])
+
+    pids = [deployArgs[8]]
+    if stratConfig["stakeInfo"]:
+        pids.append(stratConfig["stakeInfo"]["masterChefStakePoolId"])
+    allocPoints = {}
+    lpSupply = {}
+    depositFeeBP = {}
+    for pid in pids:
+        poolInfo = qiMasterChef.poolInfo(pid)
+        allocPoints[pid] = poolInfo[1]
+        depositFeeBP[pid] = poolInfo[4]
+        lpSupply[pid] = (
+            interface.IERC20(poolInfo[0]).balanceOf(qiMasterChef)
+            - qiMasterChef.userInfo(pid, strategy)[0]
+        )
+    masterChef = MasterChef(
+        qiMasterChef.rewardPerBlock(),
+        qiMasterChef.totalAllocPoint(),
+        allocPoints,
+        lpSupply,
+        depositFeeBP,
+    )
+    market = Market(masterChef, timestamp=chain.time(), block=chain.height)
+
+    def addPool(address, *keys):
+        pool = interface.IBalancerPool(address)
+        tokens, balances, _ = balancerVault.getPoolTokens(pool.getPoolId())
+        weights = [weight / 1e18 for weight in pool.getNormalizedWeights()]
+        market.addPool(
+            WeightedPool(
+                tokens,
+                balances,
+                weights,
+                pool.getSwapFeePercentage() / 1e18,
+                pool.totalSupply(),
+            ),
+            address,
+            *keys,
+        )
+
+    addPool(deployArgs[2])
+    if stratConfig["stakeInfo"]:
+        addPool(stratConfig["stakeInfo"]["stakePool"])
+    for poolId in stratConfig["whitelistReward"]["steps"][0]:
+        addPool(balancerVault.getPool(poolId)[0], poolId)
+    return market
+
+
+def syncClock(chain, market):
+    # The next transaction is mined in the next block
+    market.timestamp = chain.time()
+    market.block = chain.height + 1
+
+
+def test_simulator_deposit_and_profit(
+    chain,
+    token,
+    vault,
+    strategy,
+    stratConfig,
+    user,
+    strategist,
+    amount,
+    qiDaoToken,
+    qiToken_whale,
+):
+    market = marketFromChain(chain, stratConfig, strategy)
+    simulator = StrategySimulator(
+        stratConfig, market, want=token.address, wantDecimals=token.decimals()
+    )
+    simVault = VaultSimulator(simulator)
+
+    # Deposit to the vault
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    simVault.deposit(amount)
+
+    # Harvest 1: Send funds through the strategy
+    chain.sleep(1)
+    syncClock(chain, market)
+    assert simVault.harvest()
+    strategy.harvest({"from": strategist})
+    assert (
+        pytest.approx(simulator.estimatedTotalAssets(), rel=SIMULATOR_APPROX)
+        == strategy.estimatedTotalAssets()
+    )
+    assert (
+        pytest.approx(simulator.balanceOfBptInMasterChef(), rel=SIMULATOR_APPROX)
+        == strategy.balanceOfBptInMasterChef()
+    )
+
+    # Harvest 2: Realize profit
+    rewardsBefore = qiDaoToken.balanceOf(strategy)
+    util.airdrop_rewards(amount, 86400 * 7, strategy, qiDaoToken, qiToken_whale)
+    simulator.rewards += qiDaoToken.balanceOf(strategy) - rewardsBefore
+    chain.sleep(strategy.minDepositPeriod() + 1)
+    chain.mine(1)
+    syncClock(chain, market)
+    assert simVault.harvest()
+    strategy.harvest({"from": strategist})
+
+    assert (
+        pytest.approx(simVault.totalAssets(), rel=SIMULATOR_APPROX)
+        == vault.totalAssets()
+    )
+    assert (
+        pytest.approx(simulator.estimatedTotalAssets(), rel=SIMULATOR_APPROX)
+        == strategy.estimatedTotalAssets()
+    )
+    assert (
+        pytest.approx(simulator.balanceOfStakeBptInMasterChef(), rel=SIMULATOR_APPROX)
+        == strategy.balanceOfStakeBptInMasterChef()
+    )
+
+
+def test_simulator_liquidation(
+    chain, token, vault, strategy, stratConfig, user, strategist, amount
+):
+    market = marketFromChain(chain, stratConfig, strategy)
+    simulator = StrategySimulator(
+        stratConfig, market, want=token.address, wantDecimals=token.decimals()
+    )
+    simVault = VaultSimulator(simulator)
+
+    token.approve(vault.address, amount, {"from": user})
+    vault.deposit(amount, {"from": user})
+    simVault.deposit(amount)
+    chain.sleep(1)
+    syncClock(chain, market)
+    simVault.harvest()
+    strategy.harvest({"from": strategist})
+
+    # Partial liquidation through a debt ratio change
+    vault.updateStrategyDebtRatio(strategy, 5_000, {"from": vault.governance()})
+    simVault.debtRatio = 5_000
+    chain.sleep(1)
+    syncClock(chain, market)
+    assert simVault.harvest()
+    strategy.harvest({"from": strategist})
+
+    assert (
+        pytest.approx(simVault.totalDebt, rel=SIMULATOR_APPROX)
+        == vault.strategies(strategy)["totalDebt"]
+    )
+    assert (
+        pytest.approx(simulator.estimatedTotalAssets(), rel=SIMULATOR_APPROX)
+        == strategy.estimatedTotalAssets()
+    )
+
+
+def test_simulator_splits_large_reward_sales():
+    config = strategyConfig.getStrategyConfig("MAI_Concerto_staking", None)
+    simulator = StrategySimulator(config, defaultMarket(config))
+    rewardPool = simulator.market.pool(simulator.swapPoolIds[0])
+    rewards = rewardPool.balances[rewardPool.index(simulator.rewardToken)] * 0.2
+    simulator.rewards = rewards
+
+    # The first sale takes about maxRewardImpact of price impact, the rest waits
+    sale = simulator.rewardSale()
+    impact = 1 - simulator.quoteRewards(sale) / (
+        simulator.quoteRewards(sale / 1_000) * 1_000
+    )
+    assert pytest.approx(impact, rel=0.05) == simulator.maxRewardImpact / 10_000
+    simulator.sellRewards()
+    assert pytest.approx(simulator.rewards) == rewards - sale
+    simulator.sellRewards()
+    assert simulator.rewards < rewards - sale
+
+    # Without a cap the whole balance goes at once
+    simulator.maxRewardImpact = 0
+    simulator.sellRewards()
+    assert simulator.rewards == 0
+
+
+def test_simulator_routes_large_exits():
+    config = strategyConfig.getStrategyConfig("MAI_Concerto_staking", None)
+    simulator = StrategySimulator(config, defaultMarket(config))
+    simVault = VaultSimulator(simulator)
+    simVault.deposit(2_000_000 * 10 ** 6)
+    for _ in range(20):
+        simulator.market.sleep(simulator.minDepositPeriod + 1)
+        simVault.harvest()
+    simulator.maxSlippageOut = 10_000
+
+    # A partial exit burns no more bpt than the single sided exit quote
+    partial = copy.deepcopy(simulator)
+    wantAmount = partial.estimatedTotalAssets() * 0.9
+    bptQuote = partial.wantToLPAmount(wantAmount)
+    bptsBefore = partial.totalBalanceOfBpt()
+    assert partial.liquidatePosition(wantAmount)[1] == 0
+    assert bptsBefore - partial.totalBalanceOfBpt() <= bptQuote
+
+    # A full exit gets at least the single sided exit of the same bpt
+    singleOut = simulator.pool.tokenOutGivenExactBptIn(
+        simulator.tokenIndex, simulator.totalBalanceOfBpt()
+    )
+    assert simulator.liquidateAllPositions() >= singleOut
+
+    # Exits are split in tranches of EXIT_TRANCHE of the pool, up to MAX_EXIT_TRANCHES
+    assert exitTranches(1, 1_000) == 1
+    assert exitTranches(250, 1_000) == 3
+    assert exitTranches(10_000, 1_000) == 8
+
+
+def test_simulator_leftover_bpt_pays_for_its_deposit_gas():
+    config = strategyConfig.getStrategyConfig("MAI_Concerto_staking", None)
+    simulator = StrategySimulator(config, defaultMarket(config))
+    simVault = VaultSimulator(simulator)
+    simVault.deposit(100_000 * 10 ** 6)
+    simulator.market.sleep(simulator.minDepositPeriod + 1)
+    simVault.harvest()
+    bptInMasterChef = simulator.balanceOfBptInMasterChef()
+
+    # A leftover worth less than 100 times the deposit gas stays loose, like Strategy._depositLeftoverBpt
+    simulator.bpt = bptInMasterChef / 1_000
+    leftoverValue = (
+        simulator.bpt * simulator.balanceOfPooled() / simulator.totalBalanceOfBpt()
+    )
+    simulator.gasPrice = leftoverValue / 100_000 / 50
+    simulator._depositLeftoverBpt()
+    assert simulator.bpt == bptInMasterChef / 1_000
+
+    # The deposit fee is paid now or with the next deposit, only the gas counts: 0.8% of gas goes in under the 50bp fee
+    depositFee = simulator.masterChef.depositFeeBP[simulator.masterChefPoolId] / 10_000
+    assert depositFee + 0.008 > 0.01
+    simulator.gasPrice = leftoverValue * 0.008 / 100_000
+    simulator._depositLeftoverBpt()
+    assert simulator.bpt == 0
+    assert pytest.approx(simulator.balanceOfBptInMasterChef()) == bptInMasterChef * (
+        1 + (1 - depositFee) / 1_000
+    )
+
+
+def test_simulator_join_sizing_is_clamped_to_the_pool():
+    config = strategyConfig.getStrategyConfig("MAI_Concerto_staking", None)
+    simulator = StrategySimulator(config, defaultMarket(config))
+    poolWant = simulator.pool.balances[simulator.tokenIndex]
+    simulator.maxSlippageIn = 10_000
+    assert simulator.maxJoinAmount(poolWant * 2) == poolWant * 0.3
+
+
+def test_simulator_rolls_back_reverted_transactions():
+    config = strategyConfig.getStrategyConfig("MAI_Concerto_staking", None)
+    simulator = StrategySimulator(config, defaultMarket(config))
+    market = simulator.market
+    simVault = VaultSimulator(simulator)
+    simVault.deposit(100_000 * 10 ** 6)
+    market.sleep(simulator.minDepositPeriod + 1)
+    simVault.harvest()
+
+    # Tighter than the join, adjustPosition reverts with 'Slipped in!' after the join and the deposit
+    simulator.wantBalance += 10_000 * 10 ** 6
+    balances = list(simulator.pool.balances)
+    masterChef = market.masterChef.snapshot()
+    bptInMasterChef = simulator.balanceOfBptInMasterChef()
+    simulator.maxJoinAmount = lambda amount: amount
+    simulator.maxSlippageIn = 0
+    market.sleep(simulator.minDepositPeriod + 1)
+    assert not simVault.tend()
+
+    assert simVault.reverts == 1
+    assert simulator.market is market
+    assert simulator.pool.balances == balances
+    assert market.masterChef.snapshot() == masterChef
+    assert simulator.balanceOfBptInMasterChef() == bptInMasterChef
+    assert simulator.wantBalance == 10_000 * 10 ** 6
+
+
+def test_simulator_throughput():
+    # Rolling back only the changed state keeps a 30 day schedule to a few milliseconds
+    config = strategyConfig.getStrategyConfig("MAI_Concerto_staking", None)
+    transactions = 0
+    start = time.perf_counter()
+    for _ in range(20):
+        simVault = VaultSimulator(StrategySimulator(config, defaultMarket(config)))
+        simVault.deposit(100_000 * 10 ** 6)
+        result = runSchedule(
+            simVault,
+            harvestPeriod=86400,
+            tendPeriod=3600,
+            duration=86400 * 30,
+            rewardsPerSecond=10 ** 12,
+        )
+        transactions += result["harvests"] + result["tends"]
+    elapsed = time.perf_counter() - start
+    assert transactions / elapsed > 1_000
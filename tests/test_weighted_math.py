@@ -0,0 +1,297 @@
+import random
+from decimal import Decimal, localcontext
+
+import numpy as np
+import pytest
+from brownie import Contract, interface
+
+import weightedMath
+from strategyReader import ERC20_ABI
+from weightedMath import ONE, WeightedPoolState
+
+try:
+    from eth_abi import encode
+except ImportError:
+    from eth_abi import encode_abi as encode
+
+# Quotes of the exact path checked against the Beethoven pools on a fork, the batch path against the exact one
+BATCH_RTOL = 1e-9
+BATCH_ATOL = 1e-15  # of the pool balance or supply, the resolution of the 18 decimals ratios on chain
+POOL_ABI = ERC20_ABI + [
+    {
+        "name": "getLastInvariant",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [],
+        "outputs": [{"name": "", "type": "uint256"}],
+    },
+    {
+        "name": "totalSupply",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [],
+        "outputs": [{"name": "", "type": "uint256"}],
+    },
+]
+FEES_ABI = [
+    {
+        "name": "getProtocolFeesCollector",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [],
+        "outputs": [{"name": "", "type": "address"}],
+    },
+    {
+        "name": "getSwapFeePercentage",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [],
+        "outputs": [{"name": "", "type": "uint256"}],
+    },
+]
+
+
+def usdcMai():
+    return WeightedPoolState(
+        ["usdc", "mai"],
+        [10_000_000 * 10 ** 6, 10_000_000 * 10 ** 18],
+        [ONE // 2, ONE // 2],
+        10 ** 15,
+        20_000_000 * 10 ** 18,
+        [6, 18],
+    )
+
+
+def qiMajor():
+    return WeightedPoolState(
+        ["wftm", "qi"],
+        [1_000_000 * 10 ** 18, 3_000_000 * 10 ** 18],
+        [4 * 10 ** 17, 6 * 10 ** 17],
+        3 * 10 ** 15,
+        4_000_000 * 10 ** 18,
+        [18, 18],
+        lastInvariant=1_900_000 * 10 ** 18,
+        protocolSwapFee=5 * 10 ** 17,
+    )
+
+
+def poolStateFromChain(balancerVault, address):
+    pool = interface.IBalancerPool(address)
+    reader = Contract.from_abi("WeightedPool", address, POOL_ABI, persist=False)
+    tokens, balances, _ = balancerVault.getPoolTokens(pool.getPoolId())
+    feesCollector = Contract.from_abi(
+        "Vault", balancerVault.address, FEES_ABI, persist=False
+    ).getProtocolFeesCollector()
+    return WeightedPoolState(
+        tokens,
+        balances,
+        pool.getNormalizedWeights(),
+        pool.getSwapFeePercentage(),
+        reader.totalSupply(),
+        [
+            Contract.from_abi("ERC20", token, ERC20_ABI, persist=False).decimals()
+            for token in tokens
+        ],
+        lastInvariant=reader.getLastInvariant(),
+        protocolSwapFee=Contract.from_abi(
+            "Fees", feesCollector, FEES_ABI, persist=False
+        ).getSwapFeePercentage(),
+    )
+
+
+def test_pow_matches_decimal():
+    rng = random.Random(1)
+    # A local context, the global one is shared with the other tests (and locked by vyper)
+    with localcontext() as ctx:
+        ctx.prec = 60
+        for _ in range(2_000):
+            x, y = rng.randint(10 ** 12, 10 ** 21), rng.randint(10 ** 15, 4 * 10 ** 18)
+            exact = (Decimal(x) / ONE) ** (Decimal(y) / ONE)
+            result = Decimal(weightedMath.logExpPow(x, y)) / ONE
+            assert abs(result - exact) <= exact * Decimal("1e-14") + Decimal("1e-18")
+
+    assert weightedMath.powDown(ONE, ONE // 2) == ONE - 10_001
+    assert weightedMath.powUp(ONE, ONE // 2) == ONE + 10_001
+
+
+def test_rounding_favours_the_pool():
+    pool = usdcMai()
+    for amount in [10 ** 6, 12_345 * 10 ** 6, 10 ** 12]:
+        # Joining then exiting the same tokens never pays back more bpt
+        bptOut = pool.joinExactTokensIn([amount, 0])
+        assert pool.exitBptInForExactTokensOut([amount, 0]) >= bptOut
+        assert pool.exitExactBptInForOneToken(bptOut, 0) <= amount
+
+        # A round trip through the pool loses at least the fees
+        back = pool.onSwapGivenIn(1, 0, pool.onSwapGivenIn(0, 1, amount))
+        assert back < amount
+        assert pool.onSwapGivenOut(0, 1, pool.onSwapGivenIn(0, 1, amount)) <= amount
+
+    with pytest.raises(weightedMath.BalancerError, match="MAX_IN_RATIO"):
+        pool.onSwapGivenIn(0, 1, pool.balances[0])
+
+
+def test_protocol_fees_paid_before_joins():
+    pool = qiMajor()
+    noFees = qiMajor()
+    noFees.protocolSwapFee = 0
+    # Paid in the heaviest token, qi, before the join
+    assert pool.joinExactTokensIn([0, 10 ** 21]) > noFees.joinExactTokensIn(
+        [0, 10 ** 21]
+    )
+    assert pool.joinExactTokensIn([10 ** 21, 0]) == noFees.joinExactTokensIn(
+        [10 ** 21, 0]
+    )
+
+
+def test_batch_swap_chains_steps():
+    pools = {"qiMajor": qiMajor(), "usdcMai": usdcMai()}
+    assets = ["wftm", "qi", "usdc", "mai"]
+    swaps = [
+        ("qiMajor", 1, 0, 10 ** 20),
+        ("qiMajor", 0, 1, 0),
+        ("usdcMai", 2, 3, 10 ** 9),
+    ]
+    deltas = weightedMath.queryBatchSwap(pools, swaps, assets)
+
+    qi = qiMajor()
+    wftmOut = qi.onSwapGivenIn(1, 0, 10 ** 20)
+    qi.balances[1] += 10 ** 20
+    qi.balances[0] -= wftmOut
+    qiOut = qi.onSwapGivenIn(0, 1, wftmOut)
+    assert deltas == [
+        0,
+        10 ** 20 - qiOut,
+        10 ** 9,
+        -usdcMai().onSwapGivenIn(0, 1, 10 ** 9),
+    ]
+    assert pools["qiMajor"].balances == qiMajor().balances
+
+    with pytest.raises(
+        weightedMath.BalancerError, match="MALCONSTRUCTED_MULTIHOP_SWAP"
+    ):
+        weightedMath.queryBatchSwap(
+            pools, [("qiMajor", 1, 0, 10 ** 20), ("usdcMai", 2, 3, 0)], assets
+        )
+
+
+@pytest.mark.parametrize(
+    "pool,indexIn,indexOut",
+    [
+        (usdcMai(), 0, 1),
+        (usdcMai(), 1, 0),
+        (qiMajor(), 1, 0),
+        (qiMajor(), 0, 1),
+    ],
+)
+def test_batch_matches_exact(pool, indexIn, indexOut):
+    # From dust to the MAX_IN_RATIO of the pool
+    amounts = [
+        int(amount)
+        for amount in np.unique(
+            np.logspace(0, np.log10(pool.balances[indexIn] * 0.29), 1_500).round()
+        )
+    ]
+    exact = [pool.onSwapGivenIn(indexIn, indexOut, amount) for amount in amounts]
+    batch = weightedMath.batchOutGivenIn(pool, indexIn, indexOut, amounts)
+    np.testing.assert_allclose(
+        batch,
+        np.array(exact, dtype=float),
+        rtol=BATCH_RTOL,
+        atol=pool.balances[indexOut] * BATCH_ATOL,
+    )
+
+    joins = [
+        pool.joinExactTokensIn([amount if i == indexIn else 0 for i in range(2)])
+        for amount in amounts
+    ]
+    batchJoins = weightedMath.batchJoinExactTokensIn(pool, indexIn, amounts)
+    np.testing.assert_allclose(
+        batchJoins,
+        np.array(joins, dtype=float),
+        rtol=BATCH_RTOL,
+        atol=pool.totalSupply * BATCH_ATOL,
+    )
+
+    bpts = [
+        int(bpt)
+        for bpt in np.unique(
+            np.logspace(3, np.log10(pool.totalSupply * 0.29), 1_500).round()
+        )
+    ]
+    exits = [pool.exitExactBptInForOneToken(bpt, indexOut) for bpt in bpts]
+    batchExits = weightedMath.batchTokenOutGivenExactBptIn(pool, indexOut, bpts)
+    np.testing.assert_allclose(
+        batchExits,
+        np.array(exits, dtype=float),
+        rtol=BATCH_RTOL,
+        atol=pool.balances[indexOut] * BATCH_ATOL,
+    )
+
+
+def test_quotes_match_chain(
+    chain, protocols, stratConfig, token, user, amount, qiDaoToken, qiToken_whale
+):
+    if protocols:
+        pytest.skip("the local pools use the simplified contracts/WeightedMath.sol")
+    deployArgs = stratConfig["deployArgs"]
+    balancerVault = interface.IBalancerVault(deployArgs[1])
+    pool = interface.IBalancerPool(deployArgs[2])
+    poolId = pool.getPoolId()
+    funds = (user, False, user, False)
+
+    # Single sided join with the want
+    state = poolStateFromChain(balancerVault, pool)
+    amountsIn = [
+        amount // 10 if token.address.lower() == asset else 0 for asset in state.tokens
+    ]
+    token.approve(balancerVault, amount, {"from": user})
+    balanceBefore = pool.balanceOf(user)
+    userData = encode(["uint256", "uint256[]", "uint256"], [1, amountsIn, 0])
+    balancerVault.joinPool(
+        poolId, user, user, (state.tokens, amountsIn, userData, False), {"from": user}
+    )
+    bptOut = pool.balanceOf(user) - balanceBefore
+    assert bptOut == state.joinExactTokensIn(amountsIn)
+
+    # Single sided exit of half of it
+    state = poolStateFromChain(balancerVault, pool)
+    index = state.index(token.address)
+    balanceBefore = token.balanceOf(user)
+    userData = encode(["uint256", "uint256", "uint256"], [0, bptOut // 2, index])
+    balancerVault.exitPool(
+        poolId,
+        user,
+        user,
+        (state.tokens, [0] * len(state.tokens), userData, False),
+        {"from": user},
+    )
+    assert token.balanceOf(user) - balanceBefore == state.exitExactBptInForOneToken(
+        bptOut // 2, index
+    )
+
+    # The reward route as sellRewards sends it
+    poolIds, routeAssets = stratConfig["whitelistReward"]["steps"]
+    states = {
+        poolId: poolStateFromChain(balancerVault, balancerVault.getPool(poolId)[0])
+        for poolId in poolIds
+    }
+    rewards = 1_000 * 10 ** 18
+    qiDaoToken.transfer(user, rewards, {"from": qiToken_whale})
+    qiDaoToken.approve(balancerVault, rewards, {"from": user})
+    swaps = [
+        (poolId, i, i + 1, rewards if i == 0 else 0) for i, poolId in enumerate(poolIds)
+    ]
+    deltas = weightedMath.queryBatchSwap(states, swaps, routeAssets)
+    balanceBefore = token.balanceOf(user)
+    limits = [rewards] + [0] * (len(routeAssets) - 1)
+    balancerVault.batchSwap(
+        0,
+        [(*swap, b"") for swap in swaps],
+        routeAssets,
+        funds,
+        limits,
+        chain.time() + 60,
+        {"from": user},
+    )
+    assert token.balanceOf(user) - balanceBefore == -deltas[-1]
@@ -1,16 +1,128 @@
+import json
+import os
+import warnings
+
 from brownie import Contract
 
+from strategyReader import StrategyReader
+
+
 def stateOfStrat(msg, strategy, token):
-    print(f'\n===={msg}====')
-    wantDec = 10 ** token.decimals()
-    print(f'Balance of {token.symbol()}: {strategy.balanceOfWant() / wantDec}')
-    print(f'Balance of Bpt: {strategy.balanceOfBpt() / wantDec}')
-    print(f'Estimated Total Assets: {strategy.estimatedTotalAssets() / wantDec}')
+    state = StrategyReader(strategy).snapshot()
+    print(f"\n===={msg}====")
+    print(f"Balance of {state.wantSymbol}: {state.toUnits(state.balanceOfWant)}")
+    print(f"Balance of Bpt: {state.toUnits(state.balanceOfBpt)}")
+    print(f"Estimated Total Assets: {state.toUnits(state.estimatedTotalAssets)}")
+
 
 # Beethoven uses blocks count to give rewards so the Chain.sleep() method of timetravel does not work
 # Chain.mine() is too slow so the best solution is to airdrop rewards
-def airdrop_rewards(amount , time, strategy, qiDaoToken, qiToken_whale):
-    APY =  0.2
+def airdrop_rewards(amount, time, strategy, qiDaoToken, qiToken_whale):
+    APY = 0.2
     timeRatio = time / (86400 * 365)
-    qiDaoToken.approve(strategy, 2 ** 256 - 1, {'from': qiToken_whale})
-    qiDaoToken.transfer(strategy, amount  * 1e12 * APY * timeRatio , {'from': qiToken_whale})
\ No newline at end of file
+    qiDaoToken.approve(strategy, 2 ** 256 - 1, {"from": qiToken_whale})
+    qiDaoToken.transfer(
+        strategy, amount * 1e12 * APY * timeRatio, {"from": qiToken_whale}
+    )
+
+
+# Internal functions reported in the gas breakdown
+GAS_BREAKDOWN = [
+    "_balanceOfPooled",
+    "sellRewards",
+    "consolidate",
+    "joinPool",
+    "exitPoolExactToken",
+    "exitPoolExactBpt",
+    "claimAllRewards",
+]
+
+
+def gasBreakdown(tx, functions=GAS_BREAKDOWN):
+    """
+    Approximate inclusive gas of the strategy's internal functions, summed over every call in the transaction.
+    Built from the debug trace, a function call lasts until the trace returns to a shallower frame.
+    """
+    trace = tx.trace
+    totals = dict.fromkeys(functions, 0)
+    for i, step in enumerate(trace):
+        previous = trace[i - 1] if i else None
+        if previous and (step["depth"], step["jumpDepth"]) == (
+            previous["depth"],
+            previous["jumpDepth"],
+        ):
+            continue
+        name = step["fn"].split(".")[-1]
+        if name not in totals or not step["fn"].startswith("Strategy."):
+            continue
+        frame = (step["depth"], step["jumpDepth"])
+        end = i + 1
+        while (
+            end < len(trace) and (trace[end]["depth"], trace[end]["jumpDepth"]) >= frame
+        ):
+            end += 1
+        totals[name] += sum(trace[j]["gasCost"] for j in range(i, end))
+    return totals
+
+
+class GasBaselineWarning(UserWarning):
+    pass
+
+
+class GasBenchmark:
+    """
+    Gas used per entry point, checked against the baseline file.
+    An entry point regressing by more than the baseline threshold fails the test that measured it.
+    An entry point missing from the baseline is only reported, with a warning, until one is recorded.
+    """
+
+    def __init__(self, baselinePath, reportPath, update=False):
+        self.baselinePath = baselinePath
+        self.reportPath = reportPath
+        self.update = update
+        with open(baselinePath) as f:
+            self.baseline = json.load(f)
+        self.results = {}
+        # Internal function gas, "<entry point> / <function>" as printed by scripts/gasReport.py
+        self.breakdowns = {}
+
+    def record(self, name, tx, breakdown=False):
+        """tx is a transaction, or the gas estimate of a call."""
+        gas = tx if isinstance(tx, int) else tx.gas_used
+        self.results[name] = gas
+        baseline = self.baseline["gas"].get(name)
+        print(
+            f"\n{name}: {gas}"
+            + (f" (baseline {baseline})" if baseline else " (no baseline)")
+        )
+        if breakdown:
+            for fn, fnGas in gasBreakdown(tx).items():
+                if fnGas:
+                    print(f"    {fn}: {fnGas}")
+                    self.breakdowns[f"{name} / {fn}"] = fnGas
+
+        if self.update:
+            return gas
+        if not baseline:
+            warnings.warn(
+                f"{name} has no baseline in {os.path.basename(self.baselinePath)}, record one with --update-gas-baseline",
+                GasBaselineWarning,
+            )
+            return gas
+        limit = baseline * (1 + self.baseline["threshold"])
+        assert (
+            gas <= limit
+        ), f'{name} regressed: {gas} gas, baseline {baseline} (+{self.baseline["threshold"]:.0%} = {limit:.0f})'
+        return gas
+
+    def finish(self):
+        os.makedirs(os.path.dirname(self.reportPath), exist_ok=True)
+        with open(self.reportPath, "w") as f:
+            json.dump(
+                dict(self.results, **self.breakdowns), f, indent=2, sort_keys=True
+            )
+        if self.update and self.results:
+            self.baseline["gas"].update(self.results)
+            with open(self.baselinePath, "w") as f:
+                json.dump(self.baseline, f, indent=2, sort_keys=True)
+                f.write("\n")